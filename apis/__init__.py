@@ -5,14 +5,22 @@ def init_api(app):
     api = Api(app)
     
     # Import API resources
-    from apis.speech_api import SpeechToTextResource, TextToSpeechResource
-    from apis.grammar_api import GrammarCheckResource
-    from apis.conversation_api import ConversationResource, ConversationHistoryResource
+    from apis.speech_api import (
+        AudioResource, SpeechToTextResource, SpeechToTextStreamResource, TextToSpeechResource
+    )
+    from apis.grammar_api import GrammarCheckResource, GrammarCheckBatchResource
+    from apis.conversation_api import (
+        ConversationResource, ConversationStreamResource, ConversationHistoryResource
+    )
 
     # Register API endpoints
     api.add_resource(SpeechToTextResource, '/api/speech-to-text')
+    api.add_resource(SpeechToTextStreamResource, '/api/speech-to-text/stream')
     api.add_resource(TextToSpeechResource, '/api/text-to-speech')
+    api.add_resource(AudioResource, '/api/audio/<string:audio_id>')
     api.add_resource(GrammarCheckResource, '/api/grammar-check')
+    api.add_resource(GrammarCheckBatchResource, '/api/grammar-check/batch')
     api.add_resource(ConversationResource, '/api/conversation')
+    api.add_resource(ConversationStreamResource, '/api/conversation/stream')
     api.add_resource(ConversationHistoryResource, '/api/conversation-history')
     return api
\ No newline at end of file
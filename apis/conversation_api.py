@@ -1,6 +1,10 @@
-from flask import request
+from flask import Response, request, stream_with_context
 from flask_restful import Resource
-from services.gemini_service import GeminiService
+from config import Config
+from services.gemini_service import get_gemini_service
+from utils.admission import error_status
+from utils.audio import negotiate_audio_format
+from utils.helpers import format_sse
 
 class ConversationResource(Resource):
     """API endpoint for generating Japanese conversations"""
@@ -15,7 +19,11 @@ class ConversationResource(Resource):
             "theme": "conversation theme",
             "level": "N5/N4/N3/N2/N1",
             "conversation_history": [],  # Optional previous messages
-            "user_input": "Japanese input from user"
+            "user_input": "Japanese input from user",
+            "check_grammar": false,  # Optional, also run a Sapling grammar check
+            "use_cache": true,  # Optional, false to always generate a fresh response
+            "inline_audio": true,  # Optional, false to return only audio_id instead of base64 audio_reply
+            "audio_format": "mp3"  # Optional, "mp3", "mp3-low" or "opus"; else chosen from the Accept header
         }
         """
         data = request.get_json()
@@ -26,7 +34,12 @@ class ConversationResource(Resource):
         if 'theme' not in data or 'user_input' not in data:
             return {"error": "Missing required fields"}, 400
         
-        gemini_service = GeminiService()
+        try:
+            audio_format = negotiate_audio_format(data.get('audio_format'), request.headers.get('Accept'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        
+        gemini_service = get_gemini_service('conversation')
         
         # Get optional parameters with defaults
         level = data.get('level', 'N4')
@@ -37,14 +50,81 @@ class ConversationResource(Resource):
             topic=data['theme'],
             user_level=level,
             conversation_history=conversation_history,
-            user_input=data['user_input']
+            user_input=data['user_input'],
+            check_grammar=bool(data.get('check_grammar', False)),
+            use_cache=bool(data.get('use_cache', True)),
+            inline_audio=bool(data.get('inline_audio', Config.INLINE_AUDIO_DEFAULT)),
+            audio_format=audio_format
         )
         
         if result['status'] == 'success':
             return result, 200
-        else:
-            return result, 500
+        status, headers = error_status(result)
+        return result, status, headers
+
+
+class ConversationStreamResource(Resource):
+    """API endpoint for streaming Japanese conversation responses over Server-Sent Events"""
+    
+    def post(self):
+        """
+        POST endpoint for streaming a conversation turn
+        
+        Accepts the same JSON payload as /api/conversation and responds with a
+        text/event-stream of events:
+        - correction: the correction object
+        - reply: {"text": "..."} chunks of the reply as they are generated
+        - vocabulary: the vocabulary list
+        - audio: {"audio_id": "..." or null, "audio_reply": "base64_encoded_audio" or null,
+                  "audio_format": "mp3", "mp3-low", "opus" or null}
+        - done: the same payload /api/conversation returns
+        - error: {"status": "error", "message": "..."}
+        """
+        data = request.get_json()
+        
+        if not data or 'user_id' not in data:
+            return {"error": "Missing user_id"}, 400
+            
+        if 'theme' not in data or 'user_input' not in data:
+            return {"error": "Missing required fields"}, 400
         
+        try:
+            audio_format = negotiate_audio_format(data.get('audio_format'), request.headers.get('Accept'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        
+        gemini_service = get_gemini_service('conversation')
+        
+        # Get optional parameters with defaults
+        level = data.get('level', 'N4')
+        conversation_history = data.get('conversation_history', [])
+        
+        events = gemini_service.stream_japanese_conversation(
+            user_id=data['user_id'],
+            topic=data['theme'],
+            user_level=level,
+            conversation_history=conversation_history,
+            user_input=data['user_input'],
+            check_grammar=bool(data.get('check_grammar', False)),
+            use_cache=bool(data.get('use_cache', True)),
+            inline_audio=bool(data.get('inline_audio', Config.INLINE_AUDIO_DEFAULT)),
+            audio_format=audio_format
+        )
+        
+        def generate():
+            for event, payload in events:
+                yield format_sse(event, payload)
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+
 class ConversationHistoryResource(Resource):
     """API endpoint for retrieving conversation history"""
     
@@ -62,7 +142,8 @@ class ConversationHistoryResource(Resource):
         if not user_id:
             return {"error": "Missing user_id parameter"}, 400
         
-        gemini_service = GeminiService()
+        # History reads never touch the model, so no model setup is paid here
+        gemini_service = get_gemini_service('conversation')
         result = gemini_service.get_conversation_history(user_id, limit)
         
         if result['status'] == 'success':
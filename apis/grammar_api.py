@@ -1,6 +1,8 @@
 from flask import request
 from flask_restful import Resource
+from config import Config
 from services.sapling_service import SaplingService
+from utils.admission import error_status
 
 class GrammarCheckResource(Resource):
     """API endpoint for checking Japanese grammar"""
@@ -23,5 +25,41 @@ class GrammarCheckResource(Resource):
         
         if result['status'] == 'success':
             return result, 200
-        else:
-            return result, 500
\ No newline at end of file
+        status, headers = error_status(result)
+        return result, status, headers
+
+
+class GrammarCheckBatchResource(Resource):
+    """API endpoint for checking many Japanese texts in one request"""
+    
+    def post(self):
+        """
+        POST endpoint for batch grammar checking
+        
+        Expected JSON payload:
+        {
+            "texts": ["Japanese text to check", ...]
+        }
+        
+        Each item of "results" has the same shape as a /api/grammar-check
+        response, including per-item errors.
+        """
+        data = request.get_json()
+        
+        if not data or 'texts' not in data:
+            return {"error": "Missing texts"}, 400
+        
+        texts = data['texts']
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return {"error": "texts must be a list of strings"}, 400
+        
+        if len(texts) > Config.GRAMMAR_BATCH_MAX_ITEMS:
+            return {"error": f"Too many texts (maximum {Config.GRAMMAR_BATCH_MAX_ITEMS})"}, 400
+        
+        results = SaplingService.check_japanese_grammar_batch(texts)
+        
+        return {
+            "status": "success",
+            "count": len(results),
+            "results": results
+        }, 200
\ No newline at end of file
@@ -1,6 +1,67 @@
-from flask import request
+import base64
+import binascii
+from flask import Response, request, stream_with_context
 from flask_restful import Resource
+from config import Config
+from services.audio_cache import AudioCache, get_audio_cache
 from services.speech_service import SpeechService
+from utils.admission import error_status
+from utils.audio import is_binary_audio, max_upload_body_bytes, negotiate_audio_format, output_mimetype
+from utils.helpers import format_sse, iter_file_chunks
+
+
+def read_speech_upload():
+    """
+    Read the audio and language of a speech-to-text request
+    
+    Accepts the audio in one of three forms:
+    - multipart/form-data with the file in an "audio" field and an optional "language" field
+    - a raw audio/* or application/octet-stream body, with ?language= in the query string
+    - JSON (base64, kept for existing clients):
+    {
+        "audio_data": "base64_encoded_audio",
+        "language": "ja-JP"  # Optional, defaults to Japanese
+    }
+    
+    Returns:
+        tuple: (audio bytes, language, None) or (None, None, error response)
+    """
+    limit = max_upload_body_bytes(request.mimetype)
+    if request.content_length is not None and request.content_length > limit:
+        return None, None, ({"error": f"Audio upload too large (maximum {limit} bytes)"}, 413)
+    # Bodies sent without a Content-Length are cut off at the same limit
+    request.max_content_length = limit
+    
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('audio')
+        if upload is None:
+            return None, None, ({"error": "Missing audio data"}, 400)
+        return upload.read(), request.form.get('language', 'ja-JP'), None
+    
+    if is_binary_audio(request.mimetype):
+        audio_bytes = request.get_data(cache=False)
+        if not audio_bytes:
+            return None, None, ({"error": "Missing audio data"}, 400)
+        return audio_bytes, request.args.get('language', 'ja-JP'), None
+    
+    data = request.get_json()
+    
+    if not data or 'audio_data' not in data:
+        return None, None, ({"error": "Missing audio data"}, 400)
+    
+    try:
+        audio_bytes = base64.b64decode(data['audio_data'])
+    except (binascii.Error, TypeError, ValueError):
+        return None, None, ({"error": "Invalid audio data"}, 400)
+    return audio_bytes, data.get('language', 'ja-JP'), None
+
+
+def transcription_status(result):
+    """HTTP status for a speech-to-text result"""
+    if result['status'] == 'success':
+        return 200
+    return 413 if result.get('limit_exceeded') else 500
+
 
 class SpeechToTextResource(Resource):
     """API endpoint for converting speech to text"""
@@ -9,24 +70,50 @@ class SpeechToTextResource(Resource):
         """
         POST endpoint for speech-to-text conversion
         
-        Expected JSON payload:
-        {
-            "audio_data": "base64_encoded_audio",
-            "language": "ja-JP"  # Optional, defaults to Japanese
-        }
+        Accepts the uploads described in read_speech_upload. Uploads over
+        Config.STT_MAX_UPLOAD_BYTES or Config.STT_MAX_DURATION_SECONDS are
+        rejected with 413; long recordings are split at pauses and the
+        segments recognized concurrently.
         """
-        data = request.get_json()
+        audio_bytes, language, error = read_speech_upload()
+        if error:
+            return error
+        
+        result = SpeechService.transcribe(audio_bytes, language)
+        return result, transcription_status(result)
+
+
+class SpeechToTextStreamResource(Resource):
+    """API endpoint streaming partial transcripts over Server-Sent Events"""
+    
+    def post(self):
+        """
+        POST endpoint for speech-to-text with partial results
         
-        if not data or 'audio_data' not in data:
-            return {"error": "Missing audio data"}, 400
+        Accepts the same uploads as /api/speech-to-text and responds with a
+        text/event-stream of events:
+        - partial: {"index": segment index, "text": "..."} as each segment is recognized
+        - done: the same payload /api/speech-to-text returns
+        - error: {"status": "error", "message": "..."}
+        """
+        audio_bytes, language, error = read_speech_upload()
+        if error:
+            return error
         
-        language = data.get('language', 'ja-JP')
-        result = SpeechService.speech_to_text(data['audio_data'], language)
+        events = SpeechService.stream_transcription(audio_bytes, language)
         
-        if result['status'] == 'success':
-            return result, 200
-        else:
-            return result, 500
+        def generate():
+            for event, payload in events:
+                yield format_sse(event, payload)
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
 
 
 class TextToSpeechResource(Resource):
@@ -39,7 +126,10 @@ class TextToSpeechResource(Resource):
         Expected JSON payload:
         {
             "text": "Text to convert to speech",
-            "language": "ja"  # Optional, defaults to Japanese
+            "language": "ja",  # Optional, defaults to Japanese
+            "slow": false,  # Optional, read the text slowly
+            "inline_audio": true,  # Optional, false to get only audio_id for /api/audio/<audio_id>
+            "audio_format": "mp3"  # Optional, "mp3", "mp3-low" or "opus"; else chosen from the Accept header
         }
         """
         data = request.get_json()
@@ -47,10 +137,51 @@ class TextToSpeechResource(Resource):
         if not data or 'text' not in data:
             return {"error": "Missing text"}, 400
         
+        try:
+            audio_format = negotiate_audio_format(data.get('audio_format'), request.headers.get('Accept'))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        
         language = data.get('language', 'ja')
-        result = SpeechService.text_to_speech(data['text'], language)
+        slow = bool(data.get('slow', False))
+        inline = bool(data.get('inline_audio', Config.INLINE_AUDIO_DEFAULT))
+        result = SpeechService.text_to_speech(data['text'], language, slow, inline, audio_format)
         
         if result['status'] == 'success':
             return result, 200
-        else:
-            return result, 500
\ No newline at end of file
+        status, headers = error_status(result)
+        return result, status, headers
+
+
+class AudioResource(Resource):
+    """API endpoint for downloading synthesized audio by its audio_id"""
+    
+    def get(self, audio_id):
+        """
+        GET endpoint streaming cached speech as audio/mpeg or audio/ogg
+        
+        The audio_id is the content address returned by /api/text-to-speech and
+        /api/conversation, so a response never changes and may be cached by clients.
+        """
+        if not AudioCache.is_valid_key(audio_id):
+            return {"error": "Audio not found"}, 404
+        
+        etag = f'"{audio_id}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers={'ETag': etag})
+        
+        opened = get_audio_cache().open(audio_id)
+        if opened is None:
+            return {"error": "Audio not found"}, 404
+        
+        audio_file, size = opened
+        return Response(
+            iter_file_chunks(audio_file),
+            mimetype=output_mimetype(AudioCache.format_of(audio_id)),
+            headers={
+                'Content-Length': str(size),
+                'ETag': etag,
+                'Cache-Control': f'public, max-age={Config.TTS_CACHE_MAX_AGE}, immutable'
+            },
+            direct_passthrough=True
+        )
\ No newline at end of file
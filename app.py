@@ -1,8 +1,13 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request
 from apis import init_api
 from config import Config
+from services.warmup import readiness, start_warm_up
+from utils.metrics import (
+    METRICS_CONTENT_TYPE, end_request_timing, observe_request, render, server_timing_header, start_request_timing
+)
 import logging
 import os
+import time
 from flask_cors import CORS
 
 # Configure logging
@@ -28,6 +33,41 @@ def create_app():
             "message": "Japanese Learning API Server is running"
         })
     
+    @app.route('/ready')
+    def ready():
+        """Readiness check: 503 until every backend is warm in this process"""
+        start_warm_up()
+        report = readiness()
+        return jsonify(report), 200 if report["status"] == "ready" else 503
+    
+    @app.route('/metrics')
+    def metrics():
+        """Stage timings, request counts and service counters in Prometheus text format"""
+        return Response(render(), content_type=METRICS_CONTENT_TYPE)
+    
+    @app.before_request
+    def start_timing():
+        """Start timing the request and collecting its stage timings"""
+        g.request_started = time.perf_counter()
+        start_request_timing()
+    
+    @app.after_request
+    def record_timing(response):
+        """Record the request and optionally report its stage timings"""
+        elapsed = time.perf_counter() - g.request_started
+        # The URL rule, not the path, so IDs in paths don't multiply the series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe_request(request.method, route, response.status_code, elapsed)
+        
+        if Config.SERVER_TIMING_HEADER:
+            response.headers['Server-Timing'] = server_timing_header(elapsed)
+        return response
+    
+    @app.teardown_request
+    def end_timing(error):
+        """Stop collecting stage timings once the response is finished"""
+        end_request_timing()
+    
     @app.errorhandler(404)
     def not_found(error):
         """Handle 404 errors"""
@@ -50,4 +90,5 @@ def create_app():
 if __name__ == '__main__':
     app = create_app()
     port = int(os.environ.get('PORT', 9000))
-    app.run(debug=True, host='0.0.0.0', port=9000)
\ No newline at end of file
+    # Development server only; use `gunicorn -c gunicorn.conf.py` in production
+    app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,443 @@
+"""
+Async serving mode
+
+Serves the same API as app.py on aiohttp's event loop. Gemini, gTTS, Google
+speech recognition and Sapling are awaited instead of holding a thread per
+request, so one process can keep hundreds of learner conversations in flight.
+
+Usage:
+    python3 async_app.py
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+import time
+from aiohttp import web
+from config import Config
+from services.audio_cache import AudioCache, get_audio_cache
+from services.gemini_service import get_gemini_service
+from services.sapling_service import SaplingService
+from services.speech_service import SpeechService
+from services.warmup import readiness, start_warm_up
+from utils.admission import error_status
+from utils.audio import is_binary_audio, max_upload_body_bytes, negotiate_audio_format, output_mimetype
+from utils.helpers import close_http_session, format_sse
+from utils.metrics import METRICS_CONTENT_TYPE, observe_request, render, server_timing_header, start_request_timing
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+routes = web.RouteTableDef()
+
+
+async def read_json(request):
+    """Read a JSON body, returning None if it is missing or invalid"""
+    try:
+        return await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+
+def result_response(result):
+    """Map a service result to a JSON response; rejected upstream calls get 429/503 with Retry-After"""
+    if result['status'] == 'success':
+        return web.json_response(result)
+    status, headers = error_status(result)
+    return web.json_response(result, status=status, headers=headers)
+
+
+def transcription_response(result):
+    """Map a speech-to-text result to a JSON response, 413 if it broke the upload limits"""
+    if result['status'] != 'success' and result.get('limit_exceeded'):
+        return web.json_response(result, status=413)
+    return result_response(result)
+
+
+@routes.get('/')
+async def index(request):
+    """Health check endpoint"""
+    return web.json_response({
+        "status": "ok",
+        "message": "Japanese Learning API Server is running"
+    })
+
+
+@routes.get('/metrics')
+async def metrics(request):
+    """Stage timings, request counts and service counters in Prometheus text format"""
+    return web.Response(text=render(), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+
+@routes.get('/ready')
+async def ready(request):
+    """Readiness check: 503 until every backend is warm in this process"""
+    start_warm_up()
+    report = readiness()
+    return web.json_response(report, status=200 if report["status"] == "ready" else 503)
+
+
+async def read_limited(chunks, limit):
+    """Collect an async iterable of byte chunks, returning None once it exceeds limit bytes"""
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > limit:
+            return None
+    return bytes(body)
+
+
+async def part_chunks(part):
+    """Iterate over a multipart body part in chunks"""
+    while True:
+        chunk = await part.read_chunk(Config.AUDIO_STREAM_CHUNK_BYTES)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def read_speech_upload(request):
+    """Async counterpart of apis.speech_api.read_speech_upload"""
+    limit = max_upload_body_bytes(request.content_type)
+    too_large = web.json_response({"error": f"Audio upload too large (maximum {limit} bytes)"}, status=413)
+    missing = web.json_response({"error": "Missing audio data"}, status=400)
+    if request.content_length is not None and request.content_length > limit:
+        return None, None, too_large
+
+    if request.content_type == 'multipart/form-data':
+        audio_bytes, language = None, 'ja-JP'
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'audio':
+                audio_bytes = await read_limited(part_chunks(part), limit)
+                if audio_bytes is None:
+                    return None, None, too_large
+            elif part.name == 'language':
+                language = await part.text()
+        if audio_bytes is None:
+            return None, None, missing
+        return audio_bytes, language, None
+
+    if is_binary_audio(request.content_type):
+        audio_bytes = await read_limited(request.content.iter_chunked(Config.AUDIO_STREAM_CHUNK_BYTES), limit)
+        if audio_bytes is None:
+            return None, None, too_large
+        if not audio_bytes:
+            return None, None, missing
+        return audio_bytes, request.query.get('language', 'ja-JP'), None
+
+    data = await read_json(request)
+
+    if not data or 'audio_data' not in data:
+        return None, None, missing
+
+    try:
+        audio_bytes = base64.b64decode(data['audio_data'])
+    except (binascii.Error, TypeError, ValueError):
+        return None, None, web.json_response({"error": "Invalid audio data"}, status=400)
+    return audio_bytes, data.get('language', 'ja-JP'), None
+
+
+@routes.post('/api/speech-to-text')
+async def speech_to_text(request):
+    """Async counterpart of SpeechToTextResource.post"""
+    audio_bytes, language, error = await read_speech_upload(request)
+    if error is not None:
+        return error
+
+    return transcription_response(await SpeechService.transcribe_async(audio_bytes, language))
+
+
+@routes.post('/api/speech-to-text/stream')
+async def speech_to_text_stream(request):
+    """Async counterpart of SpeechToTextStreamResource.post"""
+    audio_bytes, language, error = await read_speech_upload(request)
+    if error is not None:
+        return error
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    apply_cors(request, response)
+    await response.prepare(request)
+
+    async for event, payload in SpeechService.stream_transcription_async(audio_bytes, language):
+        await response.write(format_sse(event, payload).encode('utf-8'))
+
+    await response.write_eof()
+    return response
+
+
+@routes.post('/api/text-to-speech')
+async def text_to_speech(request):
+    """Async counterpart of TextToSpeechResource.post"""
+    data = await read_json(request)
+
+    if not data or 'text' not in data:
+        return web.json_response({"error": "Missing text"}, status=400)
+
+    try:
+        audio_format = negotiate_audio_format(data.get('audio_format'), request.headers.get('Accept'))
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+    language = data.get('language', 'ja')
+    slow = bool(data.get('slow', False))
+    inline = bool(data.get('inline_audio', Config.INLINE_AUDIO_DEFAULT))
+    return result_response(
+        await SpeechService.text_to_speech_async(data['text'], language, slow, inline, audio_format)
+    )
+
+
+@routes.get('/api/audio/{audio_id}')
+async def audio(request):
+    """Async counterpart of AudioResource.get"""
+    audio_id = request.match_info['audio_id']
+    if not AudioCache.is_valid_key(audio_id):
+        return web.json_response({"error": "Audio not found"}, status=404)
+
+    etag = f'"{audio_id}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers={'ETag': etag})
+
+    opened = await asyncio.to_thread(get_audio_cache().open, audio_id)
+    if opened is None:
+        return web.json_response({"error": "Audio not found"}, status=404)
+
+    audio_file, size = opened
+    try:
+        response = web.StreamResponse(headers={
+            'Content-Type': output_mimetype(AudioCache.format_of(audio_id)),
+            'ETag': etag,
+            'Cache-Control': f'public, max-age={Config.TTS_CACHE_MAX_AGE}, immutable'
+        })
+        response.content_length = size
+        apply_cors(request, response)
+        await response.prepare(request)
+
+        while True:
+            chunk = await asyncio.to_thread(audio_file.read, Config.AUDIO_STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            await response.write(chunk)
+    finally:
+        audio_file.close()
+
+    await response.write_eof()
+    return response
+
+
+@routes.post('/api/grammar-check')
+async def grammar_check(request):
+    """Async counterpart of GrammarCheckResource.post"""
+    data = await read_json(request)
+
+    if not data or 'text' not in data:
+        return web.json_response({"error": "Missing text"}, status=400)
+
+    return result_response(await SaplingService.check_japanese_grammar_async(data['text']))
+
+
+@routes.post('/api/grammar-check/batch')
+async def grammar_check_batch(request):
+    """Async counterpart of GrammarCheckBatchResource.post"""
+    data = await read_json(request)
+
+    if not data or 'texts' not in data:
+        return web.json_response({"error": "Missing texts"}, status=400)
+
+    texts = data['texts']
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return web.json_response({"error": "texts must be a list of strings"}, status=400)
+
+    if len(texts) > Config.GRAMMAR_BATCH_MAX_ITEMS:
+        return web.json_response(
+            {"error": f"Too many texts (maximum {Config.GRAMMAR_BATCH_MAX_ITEMS})"}, status=400
+        )
+
+    results = await SaplingService.check_japanese_grammar_batch_async(texts)
+    return web.json_response({
+        "status": "success",
+        "count": len(results),
+        "results": results
+    })
+
+
+def conversation_arguments(data, accept=None):
+    """Validate a conversation payload, returning (kwargs, error response)"""
+    if not data or 'user_id' not in data:
+        return None, web.json_response({"error": "Missing user_id"}, status=400)
+
+    if 'theme' not in data or 'user_input' not in data:
+        return None, web.json_response({"error": "Missing required fields"}, status=400)
+
+    try:
+        audio_format = negotiate_audio_format(data.get('audio_format'), accept)
+    except ValueError as e:
+        return None, web.json_response({"error": str(e)}, status=400)
+
+    return {
+        "user_id": data['user_id'],
+        "topic": data['theme'],
+        "user_level": data.get('level', 'N4'),
+        "conversation_history": data.get('conversation_history', []),
+        "user_input": data['user_input'],
+        "check_grammar": bool(data.get('check_grammar', False)),
+        "use_cache": bool(data.get('use_cache', True)),
+        "inline_audio": bool(data.get('inline_audio', Config.INLINE_AUDIO_DEFAULT)),
+        "audio_format": audio_format
+    }, None
+
+
+@routes.post('/api/conversation')
+async def conversation(request):
+    """Async counterpart of ConversationResource.post"""
+    arguments, error = conversation_arguments(await read_json(request), request.headers.get('Accept'))
+    if error is not None:
+        return error
+
+    gemini_service = get_gemini_service('conversation')
+    return result_response(await gemini_service.generate_japanese_conversation_async(**arguments))
+
+
+@routes.post('/api/conversation/stream')
+async def conversation_stream(request):
+    """Async counterpart of ConversationStreamResource.post"""
+    arguments, error = conversation_arguments(await read_json(request), request.headers.get('Accept'))
+    if error is not None:
+        return error
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Headers are sent by prepare(), before the CORS middleware sees the response
+    apply_cors(request, response)
+    await response.prepare(request)
+
+    gemini_service = get_gemini_service('conversation')
+    async for event, payload in gemini_service.stream_japanese_conversation_async(**arguments):
+        await response.write(format_sse(event, payload).encode('utf-8'))
+
+    await response.write_eof()
+    return response
+
+
+@routes.get('/api/conversation-history')
+async def conversation_history(request):
+    """Async counterpart of ConversationHistoryResource.get"""
+    user_id = request.query.get('user_id')
+    try:
+        limit = int(request.query.get('limit', 10))
+    except ValueError:
+        limit = 10
+
+    if not user_id:
+        return web.json_response({"error": "Missing user_id parameter"}, status=400)
+
+    gemini_service = get_gemini_service('conversation')
+    result = await asyncio.to_thread(gemini_service.get_conversation_history, user_id, limit)
+    return result_response(result)
+
+
+@web.middleware
+async def error_middleware(request, handler):
+    """Render errors as JSON like the Flask app does"""
+    try:
+        return await handler(request)
+    except web.HTTPNotFound:
+        return web.json_response({
+            "error": "Not found",
+            "message": "The requested URL was not found on the server"
+        }, status=404)
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Server error: {e}")
+        return web.json_response({
+            "error": "Internal server error",
+            "message": "An unexpected error occurred"
+        }, status=500)
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Record each request like the Flask app's request hooks do"""
+    started = time.perf_counter()
+    # Each request runs in its own task, so the timings stay with this request
+    start_request_timing()
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'unmatched'
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        observe_request(request.method, route, e.status, time.perf_counter() - started)
+        raise
+
+    elapsed = time.perf_counter() - started
+    observe_request(request.method, route, response.status, elapsed)
+    # Streamed responses have already sent their headers
+    if Config.SERVER_TIMING_HEADER and not response.prepared:
+        response.headers['Server-Timing'] = server_timing_header(elapsed)
+    return response
+
+
+def apply_cors(request, response):
+    """Add CORS headers for the request's origin"""
+    origin = request.headers.get('Origin')
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Vary'] = 'Origin'
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Allow cross-origin requests like flask_cors does for the Flask app"""
+    if request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers:
+        response = web.Response()
+        response.headers['Access-Control-Allow-Methods'] = request.headers['Access-Control-Request-Method']
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get(
+            'Access-Control-Request-Headers', '*'
+        )
+    else:
+        response = await handler(request)
+
+    if not response.prepared:
+        apply_cors(request, response)
+    return response
+
+
+async def on_cleanup(app):
+    """Close shared upstream connections"""
+    await close_http_session()
+
+
+def create_async_app():
+    """Create and configure the aiohttp application"""
+    app = web.Application(
+        middlewares=[cors_middleware, metrics_middleware, error_middleware],
+        client_max_size=Config.ASYNC_MAX_BODY_BYTES
+    )
+    app.add_routes(routes)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+async def app_factory():
+    """Entry point for gunicorn's aiohttp worker (SERVER_MODE=async)"""
+    return create_async_app()
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 9000))
+    web.run_app(create_async_app(), host='0.0.0.0', port=port)
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of per-request GeminiService setup overhead
+
+Compares the old per-request construction (configure the client, build a
+GenerativeModel, create the data directory) with the shared registry used by
+the API resources. Both paths also fetch the gRPC client exactly as the first
+step of generate_content does; genai.configure discards cached clients, so the
+per-request path rebuilds one every time. No network calls are made.
+
+Usage:
+    python3 benchmarks/bench_gemini_service_init.py [--iterations 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+from config import Config
+from services.gemini_service import get_gemini_service
+
+
+def per_request_setup():
+    """Setup performed by every request before the shared registry existed"""
+    genai.configure(api_key=Config.GEMINI_API_KEY)
+    model = genai.GenerativeModel(Config.GEMINI_MODEL)
+    os.makedirs(Config.CONVERSATIONS_DIR, exist_ok=True)
+    return model, genai_client.get_default_generative_client()
+
+
+def shared_conversation_setup():
+    """Setup performed by a conversation request with the shared registry"""
+    model = get_gemini_service('conversation').model
+    return model, genai_client.get_default_generative_client()
+
+
+def shared_history_setup():
+    """Setup performed by a history request with the shared registry"""
+    return get_gemini_service('conversation').conversation_store
+
+
+def measure(func, iterations):
+    """Return the mean time per call in microseconds"""
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GeminiService setup micro-benchmark")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    results = [
+        ("per-request GeminiService()", measure(per_request_setup, args.iterations)),
+        ("shared service (conversation)", measure(shared_conversation_setup, args.iterations)),
+        ("shared service (history)", measure(shared_history_setup, args.iterations)),
+    ]
+    for name, micros in results:
+        print(f"{name:32s} {micros:10.2f} us/request")
+
+
+if __name__ == '__main__':
+    main()
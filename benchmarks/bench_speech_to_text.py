@@ -0,0 +1,114 @@
+"""
+Benchmark of the speech-to-text decode stage over a corpus of sample clips
+
+Compares the old temp-file path (write .mp3, convert to a temp .wav with
+pydub, read it back with speech_recognition) with the in-memory decode used by
+SpeechService. Recognition itself is excluded because it is a remote call.
+
+Without --corpus, synthetic stereo 44.1 kHz WAV clips are generated. Clips in
+compressed formats (mp3, ogg, webm...) need ffmpeg on PATH.
+
+Usage:
+    python3 benchmarks/bench_speech_to_text.py [--corpus DIR] [--repeat 5]
+"""
+import argparse
+import io
+import math
+import os
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import speech_recognition as sr
+from pydub import AudioSegment
+from services.speech_service import SpeechService
+from utils.audio import sniff_audio_format
+
+
+def synthetic_clip(seconds, rate=44100):
+    """Generate a stereo sine-wave WAV clip in memory"""
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        sample = int(8000 * math.sin(2 * math.pi * 440 * i / rate))
+        frames += struct.pack('<hh', sample, sample)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def load_corpus(corpus_dir):
+    """Load (name, bytes) pairs for every file in corpus_dir"""
+    if not corpus_dir:
+        return [(f"synthetic_{seconds}s.wav", synthetic_clip(seconds)) for seconds in (2, 5, 15)]
+
+    clips = []
+    for name in sorted(os.listdir(corpus_dir)):
+        path = os.path.join(corpus_dir, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as clip_file:
+                clips.append((name, clip_file.read()))
+    return clips
+
+
+def legacy_decode(data):
+    """Decode the way speech_to_text did before the in-memory pipeline"""
+    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_input_audio:
+        temp_input_audio.write(data)
+        temp_input_path = temp_input_audio.name
+
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
+        audio_segment = AudioSegment.from_file(temp_input_path)
+        audio_segment.export(temp_wav.name, format="wav")
+        temp_wav_path = temp_wav.name
+
+    try:
+        recognizer = sr.Recognizer()
+        with sr.AudioFile(temp_wav_path) as source:
+            return recognizer.record(source)
+    finally:
+        os.unlink(temp_input_path)
+        os.unlink(temp_wav_path)
+
+
+def measure(func, data, repeat):
+    """Return the mean time per call in milliseconds, or None if it fails"""
+    try:
+        func(data)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(data)
+        return (time.perf_counter() - start) / repeat * 1000
+    except Exception as e:
+        print(f"  failed: {e}")
+        return None
+
+
+def format_ms(value):
+    return f"{value:9.2f}" if value is not None else "      n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speech-to-text decode benchmark")
+    parser.add_argument('--corpus', help="Directory of sample clips")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'clip':32s} {'format':6s} {'KiB':>8s} {'temp (ms)':>9s} {'memory (ms)':>11s}")
+    for name, data in load_corpus(args.corpus):
+        legacy = measure(legacy_decode, data, args.repeat)
+        in_memory = measure(SpeechService.decode_audio, data, args.repeat)
+        print(f"{name:32s} {str(sniff_audio_format(data)):6s} {len(data) / 1024:8.1f} "
+              f"{format_ms(legacy)} {format_ms(in_memory):>11s}")
+
+
+if __name__ == '__main__':
+    main()
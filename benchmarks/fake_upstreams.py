@@ -0,0 +1,47 @@
+"""
+Local stand-in for the Sapling HTTP API
+
+Answers POST /api/v1/edits with an empty edit list after a configurable
+delay, so the real HTTP client path (connection pool, timeouts, JSON
+decoding) is exercised without an API key. Used by offline_suite.py.
+
+Usage:
+    python3 benchmarks/fake_upstreams.py [--port 9100] [--sapling-ms 150]
+"""
+import argparse
+import asyncio
+import sys
+from aiohttp import web
+
+
+def create_upstream_app(sapling_seconds):
+    """Create the stand-in upstream application"""
+    routes = web.RouteTableDef()
+
+    @routes.post('/api/v1/edits')
+    async def sapling_edits(request):
+        await request.read()
+        await asyncio.sleep(sapling_seconds)
+        return web.json_response({"edits": []})
+
+    @routes.get('/')
+    async def index(request):
+        return web.json_response({"status": "ok"})
+
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local upstream stand-ins")
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--sapling-ms', type=float, default=150, help="Latency added to each Sapling call")
+    args = parser.parse_args()
+
+    web.run_app(create_upstream_app(args.sapling_ms / 1000), host='127.0.0.1', port=args.port, print=None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Load test comparing the threaded Flask server with the async serving mode
+
+Drives one endpoint at rising concurrency and reports throughput, latency
+percentiles, errors and the server's resident memory, so the two modes can be
+compared at the same memory footprint.
+
+Usage:
+    # Start the server under test and let the script sample its memory
+    python3 benchmarks/load_test.py --launch "python3 async_app.py"
+    python3 benchmarks/load_test.py --launch "python3 app.py"
+
+    # Or point it at a running server
+    python3 benchmarks/load_test.py --url http://127.0.0.1:9000 --pid 12345
+"""
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+import aiohttp
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PAYLOAD = {"text": "私は学生です"}
+
+
+def read_rss_kib(pid):
+    """Resident set size of a process and its children in KiB (Linux only)"""
+    if not pid:
+        return None
+
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        pass
+
+    total = 0
+    for process_id in pids:
+        try:
+            with open(f"/proc/{process_id}/status") as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+async def sample_memory(pid, peak, stop):
+    """Record peak RSS until stop is set"""
+    while not stop.is_set():
+        rss = read_rss_kib(pid)
+        if rss is not None:
+            peak[0] = max(peak[0], rss)
+        await asyncio.sleep(0.1)
+
+
+async def run_level(url, method, payload, concurrency, total_requests, pid, timeout):
+    """
+    Run total_requests requests with at most concurrency in flight
+
+    payload is a JSON body, or a callable returning the body for a request index
+    so each request can differ (e.g. to avoid cache hits).
+    """
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    peak = [read_rss_kib(pid) or 0]
+    stop = asyncio.Event()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        async def one_request(index):
+            nonlocal errors
+            body = payload(index) if callable(payload) else payload
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session.request(method, url, json=body) as response:
+                        await response.read()
+                        if response.status >= 400:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        sampler = asyncio.create_task(sample_memory(pid, peak, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request(index) for index in range(total_requests)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "throughput_rps": total_requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_rss_mib": peak[0] / 1024 if pid else None
+    }
+
+
+async def wait_until_up(base_url, deadline=30):
+    """Poll the health check until the server answers"""
+    async with aiohttp.ClientSession() as session:
+        started = time.monotonic()
+        while time.monotonic() - started < deadline:
+            try:
+                async with session.get(base_url + '/') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not come up")
+
+
+async def main_async(args):
+    process = None
+    pid = args.pid
+    if args.launch:
+        environment = dict(os.environ, PORT=str(args.port))
+        process = subprocess.Popen(shlex.split(args.launch), cwd=ROOT_DIR, env=environment)
+        pid = process.pid
+
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    payload = json.loads(args.payload) if args.payload else DEFAULT_PAYLOAD
+    results = []
+    try:
+        await wait_until_up(base_url)
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            result = await run_level(
+                base_url + args.path, args.method, payload, concurrency,
+                max(args.requests, concurrency), pid, args.timeout
+            )
+            results.append(result)
+            rss = f"{result['peak_rss_mib']:8.1f}" if result['peak_rss_mib'] is not None else "     n/a"
+            print(f"c={concurrency:<5d} {result['throughput_rps']:8.1f} req/s  "
+                  f"p50={result['p50_ms']:8.1f}ms p95={result['p95_ms']:8.1f}ms "
+                  f"p99={result['p99_ms']:8.1f}ms errors={result['errors']:<5d} rss={rss} MiB")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({"target": args.launch or base_url, "path": args.path, "results": results}, output, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Endpoint load test")
+    parser.add_argument('--launch', help="Command starting the server under test (run from the repo root)")
+    parser.add_argument('--url', help="Base URL of an already running server")
+    parser.add_argument('--pid', type=int, help="Server PID for memory sampling when not launched")
+    parser.add_argument('--port', type=int, default=9000, help="Port for a launched server")
+    parser.add_argument('--path', default='/api/grammar-check')
+    parser.add_argument('--method', default='POST')
+    parser.add_argument('--payload', help="JSON request body (defaults to a grammar-check payload)")
+    parser.add_argument('--concurrency', default='10,50,100,200,400')
+    parser.add_argument('--requests', type=int, default=400, help="Requests per concurrency level")
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    if not args.launch and not args.url:
+        parser.error("either --launch or --url is required")
+
+    asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Run the API with local stand-ins for every paid or networked upstream
+
+Gemini, gTTS and Google speech recognition are replaced in-process by stubs
+that wait a configurable time and return canned results; Sapling calls go
+over HTTP to fake_upstreams.py. Everything else (routing, prompt building,
+JSON parsing, caches, history storage, audio decoding) is the real code, so
+the server can be load tested without API keys. Started by offline_suite.py.
+
+Usage:
+    python3 benchmarks/offline_server.py --mode flask --port 9000 \
+        --sapling-url http://127.0.0.1:9100/api/v1/edits [--gemini-ms 800 --tts-ms 300 --stt-ms 500]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from services import gemini_service
+from services.prompt_builder import SYSTEM_INSTRUCTION
+from services.speech_service import SpeechService
+from services.stt_backends import GoogleRecognizerBackend
+
+# One MPEG audio frame (frame sync + header and padding); stub audio is a run of these
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+_turns = itertools.count(1)
+
+
+def fake_turn_text():
+    """JSON for one conversation turn; each reply differs so its speech is synthesized afresh"""
+    turn = next(_turns)
+    return json.dumps({
+        "correction": {"hasError": False, "original": "", "suggestion": "", "explanation": ""},
+        "reply": f"いいですね。今日は{turn}回目の練習です。次の質問に答えてください。",
+        "vocabulary": [{"word": "練習", "reading": "れんしゅう", "meaning": "luyện tập"}]
+    }, ensure_ascii=False)
+
+
+class FakeStream:
+    """Streamed response yielding the turn in small chunks"""
+
+    def __init__(self, text, chunk_delay):
+        self.chunks = [types.SimpleNamespace(text=text[i:i + 16]) for i in range(0, len(text), 16)]
+        self.chunk_delay = chunk_delay
+        self.usage_metadata = None
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            time.sleep(self.chunk_delay)
+            yield chunk
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.chunk_delay)
+            yield chunk
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel and its chat sessions"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _respond(self, stream):
+        text = fake_turn_text()
+        if stream:
+            # Half the latency before the first chunk, the rest spread over the chunks
+            stream_response = FakeStream(text, 0)
+            stream_response.chunk_delay = self.latency / 2 / len(stream_response.chunks)
+            return stream_response
+        return types.SimpleNamespace(text=text, usage_metadata=None)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        time.sleep(self.latency / 2 if stream else self.latency)
+        return self._respond(stream)
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        await asyncio.sleep(self.latency / 2 if stream else self.latency)
+        return self._respond(stream)
+
+    def start_chat(self, history=None):
+        model = self
+        return types.SimpleNamespace(
+            send_message=lambda message, stream=False, **kwargs: model.generate_content(message, stream),
+            send_message_async=lambda message, stream=False, **kwargs: model.generate_content_async(message, stream)
+        )
+
+
+def install_stubs(gemini_seconds, tts_seconds, stt_seconds, sapling_url):
+    """Replace the upstream clients with stand-ins"""
+    model = FakeModel(gemini_seconds)
+    for model_name in set(Config.GEMINI_ROUTE_MODELS.values()) | {Config.GEMINI_MODEL}:
+        for system_instruction in (None, SYSTEM_INSTRUCTION):
+            gemini_service._gemini_models[(model_name, system_instruction)] = model
+
+    def synthesize(text, language='ja', slow=False):
+        time.sleep(tts_seconds)
+        return MP3_FRAME * max(1, len(text))
+
+    async def synthesize_async(text, language='ja', slow=False):
+        await asyncio.sleep(tts_seconds)
+        return MP3_FRAME * max(1, len(text))
+
+    SpeechService._synthesize = staticmethod(synthesize)
+    SpeechService._synthesize_async = staticmethod(synthesize_async)
+
+    def recognize(self, recognizer, audio, language):
+        time.sleep(stt_seconds)
+        return "テストです"
+
+    async def recognize_async(self, audio, language):
+        await asyncio.sleep(stt_seconds)
+        return "テストです"
+
+    GoogleRecognizerBackend.recognize = recognize
+    GoogleRecognizerBackend.recognize_async = recognize_async
+
+    Config.SAPLING_API_URL = sapling_url
+    Config.SAPLING_API_KEY = Config.SAPLING_API_KEY or 'offline-benchmark'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API server with local upstream stand-ins")
+    parser.add_argument('--mode', choices=['flask', 'async'], default='flask')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--sapling-url', required=True, help="URL of the fake Sapling edits endpoint")
+    parser.add_argument('--gemini-ms', type=float, default=800)
+    parser.add_argument('--tts-ms', type=float, default=300)
+    parser.add_argument('--stt-ms', type=float, default=500)
+    args = parser.parse_args()
+
+    install_stubs(args.gemini_ms / 1000, args.tts_ms / 1000, args.stt_ms / 1000, args.sapling_url)
+
+    if args.mode == 'async':
+        from aiohttp import web
+        from async_app import create_async_app
+
+        web.run_app(create_async_app(), host='127.0.0.1', port=args.port, print=None, access_log=None)
+    else:
+        from app import create_app
+
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        create_app().run(host='127.0.0.1', port=args.port, threaded=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
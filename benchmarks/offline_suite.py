@@ -0,0 +1,187 @@
+"""
+Offline benchmark of every main endpoint against local upstream stand-ins
+
+Starts fake_upstreams.py and offline_server.py (the real app with Gemini,
+gTTS and speech recognition stubbed at a fixed latency), then drives
+conversation, text-to-speech, speech-to-text, grammar-check and
+conversation-history at rising concurrency. Throughput, p50/p95/p99 latency,
+errors and peak server RSS per endpoint are printed and written as JSON, so
+runs before and after a change can be compared without API keys or network.
+
+Usage:
+    python3 benchmarks/offline_suite.py [--mode flask|async] [--concurrency 1,10,50]
+        [--requests 200] [--gemini-ms 800 --tts-ms 300 --stt-ms 500 --sapling-ms 150]
+        [--endpoints conversation,tts] [--output offline_benchmark.json]
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import math
+import os
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT_DIR, run_level, wait_until_up
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BENCH_USERS = 50
+
+
+def tone_wav(seconds=3, sample_rate=16000, frequency=440):
+    """A mono 16-bit WAV tone loud enough to count as speech for the segmenter"""
+    frames = b''.join(
+        struct.pack('<h', int(8000 * math.sin(2 * math.pi * frequency * index / sample_rate)))
+        for index in range(int(seconds * sample_rate))
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def build_scenarios():
+    """(name, method, path, payload) per endpoint; payloads vary by request index to avoid cache hits"""
+    audio_data = base64.b64encode(tone_wav()).decode('ascii')
+    return [
+        ('conversation', 'POST', '/api/conversation', lambda index: {
+            "user_id": f"bench-{index % BENCH_USERS}",
+            "theme": "自己紹介",
+            "level": "N4",
+            "user_input": f"私の名前は田中です。{index}番目の質問に答えます。"
+        }),
+        ('tts', 'POST', '/api/text-to-speech', lambda index: {
+            "text": f"明日は{index}時に駅で会いましょう。"
+        }),
+        ('stt', 'POST', '/api/speech-to-text', {"audio_data": audio_data, "language": "ja-JP"}),
+        ('grammar', 'POST', '/api/grammar-check', lambda index: {
+            "text": f"私は{index}回学校を行きました。"
+        }),
+        # Runs after the conversation scenario has stored history for the bench users
+        ('history', 'GET', '/api/conversation-history?user_id=bench-0&limit=10', None)
+    ]
+
+
+def git_commit():
+    """Commit the benchmark ran against, if known"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_suite(args, base_url, pid):
+    """Run every selected scenario at every concurrency level"""
+    selected = set(args.endpoints.split(',')) if args.endpoints else None
+    levels = [int(level) for level in args.concurrency.split(',')]
+    report = {}
+
+    await wait_until_up(base_url)
+    for name, method, path, payload in build_scenarios():
+        if selected is not None and name not in selected:
+            continue
+
+        print(f"== {name} ({method} {path.split('?')[0]})")
+        results = []
+        offset = 0
+        for concurrency in levels:
+            total_requests = max(args.requests, concurrency)
+            # Number requests across levels so later levels do not replay earlier payloads
+            level_payload = (lambda index, start=offset: payload(start + index)) if callable(payload) else payload
+            offset += total_requests
+            result = await run_level(
+                base_url + path, method, level_payload, concurrency, total_requests, pid, args.timeout
+            )
+            results.append(result)
+            print(f"c={concurrency:<5d} {result['throughput_rps']:8.1f} req/s  "
+                  f"p50={result['p50_ms']:8.1f}ms p95={result['p95_ms']:8.1f}ms "
+                  f"p99={result['p99_ms']:8.1f}ms errors={result['errors']:<5d} "
+                  f"rss={result['peak_rss_mib']:8.1f} MiB")
+        report[name] = {
+            "method": method,
+            "path": path,
+            "levels": results,
+            "peak_rss_mib": max(result['peak_rss_mib'] for result in results)
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline endpoint benchmark with local upstream stand-ins")
+    parser.add_argument('--mode', choices=['flask', 'async'], default='flask')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--upstream-port', type=int, default=9100)
+    parser.add_argument('--concurrency', default='1,10,50')
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument('--endpoints', help="Comma-separated subset of conversation,tts,stt,grammar,history")
+    parser.add_argument('--gemini-ms', type=float, default=800)
+    parser.add_argument('--tts-ms', type=float, default=300)
+    parser.add_argument('--stt-ms', type=float, default=500)
+    parser.add_argument('--sapling-ms', type=float, default=150)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--output', default='offline_benchmark.json', help="JSON report path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='jfix-bench-') as data_dir:
+        # Fresh history and audio cache per run so results do not depend on earlier runs
+        environment = dict(
+            os.environ,
+            GEMINI_API_KEY=os.environ.get('GEMINI_API_KEY', 'offline-benchmark'),
+            CONVERSATIONS_DIR=os.path.join(data_dir, 'conversations'),
+            TTS_CACHE_DIR=os.path.join(data_dir, 'audio_cache')
+        )
+        upstream = subprocess.Popen(
+            [sys.executable, os.path.join(BENCHMARK_DIR, 'fake_upstreams.py'),
+             '--port', str(args.upstream_port), '--sapling-ms', str(args.sapling_ms)],
+            cwd=ROOT_DIR, env=environment
+        )
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(BENCHMARK_DIR, 'offline_server.py'),
+             '--mode', args.mode, '--port', str(args.port),
+             '--sapling-url', f"http://127.0.0.1:{args.upstream_port}/api/v1/edits",
+             '--gemini-ms', str(args.gemini_ms), '--tts-ms', str(args.tts_ms), '--stt-ms', str(args.stt_ms)],
+            cwd=ROOT_DIR, env=environment
+        )
+        try:
+            asyncio.run(wait_until_up(f"http://127.0.0.1:{args.upstream_port}"))
+            endpoints = asyncio.run(run_suite(args, f"http://127.0.0.1:{args.port}", server.pid))
+        finally:
+            for process in (server, upstream):
+                process.terminate()
+                process.wait()
+
+    report = {
+        "meta": {
+            "mode": args.mode,
+            "upstream_latency_ms": {
+                "gemini": args.gemini_ms, "tts": args.tts_ms, "stt": args.stt_ms, "sapling": args.sapling_ms
+            },
+            "requests_per_level": args.requests,
+            "python": platform.python_version(),
+            "commit": git_commit(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        },
+        "endpoints": endpoints
+    }
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
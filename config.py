@@ -9,6 +9,153 @@ class Config:
     SAPLING_API_KEY = os.getenv('SAPLING_API_KEY')
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     SAPLING_API_URL = "https://api.sapling.ai/api/v1/edits"
+
+    # Connection limit of the shared aiohttp session used in async serving mode
+    ASYNC_HTTP_POOL_SIZE = int(os.getenv('ASYNC_HTTP_POOL_SIZE', 200))
+    ASYNC_MAX_BODY_BYTES = int(os.getenv('ASYNC_MAX_BODY_BYTES', 20 * 1024 * 1024))
+
+    # Stage timings and counters served at /metrics; per-request timings in a Server-Timing header
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', 'false').lower() == 'true'
+
+    # Sapling HTTP connection pool, timeouts (seconds) and result cache
+    SAPLING_POOL_SIZE = int(os.getenv('SAPLING_POOL_SIZE', 20))
+    SAPLING_CONNECT_TIMEOUT = float(os.getenv('SAPLING_CONNECT_TIMEOUT', 3))
+    SAPLING_READ_TIMEOUT = float(os.getenv('SAPLING_READ_TIMEOUT', 10))
+    SAPLING_CACHE_SIZE = int(os.getenv('SAPLING_CACHE_SIZE', 10000))
+    SAPLING_CACHE_TTL = int(os.getenv('SAPLING_CACHE_TTL', 24 * 3600))
+    # Checks in flight per batch request; the total is capped by UPSTREAM_LIMITS['sapling']
+    SAPLING_BATCH_CONCURRENCY = int(os.getenv('SAPLING_BATCH_CONCURRENCY', 8))
+    GRAMMAR_BATCH_MAX_ITEMS = int(os.getenv('GRAMMAR_BATCH_MAX_ITEMS', 100))
+
+    # Gemini models; each route may override the default model
+    GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+    GEMINI_ROUTE_MODELS = {
+        'conversation': os.getenv('GEMINI_MODEL_CONVERSATION', GEMINI_MODEL),
+        'summary': os.getenv('GEMINI_MODEL_SUMMARY', GEMINI_MODEL),
+        'repair': os.getenv('GEMINI_MODEL_REPAIR', GEMINI_MODEL),
+    }
+
+    # Ask Gemini for schema-constrained JSON (response_mime_type/response_schema)
+    GEMINI_JSON_MODE = os.getenv('GEMINI_JSON_MODE', 'true').lower() == 'true'
+
+    # Estimated token budget for the per-turn conversation context, by level
+    PROMPT_TOKEN_BUDGETS = {'N5': 600, 'N4': 800, 'N3': 1000, 'N2': 1200, 'N1': 1500}
+    PROMPT_TOKEN_BUDGET_DEFAULT = int(os.getenv('PROMPT_TOKEN_BUDGET_DEFAULT', 1000))
+
+    # Rolling summary of exchanges older than the prompt's history window
+    CONVERSATION_SUMMARY_ENABLED = os.getenv('CONVERSATION_SUMMARY_ENABLED', 'true').lower() == 'true'
+    CONVERSATION_SUMMARY_BATCH = int(os.getenv('CONVERSATION_SUMMARY_BATCH', 4))
+    CONVERSATION_SUMMARY_MAX_CHARS = int(os.getenv('CONVERSATION_SUMMARY_MAX_CHARS', 600))
+
+    # Cache of generated turns with at most RESPONSE_CACHE_MAX_HISTORY previous exchanges
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_MAX_HISTORY = int(os.getenv('RESPONSE_CACHE_MAX_HISTORY', 1))
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 5000))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 6 * 3600))
+
+    # Live Gemini chat sessions per user; idle sessions expire after CHAT_SESSION_IDLE_SECONDS
+    CHAT_SESSIONS_ENABLED = os.getenv('CHAT_SESSIONS_ENABLED', 'true').lower() == 'true'
+    CHAT_SESSION_MAX = int(os.getenv('CHAT_SESSION_MAX', 1000))
+    CHAT_SESSION_IDLE_SECONDS = int(os.getenv('CHAT_SESSION_IDLE_SECONDS', 1800))
+
+    # Server processes (set by gunicorn.conf.py)
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', 1))
+
+    # Conversation history storage ('jsonl' or 'sqlite')
+    CONVERSATIONS_DIR = os.getenv('CONVERSATIONS_DIR', 'data/conversations')
+    CONVERSATION_STORE_BACKEND = os.getenv('CONVERSATION_STORE_BACKEND', 'jsonl')
+    CONVERSATION_STORE_FSYNC = os.getenv('CONVERSATION_STORE_FSYNC', 'false').lower() == 'true'
+    # Import legacy *_conversation.json files once when gunicorn starts (otherwise scripts/migrate_conversations.py)
+    CONVERSATION_MIGRATE_ON_STARTUP = os.getenv('CONVERSATION_MIGRATE_ON_STARTUP', 'false').lower() == 'true'
+    # Buffer history appends and write them in batches: seconds between flushes, buffered exchanges forcing one.
+    # The buffer is per process and invisible to other workers, so it is on by default only with one worker.
+    CONVERSATION_WRITE_BEHIND = os.getenv('CONVERSATION_WRITE_BEHIND', str(WEB_WORKERS == 1)).lower() == 'true'
+    CONVERSATION_FLUSH_INTERVAL = float(os.getenv('CONVERSATION_FLUSH_INTERVAL', 0.2))
+    CONVERSATION_FLUSH_BATCH = int(os.getenv('CONVERSATION_FLUSH_BATCH', 256))
+
+    # One turn at a time per user across the workers of one host, with a lock file per user in TURN_LOCK_DIR;
+    # a turn waiting TURN_LOCK_TIMEOUT seconds for the user's earlier turns gets 429
+    TURN_LOCK_DIR = os.getenv('TURN_LOCK_DIR', os.path.join(CONVERSATIONS_DIR, 'locks'))
+    TURN_LOCK_TIMEOUT = float(os.getenv('TURN_LOCK_TIMEOUT', 10))
+
+    # Post-generation pipeline (TTS, history write, grammar check); timeouts in seconds
+    PIPELINE_MAX_WORKERS = int(os.getenv('PIPELINE_MAX_WORKERS', 16))
+    PIPELINE_TTS_TIMEOUT = float(os.getenv('PIPELINE_TTS_TIMEOUT', 8))
+    PIPELINE_HISTORY_TIMEOUT = float(os.getenv('PIPELINE_HISTORY_TIMEOUT', 2))
+    PIPELINE_GRAMMAR_TIMEOUT = float(os.getenv('PIPELINE_GRAMMAR_TIMEOUT', 5))
+
+    # Admission control per upstream: concurrent calls, rate (calls per second, 0 for no limit) and burst.
+    # These are totals for the deployment; each of the WEB_WORKERS processes (set by gunicorn.conf.py) takes a share.
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+    UPSTREAM_LIMITS = {
+        'gemini': {
+            'concurrency': int(os.getenv('GEMINI_MAX_CONCURRENCY', 32)),
+            'rate': float(os.getenv('GEMINI_RATE_LIMIT', 0)),
+            'burst': int(os.getenv('GEMINI_RATE_BURST', 10)),
+        },
+        'tts': {
+            'concurrency': int(os.getenv('TTS_MAX_CONCURRENCY', 32)),
+            'rate': float(os.getenv('TTS_RATE_LIMIT', 0)),
+            'burst': int(os.getenv('TTS_RATE_BURST', 20)),
+        },
+        'sapling': {
+            'concurrency': int(os.getenv('SAPLING_MAX_CONCURRENCY', SAPLING_POOL_SIZE)),
+            'rate': float(os.getenv('SAPLING_RATE_LIMIT', 0)),
+            'burst': int(os.getenv('SAPLING_RATE_BURST', 10)),
+        },
+    }
+    # Calls that may wait for a slot per upstream, for how long (seconds), and slots held or awaited per user
+    ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 64))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 5))
+    ADMISSION_MAX_PER_USER = int(os.getenv('ADMISSION_MAX_PER_USER', 4))
+    # Attempts per upstream call on transient failures, with jittered backoff (seconds)
+    UPSTREAM_RETRY_ATTEMPTS = int(os.getenv('UPSTREAM_RETRY_ATTEMPTS', 3))
+    UPSTREAM_RETRY_BASE_DELAY = float(os.getenv('UPSTREAM_RETRY_BASE_DELAY', 0.25))
+    UPSTREAM_RETRY_MAX_DELAY = float(os.getenv('UPSTREAM_RETRY_MAX_DELAY', 4))
+
+    # Speech recognition engine ('google' or offline 'vosk') and its worker pool; the pool size defaults to
+    # the CPU count for local engines and STT_NETWORK_POOL_SIZE for network ones. A Vosk model recognizes only
+    # VOSK_MODEL_LANGUAGE; requests for other languages are rejected.
+    STT_BACKEND = os.getenv('STT_BACKEND', 'google')
+    VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', 'data/vosk-model-small-ja-0.22')
+    VOSK_MODEL_LANGUAGE = os.getenv('VOSK_MODEL_LANGUAGE', 'ja')
+    STT_POOL_SIZE = int(os.getenv('STT_POOL_SIZE', 0))
+    STT_NETWORK_POOL_SIZE = int(os.getenv('STT_NETWORK_POOL_SIZE', 32))
+
+    # Speech-to-text upload limits, enforced before and during decoding
+    STT_MAX_UPLOAD_BYTES = int(os.getenv('STT_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+    STT_MAX_DURATION_SECONDS = float(os.getenv('STT_MAX_DURATION_SECONDS', 300))
+
+    # Recordings longer than STT_MAX_SEGMENT_SECONDS are split at pauses and the segments recognized concurrently
+    STT_FRAME_MS = int(os.getenv('STT_FRAME_MS', 30))
+    STT_SILENCE_THRESHOLD_DBFS = float(os.getenv('STT_SILENCE_THRESHOLD_DBFS', -45))
+    STT_MIN_SILENCE_MS = int(os.getenv('STT_MIN_SILENCE_MS', 500))
+    STT_MIN_SEGMENT_SECONDS = float(os.getenv('STT_MIN_SEGMENT_SECONDS', 5))
+    STT_MAX_SEGMENT_SECONDS = float(os.getenv('STT_MAX_SEGMENT_SECONDS', 30))
+    STT_SEGMENT_CONCURRENCY = int(os.getenv('STT_SEGMENT_CONCURRENCY', 4))
+
+    # Split text-to-speech input longer than one gTTS request (100 characters) at sentences, synthesized in parallel
+    TTS_CHUNKED = os.getenv('TTS_CHUNKED', 'true').lower() == 'true'
+    TTS_CHUNK_MAX_WORKERS = int(os.getenv('TTS_CHUNK_MAX_WORKERS', 8))
+
+    # Text-to-speech audio cache
+    TTS_CACHE_ENABLED = os.getenv('TTS_CACHE_ENABLED', 'true').lower() == 'true'
+    TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', 'data/audio_cache')
+    TTS_CACHE_MEMORY_BYTES = int(os.getenv('TTS_CACHE_MEMORY_BYTES', 32 * 1024 * 1024))
+    TTS_CACHE_DISK_BYTES = int(os.getenv('TTS_CACHE_DISK_BYTES', 512 * 1024 * 1024))
+    TTS_CACHE_MAX_AGE = int(os.getenv('TTS_CACHE_MAX_AGE', 7 * 24 * 3600))
+    # Seconds between re-scans of the disk tier, which other workers write to as well
+    TTS_CACHE_RESCAN_SECONDS = int(os.getenv('TTS_CACHE_RESCAN_SECONDS', 300))
+
+    # Binary audio transport: download chunk size, and whether responses still inline base64 audio by default
+    AUDIO_STREAM_CHUNK_BYTES = int(os.getenv('AUDIO_STREAM_CHUNK_BYTES', 64 * 1024))
+    INLINE_AUDIO_DEFAULT = os.getenv('INLINE_AUDIO_DEFAULT', 'true').lower() == 'true'
+
+    # Speech output encoding when a request names none ('mp3', 'mp3-low' or 'opus') and the compact formats' bitrates
+    TTS_AUDIO_FORMAT = os.getenv('TTS_AUDIO_FORMAT', 'mp3')
+    TTS_MP3_LOW_BITRATE = os.getenv('TTS_MP3_LOW_BITRATE', '24k')
+    TTS_OPUS_BITRATE = os.getenv('TTS_OPUS_BITRATE', '16k')
     
     # Default prompts for Gemini
     DEFAULT_JAPANESE_CONVERSATION_PROMPT = """
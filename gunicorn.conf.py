@@ -0,0 +1,73 @@
+"""
+Gunicorn settings for production serving
+
+    gunicorn -c gunicorn.conf.py
+
+Environment:
+    PORT                  Port to bind (default 9000)
+    SERVER_MODE           'sync' (Flask on threaded workers, default) or 'async' (aiohttp workers)
+    WEB_WORKERS           Worker processes (default 2 per CPU core + 1)
+    WEB_THREADS           Threads per sync worker (default 4)
+    WEB_TIMEOUT           Seconds before a silent worker is restarted (default 120)
+    WEB_GRACEFUL_TIMEOUT  Seconds workers get to finish requests on shutdown (default 30)
+    WEB_MAX_REQUESTS      Recycle a worker after this many requests (default 0, never)
+    WEB_PIDFILE           Master PID file used by scripts/graceful_reload.sh
+
+Graceful restart: `kill -HUP <master>` replaces workers without dropping
+requests, but with preload_app they fork from the code already loaded in the
+master. To deploy new code with zero downtime use scripts/graceful_reload.sh.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 9000)}"
+
+if os.environ.get('SERVER_MODE', 'sync') == 'async':
+    wsgi_app = 'async_app:app_factory'
+    worker_class = 'aiohttp.GunicornWebWorker'
+else:
+    wsgi_app = 'wsgi:app'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WEB_THREADS', 4))
+
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Upstream admission limits are split between the workers (Config.WEB_WORKERS)
+os.environ['WEB_WORKERS'] = str(workers)
+preload_app = True
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+keepalive = 5
+pidfile = os.environ.get('WEB_PIDFILE', '/tmp/jfix-ai_service.pid')
+accesslog = '-'
+
+
+def _format_timings(timings):
+    return ", ".join(
+        f"{name}={'failed' if seconds is None else f'{seconds * 1000:.0f}ms'}"
+        for name, seconds in timings.items()
+    )
+
+
+def on_starting(server):
+    """Import the services' heavy dependencies once in the master, and migrate legacy history if asked to"""
+    from config import Config
+    from services.warmup import preload_modules
+
+    server.log.info(f"Preloaded modules: {_format_timings(preload_modules())}")
+
+    if Config.CONVERSATION_MIGRATE_ON_STARTUP:
+        from services.conversation_store import create_conversation_store, migrate_legacy_conversations
+
+        files, exchanges, failed = migrate_legacy_conversations(create_conversation_store())
+        server.log.info(f"Migrated {exchanges} exchanges from {files} legacy files ({failed} failed)")
+
+
+def post_fork(server, worker):
+    """Warm this worker's shared clients in the background; /ready reports progress"""
+    from services.warmup import start_warm_up
+
+    start_warm_up(
+        lambda timings: server.log.info(f"Worker {worker.pid} warmed up: {_format_timings(timings)}")
+    )
@@ -0,0 +1,75 @@
+from pydantic import BaseModel, Field
+from utils.json_stream import loads_tolerant
+
+
+class Correction(BaseModel):
+    """Feedback on the learner's sentence"""
+    hasError: bool = False
+    original: str = ""
+    suggestion: str = ""
+    explanation: str = ""
+
+
+class VocabularyItem(BaseModel):
+    """A word worth noting from the reply"""
+    word: str
+    reading: str = ""
+    meaning: str = ""
+
+
+class ConversationTurn(BaseModel):
+    """Structured response generated for one conversation turn"""
+    correction: Correction = Field(default_factory=Correction)
+    reply: str
+    vocabulary: list[VocabularyItem] = Field(default_factory=list)
+
+
+# Response schema for Gemini's JSON mode. Gemini's schema format has no
+# defaults, so it is spelled out here rather than derived from the models.
+CONVERSATION_TURN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "correction": {
+            "type": "object",
+            "properties": {
+                "hasError": {"type": "boolean"},
+                "original": {"type": "string"},
+                "suggestion": {"type": "string"},
+                "explanation": {"type": "string"}
+            },
+            "required": ["hasError", "original", "suggestion", "explanation"]
+        },
+        "reply": {"type": "string"},
+        "vocabulary": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "word": {"type": "string"},
+                    "reading": {"type": "string"},
+                    "meaning": {"type": "string"}
+                },
+                "required": ["word", "reading", "meaning"]
+            }
+        }
+    },
+    "required": ["correction", "reply", "vocabulary"]
+}
+
+
+def parse_conversation_turn(text):
+    """
+    Parse and validate the model output for one conversation turn
+
+    Args:
+        text (str): Raw model output
+
+    Returns:
+        tuple: (response dict, whether the text needed repairing)
+
+    Raises:
+        ValueError: If no valid turn can be recovered (pydantic's
+            ValidationError is a ValueError)
+    """
+    data, repaired = loads_tolerant(text)
+    return ConversationTurn.model_validate(data).model_dump(), repaired
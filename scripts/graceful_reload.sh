@@ -0,0 +1,56 @@
+#!/bin/bash
+# Zero-downtime code reload for a server started with `gunicorn -c gunicorn.conf.py`.
+# USR2 starts a new master (and workers) from the new code next to the old one;
+# once every new worker reports ready, TERM lets the old master finish in-flight
+# requests and exit.
+PIDFILE=${WEB_PIDFILE:-/tmp/jfix-ai_service.pid}
+OLD_PID=$(cat "$PIDFILE") || exit 1
+
+kill -USR2 "$OLD_PID" || exit 1
+
+# Print "<master pid> <worker pid> <status>" from one /ready response
+probe() {
+    curl -s --max-time 2 "http://127.0.0.1:${PORT:-9000}/ready" | python3 -c '
+import json, sys
+report = json.load(sys.stdin)
+print(report.get("master_pid"), report.get("pid"), report.get("status"))' 2>/dev/null
+}
+
+# The new master writes $PIDFILE.2 and takes over $PIDFILE once the old one exits.
+# Both generations accept on the same socket, so keep probing /ready until every
+# worker of the new master has answered "ready" itself.
+NEW_PID=""
+READY_WORKERS=""
+READY=""
+for _ in $(seq 1 600); do
+    if [ -z "$NEW_PID" ] && [ -f "$PIDFILE.2" ]; then
+        NEW_PID=$(cat "$PIDFILE.2")
+    fi
+
+    if [ -n "$NEW_PID" ]; then
+        read -r MASTER WORKER STATUS <<< "$(probe)"
+        if [ "$MASTER" = "$NEW_PID" ] && [ "$STATUS" = "ready" ]; then
+            case " $READY_WORKERS " in
+                *" $WORKER "*) ;;
+                *) READY_WORKERS="$READY_WORKERS $WORKER" ;;
+            esac
+        fi
+
+        EXPECTED=$(pgrep -P "$NEW_PID" | wc -l)
+        if [ "$EXPECTED" -gt 0 ] && [ "$(echo $READY_WORKERS | wc -w)" -ge "$EXPECTED" ]; then
+            READY=1
+            break
+        fi
+    fi
+    sleep 0.1
+done
+
+if [ -z "$READY" ]; then
+    # Stop the half-started generation so only the old code keeps serving
+    [ -n "$NEW_PID" ] && kill -TERM "$NEW_PID"
+    echo "New master ${NEW_PID:-(not started)} did not become ready; old master $OLD_PID left running" >&2
+    exit 1
+fi
+
+kill -TERM "$OLD_PID"
+echo "Reloaded: $NEW_PID replaced $OLD_PID"
@@ -0,0 +1,43 @@
+"""
+Migrate legacy pretty-printed conversation JSON files into the configured store
+
+Usage:
+    python3 scripts/migrate_conversations.py [--backend jsonl|sqlite] [--dir data/conversations]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from services.conversation_store import create_conversation_store, migrate_legacy_conversations
+
+def migrate(backend, base_dir):
+    """
+    Import every legacy history file found in base_dir
+
+    Args:
+        backend (str): Target store backend
+        base_dir (str): Directory holding conversation data
+
+    Returns:
+        tuple: (files migrated, exchanges migrated, files failed)
+    """
+    return migrate_legacy_conversations(create_conversation_store(backend, base_dir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', default=Config.CONVERSATION_STORE_BACKEND,
+                        choices=['jsonl', 'sqlite'])
+    parser.add_argument('--dir', default=Config.CONVERSATIONS_DIR)
+    args = parser.parse_args()
+
+    files, exchanges, failed = migrate(args.backend, args.dir)
+    print(f"Migrated {exchanges} exchanges from {files} files ({failed} failed)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Report where application startup time goes
+
+Imports an entry point in a fresh interpreter under `python -X importtime`,
+creates the app, and prints the slowest imports and the import time per
+top-level package. Run it after adding a dependency to check it is not
+loaded eagerly.
+
+Usage:
+    python3 scripts/startup_report.py [--entry app|async_app] [--top 20] [--preload] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    'app': "from app import create_app; create_app()",
+    'async_app': "from async_app import create_async_app; create_async_app()",
+}
+
+# Prints wall-clock time of the entry point to stdout; importtime goes to stderr
+TIMED_STARTUP = """
+import time
+started = time.perf_counter()
+{preload}
+{entry}
+print(time.perf_counter() - started)
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds) per import
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            continue
+        imports.append((fields[2].strip(), self_us, cumulative_us))
+    return imports
+
+
+def measure(entry, preload):
+    """
+    Start the entry point in a fresh interpreter
+
+    Returns:
+        tuple: (wall seconds, parsed imports)
+    """
+    preload_code = "from services.warmup import preload_modules; preload_modules()" if preload else ""
+    code = TIMED_STARTUP.format(preload=preload_code, entry=ENTRY_POINTS[entry])
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{process.stderr[-2000:]}")
+    return float(process.stdout.strip().splitlines()[-1]), parse_importtime(process.stderr)
+
+
+def build_report(entry, seconds, imports, top):
+    """Summarize slowest modules and per-package totals"""
+    packages = {}
+    for module, self_us, _ in imports:
+        package = module.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    slowest = sorted(imports, key=lambda item: item[2], reverse=True)[:top]
+    return {
+        "entry": entry,
+        "startup_seconds": seconds,
+        "import_seconds": sum(self_us for _, self_us, _ in imports) / 1e6,
+        "modules_imported": len(imports),
+        "slowest_imports": [
+            {"module": module, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000}
+            for module, self_us, cumulative_us in slowest
+        ],
+        "packages": [
+            {"package": package, "self_ms": total / 1000}
+            for package, total in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ]
+    }
+
+
+def print_report(report):
+    print(f"Entry point:      {report['entry']}")
+    print(f"Startup time:     {report['startup_seconds'] * 1000:.0f} ms")
+    print(f"Import time:      {report['import_seconds'] * 1000:.0f} ms "
+          f"({report['modules_imported']} modules)")
+
+    print("\nSlowest imports (cumulative):")
+    for item in report['slowest_imports']:
+        print(f"  {item['cumulative_ms']:9.1f} ms  {item['module']}")
+
+    print("\nImport time by package (self):")
+    for item in report['packages']:
+        print(f"  {item['self_ms']:9.1f} ms  {item['package']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup import-time report")
+    parser.add_argument('--entry', choices=sorted(ENTRY_POINTS), default='app')
+    parser.add_argument('--top', type=int, default=20, help="Number of modules and packages to list")
+    parser.add_argument('--preload', action='store_true',
+                        help="Also import the heavy dependencies, as the gunicorn master does")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    seconds, imports = measure(args.entry, args.preload)
+    report = build_report(args.entry, seconds, imports, args.top)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
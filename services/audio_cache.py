@@ -0,0 +1,351 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+
+from cachetools import TTLCache
+from config import Config
+from utils.audio import AUDIO_OUTPUT_FORMATS
+from utils.metrics import register_stats
+
+# Keys are SHA-256 hex digests, followed by "-<format>" for encodings other than
+# the MP3 gTTS returns; anything else never names a cache file
+KEY_PATTERN = re.compile(
+    r'^[0-9a-f]{64}(?:-(%s))?$' % '|'.join(re.escape(name) for name in AUDIO_OUTPUT_FORMATS if name != 'mp3')
+)
+
+# Eviction frees space down to this share of the disk budget, so a full cache
+# is not scanned again on the very next write
+EVICT_LOW_WATER = 0.9
+
+
+def normalize_text(text):
+    """Normalize text so trivially different spellings share one cache entry"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return " ".join(text.split())
+
+
+class AudioCache:
+    """
+    Content-addressed two-tier (memory + disk) cache for synthesized speech
+
+    Entries in both tiers expire once unused for max_age. The size of the disk
+    tier is tracked per process; gunicorn workers sharing the directory only
+    see each other's writes when eviction re-scans it, which happens when the
+    budget is exceeded and at least every TTS_CACHE_RESCAN_SECONDS.
+    """
+
+    def __init__(self, cache_dir=None, max_memory_bytes=None, max_disk_bytes=None, max_age=None):
+        """
+        Initialize the cache
+
+        Args:
+            cache_dir (str): Directory for the on-disk tier
+            max_memory_bytes (int): Size budget of the in-memory LRU tier
+            max_disk_bytes (int): Size budget of the on-disk tier
+            max_age (int): Seconds an entry may stay unused before it expires
+        """
+        self.cache_dir = cache_dir or Config.TTS_CACHE_DIR
+        self.max_disk_bytes = max_disk_bytes or Config.TTS_CACHE_DISK_BYTES
+        self.max_age = max_age or Config.TTS_CACHE_MAX_AGE
+
+        self._memory = TTLCache(
+            maxsize=max_memory_bytes or Config.TTS_CACHE_MEMORY_BYTES,
+            ttl=self.max_age,
+            getsizeof=len
+        )
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._evicting = False
+        self._last_scan = time.monotonic()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+
+    @staticmethod
+    def make_key(text, language='ja', slow=False, audio_format='mp3'):
+        """
+        Build the content address for a synthesis request
+
+        Args:
+            text (str): Text to synthesize
+            language (str): Language code
+            slow (bool): Whether slow speech was requested
+            audio_format (str): Encoding of the audio (a key of AUDIO_OUTPUT_FORMATS)
+
+        Returns:
+            str: Hex digest identifying the audio, suffixed with the encoding unless it is MP3
+        """
+        material = "\x00".join([
+            normalize_text(text),
+            language or '',
+            '1' if slow else '0',
+            # Empty field kept so MP3 keys stay those of existing cache entries
+            ''
+        ])
+        digest = hashlib.sha256(material.encode('utf-8')).hexdigest()
+        return digest if audio_format == 'mp3' else f"{digest}-{audio_format}"
+
+    @staticmethod
+    def is_valid_key(key):
+        """Check that a client-supplied key is a well-formed content address"""
+        return bool(key) and KEY_PATTERN.match(key) is not None
+
+    @staticmethod
+    def format_of(key):
+        """Encoding (a key of AUDIO_OUTPUT_FORMATS) of the audio stored under a valid key"""
+        return KEY_PATTERN.match(key).group(1) or 'mp3'
+
+    def _path_for(self, key):
+        """Get the on-disk path for a cache key, with the file suffix of its encoding"""
+        extension = AUDIO_OUTPUT_FORMATS[self.format_of(key)]['extension']
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{extension}")
+
+    def _scan_disk(self):
+        """Yield (path, size, mtime) for every file in the on-disk tier"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _remember(self, key, data):
+        """Put data in the memory tier; callers must hold the lock"""
+        try:
+            self._memory[key] = data
+        except ValueError:
+            # Larger than the whole memory budget, keep it on disk only
+            pass
+
+    def get(self, key):
+        """
+        Look up audio by key
+
+        Args:
+            key (str): Key produced by make_key
+
+        Returns:
+            bytes: Cached audio, or None on a miss
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self.memory_hits += 1
+                # Re-insert so the entry's TTL runs from its last use, not its creation
+                self._memory[key] = data
+                return data
+
+        path = self._path_for(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.max_age:
+                self._remove(path, stat.st_size)
+                data = None
+            else:
+                with open(path, 'rb') as audio_file:
+                    data = audio_file.read()
+                # Refresh mtime so the disk tier evicts least recently used first
+                os.utime(path)
+        except OSError:
+            data = None
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, data)
+        return data
+
+    def open(self, key):
+        """
+        Open cached audio for streaming without loading disk entries into memory
+
+        Args:
+            key (str): Key produced by make_key
+
+        Returns:
+            tuple: (binary file object the caller must close, size in bytes), or None on a miss
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self.memory_hits += 1
+                self._memory[key] = data
+                return io.BytesIO(data), len(data)
+
+        path = self._path_for(key)
+        try:
+            audio_file = open(path, 'rb')
+        except OSError:
+            audio_file = None
+
+        if audio_file is not None:
+            stat = os.fstat(audio_file.fileno())
+            if time.time() - stat.st_mtime > self.max_age:
+                audio_file.close()
+                self._remove(path, stat.st_size)
+                audio_file = None
+            else:
+                os.utime(path)
+
+        with self._lock:
+            if audio_file is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        return audio_file, stat.st_size
+
+    def put(self, key, data):
+        """
+        Store audio under key in both tiers
+
+        Args:
+            key (str): Key produced by make_key
+            data (bytes): Audio bytes
+        """
+        with self._lock:
+            self._remember(key, data)
+
+        path = self._path_for(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            existing = os.path.getsize(path) if os.path.exists(path) else 0
+            # Write to a sibling temp file and rename so readers never see partial audio
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as audio_file:
+                audio_file.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing audio cache entry: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - existing
+            due = (
+                self._disk_bytes > self.max_disk_bytes
+                or time.monotonic() - self._last_scan > Config.TTS_CACHE_RESCAN_SECONDS
+            )
+
+        if due:
+            self._schedule_evict()
+
+    def _schedule_evict(self):
+        """Run evict on a background thread unless a run is already in progress"""
+        with self._lock:
+            if self._evicting:
+                return
+            self._evicting = True
+            self._last_scan = time.monotonic()
+
+        def run():
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"Error evicting audio cache entries: {e}")
+            finally:
+                with self._lock:
+                    self._evicting = False
+
+        threading.Thread(target=run, name="audio-cache-evict", daemon=True).start()
+
+    @staticmethod
+    def _unlink(path):
+        """Delete a file, returning whether it was there"""
+        try:
+            os.unlink(path)
+        except OSError:
+            return False
+        return True
+
+    def _remove(self, path, size):
+        """Delete one file from the on-disk tier"""
+        if not self._unlink(path):
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def evict(self):
+        """
+        Drop expired entries, then least recently used ones once over the disk budget
+
+        The scan also resets the tracked disk size to what is actually in the
+        directory, including entries written by other processes. Eviction
+        continues down to EVICT_LOW_WATER of the budget.
+        """
+        now = time.time()
+        entries = []
+        total = 0
+        for path, size, mtime in self._scan_disk():
+            if path.endswith('.tmp'):
+                # Leftover from an interrupted write; recent ones may still be in progress
+                if now - mtime > 60:
+                    self._unlink(path)
+            elif now - mtime > self.max_age:
+                self._unlink(path)
+            else:
+                entries.append((mtime, path, size))
+                total += size
+
+        with self._lock:
+            self._disk_bytes = total
+            if total <= self.max_disk_bytes:
+                return
+
+        entries.sort()
+        low_water = self.max_disk_bytes * EVICT_LOW_WATER
+        for _, path, size in entries:
+            with self._lock:
+                if self._disk_bytes <= low_water:
+                    break
+            self._remove(path, size)
+
+    def stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: Hit/miss counters and tier sizes
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_bytes": self._memory.currsize,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes
+            }
+
+
+_audio_cache = None
+_audio_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    """Get the process-wide audio cache, creating it on first use"""
+    global _audio_cache
+    if _audio_cache is None:
+        with _audio_cache_lock:
+            if _audio_cache is None:
+                _audio_cache = AudioCache()
+    return _audio_cache
+
+
+register_stats(
+    'audio_cache', lambda: _audio_cache.stats() if _audio_cache is not None else {},
+    counters=('memory_hits', 'disk_hits', 'misses')
+)
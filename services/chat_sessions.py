@@ -0,0 +1,120 @@
+import threading
+from cachetools import TTLCache
+from config import Config
+
+
+class ConversationSession:
+    """A live Gemini chat for one user and the last stored exchange it has seen"""
+
+    def __init__(self, chat, last_timestamp=None, topic=None, exchanges=0):
+        """
+        Args:
+            chat (genai.ChatSession): Chat holding the structured history
+            last_timestamp (str): Timestamp of the newest exchange in the chat
+            topic (str): Topic of the newest exchange
+            exchanges (int): Number of exchanges in the chat history
+        """
+        self.chat = chat
+        self.last_timestamp = last_timestamp
+        self.topic = topic
+        self.exchanges = exchanges
+        self.turn_recorded = False
+        self.lock = threading.Lock()
+
+    def record(self, exchange):
+        """Note the exchange the current turn produced"""
+        self.last_timestamp = exchange.get('timestamp')
+        self.topic = exchange.get('topic')
+        self.exchanges += 1
+        self.turn_recorded = True
+
+
+class ChatSessionManager:
+    """
+    Live chat sessions keyed by user_id
+
+    Sessions expire after Config.CHAT_SESSION_IDLE_SECONDS without a turn and
+    the least recently used ones are dropped beyond Config.CHAT_SESSION_MAX.
+    A session is rebuilt from the conversation store when it is missing, when
+    another worker has stored a newer exchange, or when its history has grown
+    past max_exchanges (so older turns are replaced by the rolling summary).
+    """
+
+    def __init__(self, max_exchanges, max_sessions=None, idle_seconds=None):
+        """
+        Args:
+            max_exchanges (int): Exchanges a session may hold before it is rebuilt
+            max_sessions (int): Maximum number of live sessions
+            idle_seconds (float): Seconds an unused session is kept
+        """
+        self.max_exchanges = max_exchanges
+        self._sessions = TTLCache(
+            maxsize=max_sessions or Config.CHAT_SESSION_MAX,
+            ttl=idle_seconds or Config.CHAT_SESSION_IDLE_SECONDS
+        )
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rebuilt": 0, "busy": 0}
+
+    def acquire(self, user_id, latest_timestamp, create):
+        """
+        Get a user's session for one turn
+
+        Args:
+            user_id (str): Unique identifier for the user
+            latest_timestamp (str): Timestamp of the user's newest stored exchange
+            create (callable): Builds a ConversationSession from the store
+
+        Returns:
+            ConversationSession: Session locked for this turn, or None if another
+                turn of the same user is using it
+        """
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None:
+                # Re-inserting restarts the idle timer
+                self._sessions[user_id] = session
+
+        if session is not None and not session.lock.acquire(blocking=False):
+            self._count("busy")
+            return None
+
+        if session is None:
+            self._count("misses")
+        elif session.last_timestamp != latest_timestamp or session.exchanges > self.max_exchanges:
+            self._count("rebuilt")
+            session.lock.release()
+            session = None
+        else:
+            self._count("hits")
+            return session
+
+        session = create()
+        session.lock.acquire()
+        with self._lock:
+            self._sessions[user_id] = session
+        return session
+
+    def release(self, user_id, session):
+        """
+        Unlock a session after its turn
+
+        A session whose turn did not produce an exchange (an error or
+        unparseable reply) is dropped so the next turn rebuilds it.
+        """
+        if session is None:
+            return
+        if not session.turn_recorded:
+            with self._lock:
+                if self._sessions.get(user_id) is session:
+                    del self._sessions[user_id]
+        session.turn_recorded = False
+        session.lock.release()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Session counters and the number of live sessions"""
+        with self._lock:
+            return dict(self._stats, sessions=len(self._sessions))
@@ -0,0 +1,536 @@
+import glob
+import json
+import os
+import sqlite3
+import tempfile
+import atexit
+import threading
+from config import Config
+from utils.helpers import ShardedLocks
+from utils.metrics import register_stats
+
+# File name suffix of the pre-store pretty-printed JSON histories
+LEGACY_SUFFIX = "_conversation.json"
+
+
+class ConversationStore:
+    """Base interface for persisting per-user conversation exchanges"""
+
+    def __init__(self, base_dir=None):
+        """
+        Initialize the store
+
+        Args:
+            base_dir (str): Directory holding conversation data
+        """
+        self.base_dir = base_dir or Config.CONVERSATIONS_DIR
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def load(self, user_id, limit=None):
+        """
+        Load the most recent exchanges for a user, oldest first
+
+        Args:
+            user_id (str): Unique identifier for the user
+            limit (int): Maximum number of exchanges to return (None for all)
+
+        Returns:
+            list: Conversation exchanges
+        """
+        raise NotImplementedError
+
+    def append(self, user_id, exchange):
+        """
+        Append one exchange to a user's history
+
+        Args:
+            user_id (str): Unique identifier for the user
+            exchange (dict): Conversation exchange
+        """
+        raise NotImplementedError
+
+    def append_many(self, entries):
+        """
+        Append several exchanges, possibly of different users, in as few writes as possible
+
+        Args:
+            entries (list): (user_id, exchange) pairs in the order they happened
+        """
+        for user_id, exchange in entries:
+            self.append(user_id, exchange)
+
+    def replace(self, user_id, exchanges):
+        """
+        Atomically replace a user's whole history
+
+        Args:
+            user_id (str): Unique identifier for the user
+            exchanges (list): Conversation exchanges, oldest first
+        """
+        raise NotImplementedError
+
+    def load_summary(self, user_id):
+        """
+        Load the rolling summary of a user's older exchanges
+
+        Args:
+            user_id (str): Unique identifier for the user
+
+        Returns:
+            dict: Summary record, or None if there is none yet
+        """
+        raise NotImplementedError
+
+    def save_summary(self, user_id, summary):
+        """
+        Store the rolling summary of a user's older exchanges
+
+        Args:
+            user_id (str): Unique identifier for the user
+            summary (dict): Summary record
+        """
+        raise NotImplementedError
+
+    def legacy_file_path(self, user_id):
+        """Get the path of the pre-store pretty-printed JSON history file"""
+        return os.path.join(self.base_dir, f"{user_id}{LEGACY_SUFFIX}")
+
+    def migrate_legacy(self, user_id):
+        """
+        Import a legacy JSON history file into this store
+
+        The legacy file is renamed to ``*.json.migrated`` afterwards so the
+        import happens once. Requests never migrate: run
+        migrate_legacy_conversations (scripts/migrate_conversations.py) or set
+        Config.CONVERSATION_MIGRATE_ON_STARTUP.
+
+        Args:
+            user_id (str): Unique identifier for the user
+
+        Returns:
+            int: Number of exchanges imported (0 if there was nothing to do)
+        """
+        legacy_path = self.legacy_file_path(user_id)
+        if not os.path.exists(legacy_path):
+            return 0
+
+        with open(legacy_path, 'r', encoding='utf-8') as file:
+            exchanges = json.load(file)
+
+        self.replace(user_id, exchanges)
+        os.replace(legacy_path, legacy_path + '.migrated')
+        return len(exchanges)
+
+
+class JsonlConversationStore(ConversationStore):
+    """Append-only JSON-lines log per user with tail reads"""
+
+    TAIL_BLOCK_SIZE = 8192
+
+    def _get_file_path(self, user_id):
+        """Get the log file path for a user's conversation history"""
+        return os.path.join(self.base_dir, f"{user_id}_conversation.jsonl")
+
+    def _tail_lines(self, file_path, count):
+        """Read the last ``count`` lines by scanning backwards from the end of the file"""
+        with open(file_path, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            position = file.tell()
+            buffer = b''
+            # One extra newline guarantees the first kept line is complete
+            while position > 0 and buffer.count(b'\n') <= count:
+                read_size = min(self.TAIL_BLOCK_SIZE, position)
+                position -= read_size
+                file.seek(position)
+                buffer = file.read(read_size) + buffer
+
+        lines = buffer.split(b'\n')
+        if position > 0:
+            lines = lines[1:]
+        lines = [line for line in lines if line.strip()]
+        return lines[-count:]
+
+    def _decode_lines(self, lines):
+        """Parse log lines, skipping a torn trailing write"""
+        exchanges = []
+        for line in lines:
+            try:
+                exchanges.append(json.loads(line))
+            except ValueError:
+                print("Skipping corrupt conversation log line")
+        return exchanges
+
+    def load(self, user_id, limit=None):
+        file_path = self._get_file_path(user_id)
+
+        if not os.path.exists(file_path):
+            return []
+
+        if limit is None:
+            with open(file_path, 'rb') as file:
+                lines = [line for line in file if line.strip()]
+        elif limit <= 0:
+            return []
+        else:
+            lines = self._tail_lines(file_path, limit)
+
+        return self._decode_lines(lines)
+
+    def append(self, user_id, exchange):
+        self._append_lines(user_id, [exchange])
+
+    def append_many(self, entries):
+        by_user = {}
+        for user_id, exchange in entries:
+            by_user.setdefault(user_id, []).append(exchange)
+        for user_id, exchanges in by_user.items():
+            self._append_lines(user_id, exchanges)
+
+    def _append_lines(self, user_id, exchanges):
+        """Append exchanges to a user's log in one write"""
+        data = "".join(json.dumps(exchange, ensure_ascii=False) + "\n" for exchange in exchanges).encode('utf-8')
+
+        # A single O_APPEND write keeps concurrent appends from interleaving
+        fd = os.open(self._get_file_path(user_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            if Config.CONVERSATION_STORE_FSYNC:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _get_summary_path(self, user_id):
+        """Get the summary file path for a user"""
+        return os.path.join(self.base_dir, f"{user_id}_summary.json")
+
+    def _write_atomically(self, file_path, content):
+        """Write a file through a temporary file so readers never see a partial write"""
+        fd, temp_path = tempfile.mkstemp(dir=self.base_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, file_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def replace(self, user_id, exchanges):
+        self._write_atomically(
+            self._get_file_path(user_id),
+            "".join(json.dumps(exchange, ensure_ascii=False) + "\n" for exchange in exchanges)
+        )
+
+    def load_summary(self, user_id):
+        try:
+            with open(self._get_summary_path(user_id), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save_summary(self, user_id, summary):
+        self._write_atomically(self._get_summary_path(user_id), json.dumps(summary, ensure_ascii=False))
+
+
+class SqliteConversationStore(ConversationStore):
+    """Embedded SQLite store with an index on (user_id, id) for tail reads"""
+
+    def __init__(self, base_dir=None, db_path=None):
+        super().__init__(base_dir)
+        self.db_path = db_path or os.path.join(self.base_dir, "conversations.db")
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS exchanges ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "user_id TEXT NOT NULL, "
+            "data TEXT NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_exchanges_user ON exchanges (user_id, id)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "user_id TEXT PRIMARY KEY, "
+            "data TEXT NOT NULL)"
+        )
+        connection.commit()
+
+    def _connection(self):
+        """Get this thread's connection (sqlite3 connections are not shared across threads)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def load(self, user_id, limit=None):
+        connection = self._connection()
+
+        if limit is None:
+            rows = connection.execute(
+                "SELECT data FROM exchanges WHERE user_id = ? ORDER BY id",
+                (user_id,)
+            ).fetchall()
+        elif limit <= 0:
+            return []
+        else:
+            rows = connection.execute(
+                "SELECT data FROM exchanges WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+            rows.reverse()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def append(self, user_id, exchange):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT INTO exchanges (user_id, data) VALUES (?, ?)",
+                (user_id, json.dumps(exchange, ensure_ascii=False))
+            )
+
+    def append_many(self, entries):
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO exchanges (user_id, data) VALUES (?, ?)",
+                [(user_id, json.dumps(exchange, ensure_ascii=False)) for user_id, exchange in entries]
+            )
+
+    def replace(self, user_id, exchanges):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM exchanges WHERE user_id = ?", (user_id,))
+            connection.executemany(
+                "INSERT INTO exchanges (user_id, data) VALUES (?, ?)",
+                [(user_id, json.dumps(exchange, ensure_ascii=False)) for exchange in exchanges]
+            )
+
+    def load_summary(self, user_id):
+        row = self._connection().execute(
+            "SELECT data FROM summaries WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_summary(self, user_id, summary):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO summaries (user_id, data) VALUES (?, ?)",
+                (user_id, json.dumps(summary, ensure_ascii=False))
+            )
+
+
+class WriteBehindConversationStore:
+    """
+    Buffer appended exchanges in memory and flush them to a store in batches
+
+    Turns only add their exchange to the buffer; a background thread writes
+    everything buffered every Config.CONVERSATION_FLUSH_INTERVAL seconds, or
+    sooner once Config.CONVERSATION_FLUSH_BATCH exchanges are waiting, with one
+    write per user (one transaction for SQLite). Reads see buffered exchanges,
+    and the buffer is flushed when the process exits.
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store (ConversationStore): Store the exchanges are flushed to
+        """
+        self.store = store
+        # user_id -> exchanges not yet written, oldest first
+        self._pending = {}
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        # Held while a user's exchanges move from the buffer to the store, and while reading them
+        self._user_locks = ShardedLocks(64)
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        self._stats = {"buffered": 0, "flushes": 0, "flushed": 0, "flush_errors": 0}
+        atexit.register(self.flush)
+
+    def __getattr__(self, name):
+        # Everything but the history reads and writes goes straight to the store
+        return getattr(self.store, name)
+
+    def _start_flusher(self):
+        """Start the background flush thread on first use"""
+        if self._flusher is not None:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name='conversation-flush', daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_loop(self):
+        """Flush the buffer periodically, or early when it fills up"""
+        while True:
+            self._wake.wait(Config.CONVERSATION_FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def load(self, user_id, limit=None):
+        with self._user_locks.hold(user_id):
+            exchanges = self.store.load(user_id, limit)
+            with self._pending_lock:
+                pending = list(self._pending.get(user_id, ()))
+        if not pending:
+            return exchanges
+        exchanges = exchanges + pending
+        if limit is None:
+            return exchanges
+        return exchanges[-limit:] if limit > 0 else []
+
+    def append(self, user_id, exchange):
+        with self._pending_lock:
+            self._pending.setdefault(user_id, []).append(exchange)
+            self._pending_count += 1
+            self._stats["buffered"] += 1
+            full = self._pending_count >= Config.CONVERSATION_FLUSH_BATCH
+        self._start_flusher()
+        if full:
+            self._wake.set()
+
+    def append_many(self, entries):
+        for user_id, exchange in entries:
+            self.append(user_id, exchange)
+
+    def replace(self, user_id, exchanges):
+        # Buffered exchanges predate the new history
+        with self._user_locks.hold(user_id):
+            with self._pending_lock:
+                self._pending_count -= len(self._pending.pop(user_id, ()))
+            self.store.replace(user_id, exchanges)
+
+    def flush(self):
+        """Write every buffered exchange to the store"""
+        with self._flush_lock:
+            with self._pending_lock:
+                users = list(self._pending)
+            if not users:
+                return
+
+            locks = self._user_locks.locks_for(users)
+            for lock in locks:
+                lock.acquire()
+            try:
+                with self._pending_lock:
+                    taken = {user_id: len(self._pending.get(user_id, ())) for user_id in users}
+                    entries = [
+                        (user_id, exchange)
+                        for user_id in users
+                        for exchange in self._pending.get(user_id, ())[:taken[user_id]]
+                    ]
+                if not entries:
+                    return
+                try:
+                    self.store.append_many(entries)
+                except Exception as e:
+                    # Kept in the buffer and retried on the next flush
+                    print(f"Error flushing conversation history: {e}")
+                    with self._pending_lock:
+                        self._stats["flush_errors"] += 1
+                    return
+
+                with self._pending_lock:
+                    for user_id, count in taken.items():
+                        remaining = self._pending.get(user_id, [])[count:]
+                        if remaining:
+                            self._pending[user_id] = remaining
+                        else:
+                            self._pending.pop(user_id, None)
+                    self._pending_count -= len(entries)
+                    self._stats["flushes"] += 1
+                    self._stats["flushed"] += len(entries)
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+    def stats(self):
+        """Buffer and flush counters"""
+        with self._pending_lock:
+            return dict(self._stats, pending=self._pending_count)
+
+
+STORE_BACKENDS = {
+    'jsonl': JsonlConversationStore,
+    'sqlite': SqliteConversationStore,
+}
+
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+
+def create_conversation_store(backend=None, base_dir=None):
+    """
+    Create a conversation store
+
+    Args:
+        backend (str): Backend name ('jsonl' or 'sqlite'), defaults to config
+        base_dir (str): Directory holding conversation data
+
+    Returns:
+        ConversationStore: Store instance
+    """
+    backend = backend or Config.CONVERSATION_STORE_BACKEND
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown conversation store backend: {backend}")
+    return STORE_BACKENDS[backend](base_dir)
+
+
+def migrate_legacy_conversations(store):
+    """
+    Import every legacy history file found in a store's directory
+
+    Args:
+        store (ConversationStore): Store to import into
+
+    Returns:
+        tuple: (files migrated, exchanges migrated, files failed)
+    """
+    migrated_files = 0
+    migrated_exchanges = 0
+    failed_files = 0
+
+    for file_path in sorted(glob.glob(os.path.join(store.base_dir, f"*{LEGACY_SUFFIX}"))):
+        user_id = os.path.basename(file_path)[:-len(LEGACY_SUFFIX)]
+        try:
+            count = store.migrate_legacy(user_id)
+            migrated_files += 1
+            migrated_exchanges += count
+            print(f"{user_id}: {count} exchanges")
+        except Exception as e:
+            failed_files += 1
+            print(f"{user_id}: failed ({e})")
+
+    return migrated_files, migrated_exchanges, failed_files
+
+
+def get_conversation_store():
+    """Get the process-wide conversation store, creating it on first use"""
+    global _conversation_store
+    if _conversation_store is None:
+        with _conversation_store_lock:
+            if _conversation_store is None:
+                store = create_conversation_store()
+                if Config.CONVERSATION_WRITE_BEHIND:
+                    store = WriteBehindConversationStore(store)
+                _conversation_store = store
+    return _conversation_store
+
+
+register_stats(
+    'conversation_store',
+    lambda: _conversation_store.stats() if isinstance(_conversation_store, WriteBehindConversationStore) else {},
+    counters=('buffered', 'flushes', 'flushed', 'flush_errors')
+)
@@ -1,198 +1,911 @@
-import google.generativeai as genai
 from config import Config
-import json
-import os
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
+from models.conversation import CONVERSATION_TURN_SCHEMA, parse_conversation_turn
+from services.chat_sessions import ChatSessionManager, ConversationSession
+from services.conversation_store import get_conversation_store
+from services.prompt_builder import REPAIR_PROMPT, SYSTEM_INSTRUCTION, PromptBuilder
+from services.response_cache import get_response_cache
+from services.sapling_service import SaplingService
 from services.speech_service import SpeechService
+from utils.admission import Overloaded, admitted_call, admitted_call_async, retry_call, retry_call_async
+from utils.helpers import FileLocks, get_executor
+from utils.json_stream import StreamingJsonObjectParser
+from utils.metrics import register_stats, timed
+
+logger = logging.getLogger(__name__)
+
+# Gemini JSON mode constrained to the conversation turn shape
+CONVERSATION_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": CONVERSATION_TURN_SCHEMA
+}
+
+# The parsing retry only reformats, so it runs deterministically
+REPAIR_GENERATION_CONFIG = dict(CONVERSATION_GENERATION_CONFIG, temperature=0)
+
 
 class GeminiService:
     """Service for interacting with Google's Gemini API"""
     
-    def __init__(self):
-        """Initialize the Gemini service with API key"""
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        # Get the generative model
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+    # Number of recent exchanges included in the prompt
+    HISTORY_CONTEXT_SIZE = 5
+    
+    # Background threads updating rolling conversation summaries
+    SUMMARY_MAX_WORKERS = 4
+    
+    # Token counts reported by Gemini, per call kind, and response parsing counters
+    _usage_stats = {}
+    _parse_stats = {"parsed": 0, "repaired": 0, "failures": 0, "retry_successes": 0, "retry_failures": 0}
+    _usage_lock = threading.Lock()
+    
+    def __init__(self, model_name=None):
+        """
+        Initialize the Gemini service
         
-        # Ensure conversations directory exists
-        os.makedirs("data/conversations", exist_ok=True)
+        Args:
+            model_name (str): Gemini model to use (defaults to Config.GEMINI_MODEL)
+        """
+        self.model_name = model_name or Config.GEMINI_MODEL
+        
+        # Per-user conversation history storage
+        self.conversation_store = get_conversation_store()
+        self.prompt_builder = PromptBuilder(self.conversation_store, self.HISTORY_CONTEXT_SIZE)
+        
+        # Live chat sessions, rebuilt once the summary can absorb a batch of older turns
+        self.chat_sessions = ChatSessionManager(
+            self.prompt_builder.context_size + Config.CONVERSATION_SUMMARY_BATCH
+        )
+        self.response_cache = get_response_cache()
+    
+    @property
+    def model(self):
+        """Shared generative model with the conversation system instruction, created on first use"""
+        return get_gemini_model(self.model_name, SYSTEM_INSTRUCTION)
+    
+    def _load_conversation_history(self, user_id, limit=None):
+        """Load the most recent conversation history for a user"""
+        try:
+            with timed('history_load'):
+                return self.conversation_store.load(user_id, limit)
+        except Exception as e:
+            print(f"Error loading conversation history: {e}")
+            return []
     
-    def _get_conversation_file_path(self, user_id):
-        """Get the file path for a user's conversation history"""
-        return f"data/conversations/{user_id}_conversation.json"
+    def _save_conversation_exchange(self, user_id, exchange):
+        """Append one conversation exchange to a user's history"""
+        try:
+            with timed('history_save'):
+                self.conversation_store.append(user_id, exchange)
+        except Exception as e:
+            print(f"Error saving conversation history: {e}")
     
-    def _load_conversation_history(self, user_id):
-        """Load conversation history for a user"""
-        file_path = self._get_conversation_file_path(user_id)
+    def _build_conversation_prompt(self, user_id, topic, user_level, conversation_history, user_input):
+        """
+        Build the per-turn Gemini prompt; the static instructions are the model's system instruction
         
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    return json.load(file)
-            except Exception as e:
-                print(f"Error loading conversation history: {e}")
-                return []
-        return []
+        Args:
+            user_id (str): Unique identifier for the user
+            topic (str): Conversation theme
+            user_level (str): Japanese proficiency level (N5-N1)
+            conversation_history (list): Previous conversation exchanges
+            user_input (str): User's input in Japanese
+            
+        Returns:
+            str: Prompt text
+        """
+        # If no conversation history provided in the request, load from storage
+        if not conversation_history:
+            conversation_history = self._load_conversation_history(user_id, self.prompt_builder.context_size)
+        
+        summary = self.prompt_builder.load_summary(user_id)
+        return self.prompt_builder.build(topic, user_level, conversation_history, user_input, summary)
+    
+    def _acquire_turn(self, user_id):
+        """
+        Wait until the user's previous turn has finished
+        
+        Returns:
+            The user's held turn lock, to release once the exchange is stored
+        
+        Raises:
+            Overloaded: The user's earlier turns kept the lock for Config.TURN_LOCK_TIMEOUT
+        """
+        lock = get_turn_locks().acquire(user_id, Config.TURN_LOCK_TIMEOUT)
+        if lock is None:
+            raise Overloaded('conversation', Config.TURN_LOCK_TIMEOUT, user_limited=True)
+        return lock
+    
+    async def _acquire_turn_async(self, user_id):
+        """Async variant of _acquire_turn"""
+        lock = await get_turn_locks().acquire_async(user_id, Config.TURN_LOCK_TIMEOUT)
+        if lock is None:
+            raise Overloaded('conversation', Config.TURN_LOCK_TIMEOUT, user_limited=True)
+        return lock
+    
+    def _create_chat_session(self, user_id, user_level):
+        """Start a chat session rehydrated from the user's stored history"""
+        history = self._load_conversation_history(user_id, self.prompt_builder.context_size)
+        summary = self.prompt_builder.load_summary(user_id)
+        contents = self.prompt_builder.build_chat_history(history, user_level, summary)
+        
+        latest = history[-1] if history else {}
+        return ConversationSession(
+            self.model.start_chat(history=contents),
+            last_timestamp=latest.get('timestamp'),
+            topic=latest.get('topic'),
+            exchanges=len(contents) // 2
+        )
+    
+    def _prepare_turn(self, user_id, topic, user_level, conversation_history, user_input):
+        """
+        Choose how to send one turn to Gemini
+        
+        Turns go through the user's chat session, which only adds the new
+        input to its structured history. Requests carrying their own history,
+        and turns arriving while the user's session is busy, fall back to a
+        one-shot prompt.
+        
+        Returns:
+            tuple: (ConversationSession or None, message or prompt text)
+        """
+        with timed('prompt_build'):
+            if Config.CHAT_SESSIONS_ENABLED and not conversation_history:
+                latest = self._load_conversation_history(user_id, 1)
+                session = self.chat_sessions.acquire(
+                    user_id,
+                    latest[-1].get('timestamp') if latest else None,
+                    lambda: self._create_chat_session(user_id, user_level)
+                )
+                if session is not None:
+                    topic_changed = bool(session.topic) and session.topic != topic
+                    message = self.prompt_builder.build_chat_message(topic, user_level, user_input, topic_changed)
+                    return session, message
+            
+            prompt = self._build_conversation_prompt(user_id, topic, user_level, conversation_history, user_input)
+            return None, prompt
+    
+    def _generation_config(self):
+        """Ask for schema-constrained JSON unless JSON mode is turned off"""
+        return CONVERSATION_GENERATION_CONFIG if Config.GEMINI_JSON_MODE else None
     
-    def _save_conversation_history(self, user_id, conversation):
-        """Save conversation history for a user"""
-        file_path = self._get_conversation_file_path(user_id)
+    def _send(self, session, message, stream=False):
+        """Send a turn through the chat session, or as a one-shot prompt"""
+        generation_config = self._generation_config()
+        if session is not None:
+            return session.chat.send_message(message, stream=stream, generation_config=generation_config)
+        return self.model.generate_content(message, stream=stream, generation_config=generation_config)
+    
+    async def _send_async(self, session, message, stream=False):
+        """Async variant of _send"""
+        generation_config = self._generation_config()
+        if session is not None:
+            return await session.chat.send_message_async(message, stream=stream, generation_config=generation_config)
+        return await self.model.generate_content_async(message, stream=stream, generation_config=generation_config)
+    
+    def _record_usage(self, kind, response):
+        """Log and count the tokens Gemini reports for one call"""
+        usage = getattr(response, 'usage_metadata', None)
+        if not usage:
+            return
         
+        prompt_tokens = usage.prompt_token_count
+        cached_tokens = usage.cached_content_token_count
+        output_tokens = usage.candidates_token_count
+        logger.info(
+            f"Gemini {kind} tokens ({self.model_name}): prompt={prompt_tokens} "
+            f"cached={cached_tokens} output={output_tokens} total={usage.total_token_count}"
+        )
+        
+        with GeminiService._usage_lock:
+            stats = GeminiService._usage_stats.setdefault(
+                kind, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+            )
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["output_tokens"] += output_tokens
+    
+    @staticmethod
+    def usage_stats():
+        """Token counts reported by Gemini since startup, per call kind"""
+        with GeminiService._usage_lock:
+            return {kind: dict(stats) for kind, stats in GeminiService._usage_stats.items()}
+    
+    def _summarize(self, prompt):
+        """Generate a conversation summary with the summary model"""
+        model = get_gemini_model(Config.GEMINI_ROUTE_MODELS.get('summary'))
+        response = retry_call('gemini', model.generate_content, prompt)
+        self._record_usage('summary', response)
+        return response.text
+    
+    def _refresh_summary(self, user_id):
+        """Update a user's rolling summary, logging instead of raising"""
         try:
-            with open(file_path, 'w', encoding='utf-8') as file:
-                json.dump(conversation, file, ensure_ascii=False, indent=2)
+            self.prompt_builder.refresh_summary(user_id, self._summarize)
         except Exception as e:
-            print(f"Error saving conversation history: {e}")
+            print(f"Error updating conversation summary: {e}")
+    
+    def _schedule_summary_refresh(self, user_id, history_write):
+        """Refresh the summary in the background once the exchange is stored"""
+        if not Config.CONVERSATION_SUMMARY_ENABLED:
+            return
+        pool = get_executor('conversation-summary', self.SUMMARY_MAX_WORKERS)
+        history_write.add_done_callback(lambda _: pool.submit(self._refresh_summary, user_id))
+    
+    def _wait_for_stage(self, name, future, started, timeout):
+        """
+        Wait for a pipeline stage until its deadline
+        
+        Args:
+            name (str): Stage name for logging
+            future (Future): Stage future, or None if the stage was skipped
+            started (float): time.monotonic() when the stages were submitted
+            timeout (float): Seconds the stage may take
+            
+        Returns:
+            The stage result, or None if it was skipped, failed or timed out
+        """
+        if future is None:
+            return None
+        
+        remaining = max(0.0, started + timeout - time.monotonic())
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeoutError:
+            print(f"Pipeline stage '{name}' timed out after {timeout}s")
+        except Exception as e:
+            print(f"Pipeline stage '{name}' failed: {e}")
+        return None
+    
+    def _count_parse(self, name):
+        """Increment a response parsing counter"""
+        with GeminiService._usage_lock:
+            GeminiService._parse_stats[name] += 1
+    
+    @staticmethod
+    def parse_stats():
+        """Response parsing counters since startup"""
+        with GeminiService._usage_lock:
+            return dict(GeminiService._parse_stats)
+    
+    def _parse_turn_response(self, response_text):
+        """
+        Parse and validate the JSON generated by Gemini for one turn
+        
+        Returns:
+            tuple: (response_json, None) on success or (None, error result)
+        """
+        try:
+            response_json, repaired = parse_conversation_turn(response_text)
+        except ValueError as e:
+            return None, {
+                "status": "error",
+                "message": f"Invalid JSON response from AI: {str(e)}",
+                "raw_response": response_text
+            }
+        
+        if repaired:
+            self._count_parse("repaired")
+        return response_json, None
+    
+    def _repair_prompt(self, response_text):
+        """Prompt for the retry that reformats an unparseable turn"""
+        return REPAIR_PROMPT.format(response=response_text)
+    
+    def _repair_model(self):
+        """Model reformatting unparseable turns"""
+        return get_gemini_model(Config.GEMINI_ROUTE_MODELS.get('repair'))
+    
+    def _parse_first_attempt(self, response_text):
+        """
+        Parse a turn as Gemini generated it, counting the outcome
+        
+        Returns:
+            tuple: (response_json, error result, prompt for the repair call, or
+                None when there is nothing to retry)
+        """
+        response_json, error = self._parse_turn_response(response_text)
+        if not error:
+            self._count_parse("parsed")
+            return response_json, None, None
+        
+        self._count_parse("failures")
+        if not response_text.strip():
+            return None, error, None
+        return None, error, self._repair_prompt(response_text)
+    
+    def _parse_repaired(self, response, error):
+        """
+        Parse the output of the repair call, counting the outcome
+        
+        Args:
+            response: Repair call response, or None if the call failed
+            error (dict): Error result of the first attempt
+        
+        Returns:
+            tuple: (response_json, error result, True)
+        """
+        if response is None:
+            response_json, retry_error = None, error
+        else:
+            self._record_usage('repair', response)
+            response_json, retry_error = self._parse_turn_response(response.text)
+        
+        self._count_parse("retry_failures" if retry_error else "retry_successes")
+        return response_json, retry_error, True
+    
+    def _parse_turn_with_retry(self, response_text):
+        """
+        Parse a turn, retrying once with a cheap reformatting call on failure
+        
+        The retry only sends the broken output to the repair model in JSON
+        mode instead of repeating the whole conversation turn.
+        
+        Returns:
+            tuple: (response_json, error result, whether the retry was needed)
+        """
+        response_json, error, repair_prompt = self._parse_first_attempt(response_text)
+        if repair_prompt is None:
+            return response_json, error, False
+        
+        try:
+            response = retry_call(
+                'gemini', self._repair_model().generate_content,
+                repair_prompt, generation_config=REPAIR_GENERATION_CONFIG
+            )
+        except Exception as e:
+            print(f"Error retrying response parsing: {e}")
+            response = None
+        return self._parse_repaired(response, error)
+    
+    async def _parse_turn_with_retry_async(self, response_text):
+        """Async variant of _parse_turn_with_retry"""
+        response_json, error, repair_prompt = self._parse_first_attempt(response_text)
+        if repair_prompt is None:
+            return response_json, error, False
+        
+        try:
+            response = await retry_call_async(
+                'gemini', self._repair_model().generate_content_async,
+                repair_prompt, generation_config=REPAIR_GENERATION_CONFIG
+            )
+        except Exception as e:
+            print(f"Error retrying response parsing: {e}")
+            response = None
+        return self._parse_repaired(response, error)
+    
+    def _build_exchange(self, topic, user_level, user_input, response_json):
+        """Build the history record for one turn"""
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "topic": topic,
+            "user_level": user_level,
+            "user_input": user_input,
+            "correction": response_json.get("correction", {}),
+            "reply": response_json.get("reply", ""),
+            "vocabulary": response_json.get("vocabulary", [])
+        }
+    
+    def _accept_turn(self, topic, user_level, user_input, response_json, retried, session=None, cache_key=None):
+        """
+        Cache a freshly parsed turn and add it to the chat session
+        
+        Args:
+            topic (str): Conversation theme
+            user_level (str): Japanese proficiency level (N5-N1)
+            user_input (str): User's input in Japanese
+            response_json (dict): Parsed turn
+            retried (bool): Whether parsing needed the repair call
+            session (ConversationSession): Chat session the turn was sent through
+            cache_key (str): Response cache key if the turn may be cached
+        
+        Returns:
+            dict: History record for the turn
+        """
+        if cache_key:
+            self.response_cache.put(cache_key, response_json)
+        
+        new_exchange = self._build_exchange(topic, user_level, user_input, response_json)
+        # After a retry the chat history holds the broken reply, so the session is rebuilt
+        if session is not None and not retried:
+            session.record(new_exchange)
+        return new_exchange
+    
+    def _finish_turn(self, user_id, response_json, audio_result, check_grammar, grammar_result):
+        """Attach the post-generation stage results to the response"""
+        if audio_result and audio_result["status"] != "success":
+            print(f"Error generating audio: {audio_result['message']}")
+        
+        # Add the audio only to the response, not in history
+        if audio_result and audio_result["status"] == "success":
+            response_json["audio_id"] = audio_result["audio_id"]
+            response_json["audio_reply"] = audio_result["audio_data"]
+            response_json["audio_format"] = audio_result["audio_format"]
+        else:
+            response_json["audio_id"] = None
+            response_json["audio_reply"] = None
+            response_json["audio_format"] = None
+        
+        if check_grammar:
+            response_json["grammar_check"] = grammar_result
+        
+        return {
+            "status": "success",
+            "user_id": user_id,
+            "response": response_json
+        }
+    
+    def _complete_conversation_turn(self, user_id, topic, user_level, user_input, response_text,
+                                    check_grammar=False, session=None, cache_key=None, inline_audio=True,
+                                    audio_format=None):
+        """
+        Parse the model output, synthesize audio for the reply and store the exchange
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            topic (str): Conversation theme
+            user_level (str): Japanese proficiency level (N5-N1)
+            user_input (str): User's input in Japanese
+            response_text (str): Raw text generated by Gemini
+            check_grammar (bool): Also check user_input with Sapling
+            session (ConversationSession): Chat session the turn was sent through
+            cache_key (str): Response cache key if the turn may be cached
+            inline_audio (bool): Include the reply audio base64 encoded, not only its audio_id
+            audio_format (str): Encoding of the reply audio (a key of AUDIO_OUTPUT_FORMATS), None for the default
+        
+        Returns:
+            dict: Result containing the AI response and audio for reply
+        """
+        with timed('json_parse'):
+            response_json, error, retried = self._parse_turn_with_retry(response_text)
+        if error:
+            return error
+        
+        new_exchange = self._accept_turn(topic, user_level, user_input, response_json, retried, session, cache_key)
+        return self._run_turn_stages(
+            user_id, new_exchange, response_json, check_grammar, inline_audio, audio_format
+        )
+    
+    async def _complete_conversation_turn_async(self, user_id, topic, user_level, user_input, response_text,
+                                                check_grammar=False, session=None, cache_key=None,
+                                                inline_audio=True, audio_format=None):
+        """Async variant of _complete_conversation_turn"""
+        with timed('json_parse'):
+            response_json, error, retried = await self._parse_turn_with_retry_async(response_text)
+        if error:
+            return error
+        
+        new_exchange = self._accept_turn(topic, user_level, user_input, response_json, retried, session, cache_key)
+        return await self._run_turn_stages_async(
+            user_id, new_exchange, response_json, check_grammar, inline_audio, audio_format
+        )
+    
+    def _run_turn_stages(self, user_id, new_exchange, response_json, check_grammar, inline_audio=True,
+                         audio_format=None):
+        """Synthesize the reply, store the exchange and optionally check grammar, concurrently"""
+        pool = get_executor('conversation-pipeline', Config.PIPELINE_MAX_WORKERS)
+        started = time.monotonic()
+        
+        reply_text = response_json.get("reply", "")
+        tts_future = None
+        if reply_text:
+            tts_future = pool.submit(
+                contextvars.copy_context().run, SpeechService.text_to_speech, reply_text, 'ja', False, inline_audio,
+                audio_format
+            )
+        history_future = pool.submit(
+            contextvars.copy_context().run, self._save_conversation_exchange, user_id, new_exchange
+        )
+        self._schedule_summary_refresh(user_id, history_future)
+        grammar_future = None
+        if check_grammar:
+            grammar_future = pool.submit(
+                contextvars.copy_context().run, SaplingService.check_japanese_grammar, new_exchange["user_input"]
+            )
+        
+        audio_result = self._wait_for_stage('tts', tts_future, started, Config.PIPELINE_TTS_TIMEOUT)
+        self._wait_for_stage('history', history_future, started, Config.PIPELINE_HISTORY_TIMEOUT)
+        grammar_result = self._wait_for_stage('grammar', grammar_future, started, Config.PIPELINE_GRAMMAR_TIMEOUT)
+        
+        return self._finish_turn(user_id, response_json, audio_result, check_grammar, grammar_result)
+    
+    async def _await_stage(self, name, task, started, timeout):
+        """Async variant of _wait_for_stage"""
+        if task is None:
+            return None
+        
+        remaining = max(0.0, started + timeout - time.monotonic())
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), remaining)
+        except asyncio.TimeoutError:
+            print(f"Pipeline stage '{name}' timed out after {timeout}s")
+        except Exception as e:
+            print(f"Pipeline stage '{name}' failed: {e}")
+        return None
+    
+    async def _run_turn_stages_async(self, user_id, new_exchange, response_json, check_grammar,
+                                     inline_audio=True, audio_format=None):
+        """Async variant of _run_turn_stages"""
+        started = time.monotonic()
+        
+        # Stages keep running after a timeout, as with the thread pool
+        reply_text = response_json.get("reply", "")
+        tts_task = None
+        if reply_text:
+            tts_task = asyncio.ensure_future(
+                SpeechService.text_to_speech_async(reply_text, 'ja', False, inline_audio, audio_format)
+            )
+        history_task = asyncio.ensure_future(
+            asyncio.to_thread(self._save_conversation_exchange, user_id, new_exchange)
+        )
+        self._schedule_summary_refresh(user_id, history_task)
+        grammar_task = None
+        if check_grammar:
+            grammar_task = asyncio.ensure_future(
+                SaplingService.check_japanese_grammar_async(new_exchange["user_input"])
+            )
+        
+        audio_result = await self._await_stage('tts', tts_task, started, Config.PIPELINE_TTS_TIMEOUT)
+        await self._await_stage('history', history_task, started, Config.PIPELINE_HISTORY_TIMEOUT)
+        grammar_result = await self._await_stage('grammar', grammar_task, started, Config.PIPELINE_GRAMMAR_TIMEOUT)
+        
+        return self._finish_turn(user_id, response_json, audio_result, check_grammar, grammar_result)
+    
+    def _lookup_cached_turn(self, user_id, topic, user_level, conversation_history, user_input, use_cache):
+        """
+        Check the response cache for a turn with little or no history
+        
+        Returns:
+            tuple: (cache key or None if the turn is not cacheable, cached entry or None)
+        """
+        if not (Config.RESPONSE_CACHE_ENABLED and use_cache):
+            return None, None
+        
+        max_history = Config.RESPONSE_CACHE_MAX_HISTORY
+        history = conversation_history or self._load_conversation_history(user_id, max_history + 1)
+        if len(history) > max_history:
+            return None, None
+        
+        key = self.response_cache.make_key(self.model_name, topic, user_level, history, user_input)
+        return key, self.response_cache.get(key)
+    
+    def _begin_turn(self, user_id, topic, user_level, conversation_history, user_input, use_cache):
+        """
+        Answer a turn from the response cache, or get it ready for Gemini
+        
+        Returns:
+            tuple: (cached entry, response cache key, ConversationSession or None, message or prompt text);
+                for a cached turn only the entry is set
+        """
+        cache_key, cached = self._lookup_cached_turn(
+            user_id, topic, user_level, conversation_history, user_input, use_cache
+        )
+        if cached:
+            return cached, None, None, None
+        
+        session, message = self._prepare_turn(user_id, topic, user_level, conversation_history, user_input)
+        return None, cache_key, session, message
+    
+    def _serve_cached_turn(self, user_id, topic, user_level, user_input, entry, check_grammar, inline_audio=True,
+                           audio_format=None):
+        """
+        Answer a turn from the response cache
+        
+        The exchange is still stored and grammar still checked; the reply's
+        speech is normally still in the audio cache, so text_to_speech serves
+        it without synthesizing.
+        """
+        response_json = entry["response"]
+        new_exchange = self._build_exchange(topic, user_level, user_input, response_json)
+        return self._run_turn_stages(
+            user_id, new_exchange, response_json, check_grammar, inline_audio, audio_format
+        )
+    
+    async def _serve_cached_turn_async(self, user_id, topic, user_level, user_input, entry, check_grammar,
+                                       inline_audio=True, audio_format=None):
+        """Async variant of _serve_cached_turn"""
+        response_json = entry["response"]
+        new_exchange = self._build_exchange(topic, user_level, user_input, response_json)
+        return await self._run_turn_stages_async(
+            user_id, new_exchange, response_json, check_grammar, inline_audio, audio_format
+        )
+    
+    @staticmethod
+    def _error_result(error):
+        """Result for a turn that raised"""
+        if isinstance(error, Overloaded):
+            return error.result()
+        return {"status": "error", "message": str(error)}
     
-    def _format_conversation_history(self, history):
-        """Format conversation history for prompt"""
-        if not history:
-            return "Chưa có hội thoại trước đó."
+    def _end_turn(self, user_id, session, turn_lock):
+        """Hand the chat session back and let the user's next turn start"""
+        self.chat_sessions.release(user_id, session)
+        if turn_lock is not None:
+            turn_lock.release()
+    
+    @staticmethod
+    def _field_events(parser, text):
+        """Stream events for the fields one chunk of generated text completes or extends"""
+        for kind, key, value in parser.feed(text):
+            if kind == 'chunk' and key == 'reply':
+                yield 'reply', {"text": value}
+            elif kind == 'value' and key in ('correction', 'vocabulary'):
+                yield key, value
+    
+    @staticmethod
+    def _result_events(result):
+        """Closing stream events for a finished turn"""
+        if result['status'] != 'success':
+            yield 'error', result
+            return
         
-        formatted = []
-        for entry in history[-5:]:  # Use only the last 5 exchanges to keep context manageable
-            if 'user_input' in entry:
-                formatted.append(f"Người học: 「{entry['user_input']}」")
-            if 'reply' in entry:
-                formatted.append(f"Giáo viên: 「{entry['reply']}」")
-                
-        return "\n".join(formatted)
+        yield 'audio', {
+            "audio_id": result['response'].get('audio_id'),
+            "audio_reply": result['response'].get('audio_reply'),
+            "audio_format": result['response'].get('audio_format')
+        }
+        yield 'done', result
     
-    def generate_japanese_conversation(self, user_id, topic, user_level, conversation_history, user_input):
+    def _cached_turn_events(self, result):
+        """Stream events for a turn served from the response cache"""
+        if result['status'] == 'success':
+            response_json = result['response']
+            yield 'correction', response_json.get('correction')
+            yield 'reply', {"text": response_json.get('reply', '')}
+            yield 'vocabulary', response_json.get('vocabulary')
+        yield from self._result_events(result)
+    
+    def generate_japanese_conversation(self, user_id, topic, user_level, conversation_history, user_input,
+                                       check_grammar=False, use_cache=True, inline_audio=True, audio_format=None):
         """
         Generate a Japanese conversation response based on user input
         
+        Turns of the same user run one at a time: each is generated from the
+        history including the previous turn and stored before the next starts.
+        
         Args:
             user_id (str): Unique identifier for the user
             topic (str): Conversation theme
             user_level (str): Japanese proficiency level (N5-N1)
             conversation_history (list): Previous conversation exchanges
             user_input (str): User's input in Japanese
-            
+            check_grammar (bool): Also check user_input with Sapling
+            use_cache (bool): Allow answering from (and storing in) the response cache
+            inline_audio (bool): Include the reply audio base64 encoded, not only its audio_id
+            audio_format (str): Encoding of the reply audio (a key of AUDIO_OUTPUT_FORMATS), None for the default
+        
         Returns:
             dict: Result containing the AI response and audio for reply
         """
+        session = None
+        turn_lock = None
         try:
-            # If no conversation history provided in the request, load from storage
-            if not conversation_history:
-                conversation_history = self._load_conversation_history(user_id)
-            
-            # Check if the topic has changed (compare with the latest topic in history)
-            previous_topic = None
-            if conversation_history:
-                previous_topic = conversation_history[-1].get('topic')
-
-            # Format conversation history, but limit to recent exchanges
-            formatted_history = self._format_conversation_history(conversation_history)
-            
-            # Prepare the prompt for Gemini, emphasizing the new topic
-            prompt = f"""
-            Bạn là giáo viên tiếng Nhật bản ngữ với kinh nghiệm dạy học sinh quốc tế. Nhiệm vụ của bạn là hỗ trợ người học Việt Nam luyện nói tiếng Nhật qua hội thoại tự nhiên.
-
-            ## Ngữ cảnh:
-            - Chủ đề hiện tại: {topic}
-            - Trình độ: {user_level} (N5/N4/N3/N2/N1)
-            - Hội thoại trước đó: {formatted_history}
-            {'- Lưu ý: Người dùng đã chuyển sang chủ đề mới. Hãy tập trung vào chủ đề hiện tại và giảm ảnh hưởng của các chủ đề trước đó.' if previous_topic and previous_topic != topic else ''}
-
-            ## Phát biểu của người học:
-            「{user_input}」
-
-            ## Yêu cầu kỹ thuật:
-            Phản hồi dưới dạng JSON có cấu trúc sau:
-            {{
-            "correction": {{
-                "hasError": boolean,
-                "original": "câu gốc của người học",
-                "suggestion": "câu sửa đúng (chỉ điền nếu hasError=true)",
-                "explanation": "giải thích lỗi bằng tiếng Việt, hoặc 'Câu đúng, rất tự nhiên!' nếu không có lỗi"
-            }},
-            "reply": "phản hồi tự nhiên bằng tiếng Nhật + câu hỏi để tiếp tục hội thoại",
-            "vocabulary": [
-                {{
-                "word": "từ vựng đáng chú ý trong câu trả lời",
-                "reading": "cách đọc",
-                "meaning": "nghĩa tiếng Việt"
-                }}
-            ]
-            }}
-
-            ## Nguyên tắc:
-            1. Sử dụng ĐÚNG JSON format, không thêm text ngoài JSON
-            2. Viết tiếng Việt TRONG phần correction.explanation và vocabulary.meaning
-            3. Viết tiếng Nhật TRONG phần reply
-            4. Điều chỉnh độ khó của câu - Nếu không có lỗi, để suggestion là chuỗi rỗng
-            5. Tập trung vào lỗi ngữ pháp quan trọng nhất, tránh sửa quá nhiều
-            6. Phản hồi bằng kính ngữ (敬語) hoặc thân mật tùy tình huống
-            7. Luôn kèm câu hỏi mở để tiếp tục hội thoại, phù hợp với chủ đề {topic}
-            8. Đảm bảo câu trả lời có độ dài phù hợp với người học
-            10. Không đính kèm icon, emoji, các kí tự đặc biệt
-            11. Đảm bảo câu trả lời có thể sử dụng để tạo speech to text
-            12. Khi đếm số lượng hội thoại đã diễn ra lớn hơn 5, chào tạm biệt và đề nghị người học có thể tiếp tục hội thoại vào lúc khác
-            13. Vì là văn nói nên không bắt lỗi dấu câu
-            
-            Chỉ trả về JSON, không có văn bản giới thiệu hoặc kết luận.
-            """
-            
+            turn_lock = self._acquire_turn(user_id)
+            cached, cache_key, session, message = self._begin_turn(
+                user_id, topic, user_level, conversation_history, user_input, use_cache
+            )
+            if cached:
+                return self._serve_cached_turn(
+                    user_id, topic, user_level, user_input, cached, check_grammar, inline_audio, audio_format
+                )
+        
             # Generate content with Gemini
-            response = self.model.generate_content(prompt)
-            
-            # Clean the response text to remove markdown or extra formatting
-            response_text = response.text.strip()
-            if response_text.startswith("```json"):
-                response_text = response_text[7:-3].strip()
-            
-            # Parse the JSON response
+            with timed('model_call'):
+                response = retry_call('gemini', self._send, session, message, user_id=user_id)
+            self._record_usage('conversation', response)
+        
+            return self._complete_conversation_turn(
+                user_id, topic, user_level, user_input, response.text, check_grammar, session, cache_key,
+                inline_audio, audio_format
+            )
+        
+        except Exception as e:
+            return self._error_result(e)
+        finally:
+            self._end_turn(user_id, session, turn_lock)
+    
+    async def generate_japanese_conversation_async(self, user_id, topic, user_level, conversation_history,
+                                                   user_input, check_grammar=False, use_cache=True,
+                                                   inline_audio=True, audio_format=None):
+        """
+        Async variant of generate_japanese_conversation for the async serving mode
+        
+        Returns:
+            dict: Result containing the AI response and audio for reply
+        """
+        session = None
+        turn_lock = None
+        try:
+            turn_lock = await self._acquire_turn_async(user_id)
+            cached, cache_key, session, message = await asyncio.to_thread(
+                self._begin_turn, user_id, topic, user_level, conversation_history, user_input, use_cache
+            )
+            if cached:
+                return await self._serve_cached_turn_async(
+                    user_id, topic, user_level, user_input, cached, check_grammar, inline_audio, audio_format
+                )
+        
+            with timed('model_call'):
+                response = await retry_call_async('gemini', self._send_async, session, message, user_id=user_id)
+            self._record_usage('conversation', response)
+        
+            return await self._complete_conversation_turn_async(
+                user_id, topic, user_level, user_input, response.text, check_grammar, session, cache_key,
+                inline_audio, audio_format
+            )
+        
+        except Exception as e:
+            return self._error_result(e)
+        finally:
+            self._end_turn(user_id, session, turn_lock)
+    
+    def stream_japanese_conversation(self, user_id, topic, user_level, conversation_history, user_input,
+                                     check_grammar=False, use_cache=True, inline_audio=True, audio_format=None):
+        """
+        Generate a Japanese conversation response as a stream of events
+        
+        Fields are emitted as soon as Gemini has generated them: the correction,
+        then the reply text in chunks, then the vocabulary. The audio follows once
+        the reply is synthesized, and the final event carries the same payload
+        generate_japanese_conversation would return.
+        
+        The turn runs on a thread of its own and hands its events over through
+        a queue, so a client that reads slowly (or stops reading) does not keep
+        the user's turn lock: it is released once the exchange is stored.
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            topic (str): Conversation theme
+            user_level (str): Japanese proficiency level (N5-N1)
+            conversation_history (list): Previous conversation exchanges
+            user_input (str): User's input in Japanese
+            check_grammar (bool): Also check user_input with Sapling
+            use_cache (bool): Allow answering from (and storing in) the response cache
+            inline_audio (bool): Include the reply audio base64 encoded, not only its audio_id
+            audio_format (str): Encoding of the reply audio (a key of AUDIO_OUTPUT_FORMATS), None for the default
+        
+        Yields:
+            tuple: (event name, event data) pairs; event is one of
+                correction, reply, vocabulary, audio, done or error
+        """
+        events = queue.SimpleQueue()
+        
+        def run():
             try:
-                response_json = json.loads(response_text)
-                
-                # Generate audio for the reply
-                reply_text = response_json.get("reply", "")
-                if reply_text:
-                    audio_result = SpeechService.text_to_speech(reply_text, language='ja')
-                    if audio_result["status"] == "success":
-                        response_json["audio_reply"] = audio_result["audio_data"]
-                    else:
-                        response_json["audio_reply"] = None  # Or handle error differently
-                        print(f"Error generating audio: {audio_result['message']}")
-                
-                # Save the conversation exchange
-                new_exchange = {
-                    "timestamp": datetime.now().isoformat(),
-                    "topic": topic,
-                    "user_level": user_level,
-                    "user_input": user_input,
-                    "correction": response_json.get("correction", {}),
-                    "reply": response_json.get("reply", ""),
-                    "vocabulary": response_json.get("vocabulary", [])
-                }
-                
-                # Append to conversation history and save
-                conversation_history.append(new_exchange)
-                self._save_conversation_history(user_id, conversation_history)
-                
-                # Add audio_reply only to the response, not in history
-                if audio_result and audio_result["status"] == "success":
-                    response_json["audio_reply"] = audio_result["audio_data"]
-                else:
-                    response_json["audio_reply"] = None
-                
-                return {
-                    "status": "success",
-                    "user_id": user_id,
-                    "response": response_json
-                }
-                
-            except json.JSONDecodeError as json_err:
-                return {
-                    "status": "error",
-                    "message": f"Invalid JSON response from AI: {str(json_err)}",
-                    "raw_response": response_text
-                }
-                
+                for event in self._stream_turn(
+                    user_id, topic, user_level, conversation_history, user_input, check_grammar, use_cache,
+                    inline_audio, audio_format
+                ):
+                    events.put(event)
+            finally:
+                events.put(None)
+        
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), name="conversation-stream",
+                         daemon=True).start()
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+    
+    def _stream_turn(self, user_id, topic, user_level, conversation_history, user_input, check_grammar,
+                     use_cache, inline_audio, audio_format):
+        """Events of one streamed turn, generated independently of the client (see stream_japanese_conversation)"""
+        session = None
+        turn_lock = None
+        try:
+            turn_lock = self._acquire_turn(user_id)
+            cached, cache_key, session, message = self._begin_turn(
+                user_id, topic, user_level, conversation_history, user_input, use_cache
+            )
+            if cached:
+                result = self._serve_cached_turn(
+                    user_id, topic, user_level, user_input, cached, check_grammar, inline_audio, audio_format
+                )
+                yield from self._cached_turn_events(result)
+                return
+        
+            parser = StreamingJsonObjectParser()
+            chunks = []
+            with timed('model_call'), admitted_call(
+                'gemini', self._send, session, message, stream=True, user_id=user_id
+            ) as response:
+                for chunk in response:
+                    chunks.append(chunk.text)
+                    yield from self._field_events(parser, chunk.text)
+            self._record_usage('conversation', response)
+        
+            result = self._complete_conversation_turn(
+                user_id, topic, user_level, user_input, "".join(chunks), check_grammar, session, cache_key,
+                inline_audio, audio_format
+            )
+            yield from self._result_events(result)
+        
         except Exception as e:
-            return {"status": "error", "message": str(e)}
-            
+            yield 'error', self._error_result(e)
+        finally:
+            self._end_turn(user_id, session, turn_lock)
+    
+    async def stream_japanese_conversation_async(self, user_id, topic, user_level, conversation_history,
+                                                 user_input, check_grammar=False, use_cache=True,
+                                                 inline_audio=True, audio_format=None):
+        """
+        Async variant of stream_japanese_conversation
+        
+        Yields:
+            tuple: (event name, event data) pairs
+        """
+        events = asyncio.Queue()
+        
+        async def run():
+            try:
+                async for event in self._stream_turn_async(
+                    user_id, topic, user_level, conversation_history, user_input, check_grammar, use_cache,
+                    inline_audio, audio_format
+                ):
+                    events.put_nowait(event)
+            finally:
+                events.put_nowait(None)
+        
+        # Keep a reference so the turn runs to completion even if the client goes away
+        task = asyncio.ensure_future(run())
+        _stream_tasks.add(task)
+        task.add_done_callback(_stream_tasks.discard)
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            yield event
+    
+    async def _stream_turn_async(self, user_id, topic, user_level, conversation_history, user_input,
+                                 check_grammar, use_cache, inline_audio, audio_format):
+        """Async variant of _stream_turn"""
+        session = None
+        turn_lock = None
+        try:
+            turn_lock = await self._acquire_turn_async(user_id)
+            cached, cache_key, session, message = await asyncio.to_thread(
+                self._begin_turn, user_id, topic, user_level, conversation_history, user_input, use_cache
+            )
+            if cached:
+                result = await self._serve_cached_turn_async(
+                    user_id, topic, user_level, user_input, cached, check_grammar, inline_audio, audio_format
+                )
+                for event in self._cached_turn_events(result):
+                    yield event
+                return
+        
+            parser = StreamingJsonObjectParser()
+            chunks = []
+            with timed('model_call'):
+                async with admitted_call_async(
+                    'gemini', self._send_async, session, message, stream=True, user_id=user_id
+                ) as response:
+                    async for chunk in response:
+                        chunks.append(chunk.text)
+                        for event in self._field_events(parser, chunk.text):
+                            yield event
+            self._record_usage('conversation', response)
+        
+            result = await self._complete_conversation_turn_async(
+                user_id, topic, user_level, user_input, "".join(chunks), check_grammar, session, cache_key,
+                inline_audio, audio_format
+            )
+            for event in self._result_events(result):
+                yield event
+        
+        except Exception as e:
+            yield 'error', self._error_result(e)
+        finally:
+            self._end_turn(user_id, session, turn_lock)
+    
     def get_conversation_history(self, user_id, limit=10):
         """
         Get conversation history for a user
@@ -205,10 +918,8 @@ class GeminiService:
             dict: Result containing conversation history
         """
         try:
-            history = self._load_conversation_history(user_id)
-            
             # Return the most recent conversations up to the limit
-            limited_history = history[-limit:] if limit > 0 else history
+            limited_history = self._load_conversation_history(user_id, limit if limit > 0 else None)
             
             return {
                 "status": "success",
@@ -217,4 +928,95 @@ class GeminiService:
             }
             
         except Exception as e:
-            return {"status": "error", "message": str(e)}
\ No newline at end of file
+            return {"status": "error", "message": str(e)}
+
+
+_gemini_configured = False
+_gemini_models = {}
+_gemini_services = {}
+_gemini_registry_lock = threading.Lock()
+_turn_locks = None
+_turn_locks_lock = threading.Lock()
+# Streamed turns still running on the event loop
+_stream_tasks = set()
+
+
+def get_gemini_model(model_name=None, system_instruction=None):
+    """
+    Get the process-wide GenerativeModel for a model name and system instruction
+    
+    The client is configured with the API key once, on first use.
+    
+    Args:
+        model_name (str): Gemini model name (defaults to Config.GEMINI_MODEL)
+        system_instruction (str): Static instructions sent with every request
+        
+    Returns:
+        genai.GenerativeModel: Shared model instance
+    """
+    global _gemini_configured
+    model_name = model_name or Config.GEMINI_MODEL
+    key = (model_name, system_instruction)
+    model = _gemini_models.get(key)
+    if model is not None:
+        return model
+    
+    with _gemini_registry_lock:
+        # Imported on first use; google.generativeai pulls in gRPC and protobuf
+        import google.generativeai as genai
+        
+        if not _gemini_configured:
+            genai.configure(api_key=Config.GEMINI_API_KEY)
+            _gemini_configured = True
+        if key not in _gemini_models:
+            _gemini_models[key] = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        return _gemini_models[key]
+
+
+def get_gemini_service(route=None):
+    """
+    Get the process-wide GeminiService for an API route
+    
+    Args:
+        route (str): Route name used to look up Config.GEMINI_ROUTE_MODELS
+        
+    Returns:
+        GeminiService: Shared service instance
+    """
+    model_name = Config.GEMINI_ROUTE_MODELS.get(route, Config.GEMINI_MODEL)
+    service = _gemini_services.get(model_name)
+    if service is not None:
+        return service
+    
+    with _gemini_registry_lock:
+        if model_name not in _gemini_services:
+            _gemini_services[model_name] = GeminiService(model_name)
+        return _gemini_services[model_name]
+
+
+def get_turn_locks():
+    """
+    Get the per-user turn locks, creating their directory on first use
+    
+    Turns of one user run one at a time across all workers, so each is
+    generated from and appended after the previous one.
+    """
+    global _turn_locks
+    if _turn_locks is None:
+        with _turn_locks_lock:
+            if _turn_locks is None:
+                _turn_locks = FileLocks(Config.TURN_LOCK_DIR)
+    return _turn_locks
+
+
+def _chat_session_stats():
+    """Chat session counters of every service, by model"""
+    return {model_name: service.chat_sessions.stats() for model_name, service in list(_gemini_services.items())}
+
+
+register_stats(
+    'gemini_tokens', GeminiService.usage_stats,
+    counters=('calls', 'prompt_tokens', 'cached_tokens', 'output_tokens'), label='kind'
+)
+register_stats('gemini_parse', GeminiService.parse_stats, counters=tuple(GeminiService._parse_stats))
+register_stats('chat_sessions', _chat_session_stats, counters=('hits', 'misses', 'rebuilt', 'busy'), label='model')
@@ -0,0 +1,344 @@
+import json
+import logging
+from datetime import datetime
+from config import Config
+from utils.helpers import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Instructions shared by every conversation turn, sent once per model as its
+# system instruction instead of being repeated in each prompt
+SYSTEM_INSTRUCTION = """
+Bạn là giáo viên tiếng Nhật bản ngữ với kinh nghiệm dạy học sinh quốc tế. Nhiệm vụ của bạn là hỗ trợ người học Việt Nam luyện nói tiếng Nhật qua hội thoại tự nhiên.
+
+Mỗi lượt, bạn nhận được ngữ cảnh (chủ đề hiện tại, trình độ, tóm tắt và các lượt hội thoại gần đây) cùng phát biểu của người học.
+
+## Yêu cầu kỹ thuật:
+Phản hồi dưới dạng JSON có cấu trúc sau:
+{
+"correction": {
+    "hasError": boolean,
+    "original": "câu gốc của người học",
+    "suggestion": "câu sửa đúng (chỉ điền nếu hasError=true)",
+    "explanation": "giải thích lỗi bằng tiếng Việt, hoặc 'Câu đúng, rất tự nhiên!' nếu không có lỗi"
+},
+"reply": "phản hồi tự nhiên bằng tiếng Nhật + câu hỏi để tiếp tục hội thoại",
+"vocabulary": [
+    {
+    "word": "từ vựng đáng chú ý trong câu trả lời",
+    "reading": "cách đọc",
+    "meaning": "nghĩa tiếng Việt"
+    }
+]
+}
+
+## Nguyên tắc:
+1. Sử dụng ĐÚNG JSON format, không thêm text ngoài JSON
+2. Viết tiếng Việt TRONG phần correction.explanation và vocabulary.meaning
+3. Viết tiếng Nhật TRONG phần reply
+4. Điều chỉnh độ khó của câu - Nếu không có lỗi, để suggestion là chuỗi rỗng
+5. Tập trung vào lỗi ngữ pháp quan trọng nhất, tránh sửa quá nhiều
+6. Phản hồi bằng kính ngữ (敬語) hoặc thân mật tùy tình huống
+7. Luôn kèm câu hỏi mở để tiếp tục hội thoại, phù hợp với chủ đề hiện tại
+8. Đảm bảo câu trả lời có độ dài phù hợp với người học
+10. Không đính kèm icon, emoji, các kí tự đặc biệt
+11. Đảm bảo câu trả lời có thể sử dụng để tạo speech to text
+12. Khi đếm số lượng hội thoại đã diễn ra lớn hơn 5, chào tạm biệt và đề nghị người học có thể tiếp tục hội thoại vào lúc khác
+13. Vì là văn nói nên không bắt lỗi dấu câu
+
+Chỉ trả về JSON, không có văn bản giới thiệu hoặc kết luận.
+""".strip()
+
+TURN_TEMPLATE = """
+## Ngữ cảnh:
+- Chủ đề hiện tại: {topic}
+- Trình độ: {user_level} (N5/N4/N3/N2/N1)
+{summary_line}- Hội thoại trước đó: {history}
+{topic_note}
+## Phát biểu của người học:
+「{user_input}」
+""".strip()
+
+# One learner turn in a chat session; earlier turns are in the chat history
+CHAT_TURN_TEMPLATE = """
+## Ngữ cảnh:
+- Chủ đề hiện tại: {topic}
+- Trình độ: {user_level} (N5/N4/N3/N2/N1)
+{topic_note}
+## Phát biểu của người học:
+「{user_input}」
+""".strip()
+
+CHAT_SUMMARY_TEMPLATE = "## Tóm tắt các lượt cũ hơn:\n{summary}"
+CHAT_SUMMARY_ACK = "Đã hiểu."
+
+TOPIC_CHANGED_NOTE = (
+    "- Lưu ý: Người dùng đã chuyển sang chủ đề mới. Hãy tập trung vào chủ đề hiện tại "
+    "và giảm ảnh hưởng của các chủ đề trước đó.\n"
+)
+
+SUMMARY_PROMPT = """
+Bạn đang tóm tắt một cuộc hội thoại luyện nói tiếng Nhật giữa người học và giáo viên.
+
+## Tóm tắt hiện có:
+{summary}
+
+## Các lượt hội thoại mới cần bổ sung:
+{exchanges}
+
+## Yêu cầu:
+- Viết lại bản tóm tắt bằng tiếng Việt, gộp các lượt mới vào bản tóm tắt hiện có
+- Giữ lại các chủ đề đã nói, thông tin người học đã chia sẻ và các lỗi ngữ pháp lặp lại
+- Tối đa {max_chars} ký tự, không dùng markdown
+- Chỉ trả về bản tóm tắt
+""".strip()
+
+REPAIR_PROMPT = """
+Nội dung dưới đây lẽ ra phải là một đối tượng JSON gồm correction, reply và vocabulary nhưng bị sai định dạng.
+Hãy trả về đúng đối tượng JSON đó, giữ nguyên nội dung, chỉ sửa định dạng.
+
+{response}
+""".strip()
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimate the Gemini token count of text without an API call
+
+    Japanese characters count as one token each and other text as one token
+    per three characters, which errs on the high side for Vietnamese.
+    """
+    wide = sum(1 for char in text if ord(char) >= 0x3000)
+    return wide + (len(text) - wide + 2) // 3
+
+
+def format_history(history):
+    """Format conversation exchanges for a prompt"""
+    formatted = []
+    for entry in history:
+        if 'user_input' in entry:
+            formatted.append(f"Người học: 「{entry['user_input']}」")
+        if 'reply' in entry:
+            formatted.append(f"Giáo viên: 「{entry['reply']}」")
+    return "\n".join(formatted)
+
+
+class PromptBuilder:
+    """
+    Builds the per-turn part of the conversation prompt
+
+    The static instructions live in SYSTEM_INSTRUCTION. Each turn only sends
+    the recent exchanges, a rolling summary of older ones and the learner's
+    input, trimmed to the token budget of the learner's level.
+    """
+
+    def __init__(self, conversation_store, history_size):
+        """
+        Args:
+            conversation_store (ConversationStore): Store holding histories and summaries
+            history_size (int): Number of recent exchanges sent verbatim
+        """
+        self.conversation_store = conversation_store
+        self.history_size = history_size
+        self._summaries_in_flight = SingleFlight()
+
+    @property
+    def context_size(self):
+        """
+        Maximum number of exchanges sent verbatim
+
+        Older exchanges wait for a full batch before they are summarized, so
+        up to CONVERSATION_SUMMARY_BATCH - 1 of them are kept next to the
+        history window until then.
+        """
+        if not Config.CONVERSATION_SUMMARY_ENABLED:
+            return self.history_size
+        return self.history_size + Config.CONVERSATION_SUMMARY_BATCH - 1
+
+    def load_summary(self, user_id):
+        """Load a user's rolling summary, or None if there is none or it failed"""
+        if not Config.CONVERSATION_SUMMARY_ENABLED:
+            return None
+        try:
+            return self.conversation_store.load_summary(user_id)
+        except Exception as e:
+            print(f"Error loading conversation summary: {e}")
+            return None
+
+    def _render(self, topic, user_level, recent, summary_text, user_input, topic_changed):
+        """Fill in the turn template"""
+        return TURN_TEMPLATE.format(
+            topic=topic,
+            user_level=user_level,
+            summary_line=f"- Tóm tắt các lượt cũ hơn: {summary_text}\n" if summary_text else "",
+            history=format_history(recent) or "Chưa có hội thoại trước đó.",
+            topic_note=TOPIC_CHANGED_NOTE if topic_changed else "",
+            user_input=user_input
+        )
+
+    def build(self, topic, user_level, conversation_history, user_input, summary=None):
+        """
+        Build the prompt for one conversation turn within the level's token budget
+
+        Exchanges not yet covered by the summary are sent verbatim, up to
+        context_size. Over budget, the summary is shortened first (oldest part
+        first), then the oldest exchanges are dropped; the newest exchange and
+        the learner's input are always kept.
+
+        Args:
+            topic (str): Conversation theme
+            user_level (str): Japanese proficiency level (N5-N1)
+            conversation_history (list): Previous conversation exchanges, oldest first
+            user_input (str): User's input in Japanese
+            summary (dict): Rolling summary record from load_summary
+
+        Returns:
+            str: Prompt text to send with SYSTEM_INSTRUCTION
+        """
+        budget = Config.PROMPT_TOKEN_BUDGETS.get(user_level, Config.PROMPT_TOKEN_BUDGET_DEFAULT)
+        previous_topic = conversation_history[-1].get('topic') if conversation_history else None
+        topic_changed = bool(previous_topic) and previous_topic != topic
+
+        summary = summary or {}
+        summary_text = summary.get('text', '')
+        summarized_through = summary.get('through')
+
+        # Leave out exchanges the summary already covers
+        recent = [
+            entry for entry in conversation_history
+            if not (summarized_through and entry.get('timestamp') and entry['timestamp'] <= summarized_through)
+        ][-self.context_size:]
+
+        while True:
+            prompt = self._render(topic, user_level, recent, summary_text, user_input, topic_changed)
+            tokens = estimate_tokens(prompt)
+            if tokens <= budget:
+                break
+            if summary_text:
+                # Each estimated token is at most three characters
+                cut = max(16, (tokens - budget) * 3)
+                summary_text = summary_text[cut:] if len(summary_text) > cut else ""
+            elif len(recent) > 1:
+                recent.pop(0)
+            else:
+                break
+
+        logger.debug(f"Conversation prompt: ~{tokens} tokens (budget {budget}), {len(recent)} recent exchanges")
+        return prompt
+
+    def build_chat_message(self, topic, user_level, user_input, topic_changed=False):
+        """
+        Build the message sent for one turn of a chat session
+
+        Returns:
+            str: Message text
+        """
+        return CHAT_TURN_TEMPLATE.format(
+            topic=topic,
+            user_level=user_level,
+            topic_note=TOPIC_CHANGED_NOTE if topic_changed else "",
+            user_input=user_input
+        )
+
+    def build_chat_history(self, conversation_history, user_level, summary=None):
+        """
+        Rebuild structured chat history from stored exchanges
+
+        Each exchange becomes a user message in the chat turn format and a
+        model message with the JSON reply. The rolling summary, if any, opens
+        the history. The same token budget as build() applies: the summary
+        goes first, then the oldest exchanges.
+
+        Args:
+            conversation_history (list): Stored exchanges, oldest first
+            user_level (str): Japanese proficiency level, selects the budget
+            summary (dict): Rolling summary record from load_summary
+
+        Returns:
+            list: Contents for GenerativeModel.start_chat
+        """
+        budget = Config.PROMPT_TOKEN_BUDGETS.get(user_level, Config.PROMPT_TOKEN_BUDGET_DEFAULT)
+        summary = summary or {}
+        summarized_through = summary.get('through')
+
+        recent = [
+            entry for entry in conversation_history
+            if not (summarized_through and entry.get('timestamp') and entry['timestamp'] <= summarized_through)
+        ][-self.context_size:]
+
+        turns = []
+        previous_topic = None
+        for entry in recent:
+            topic = entry.get('topic', '')
+            user_message = self.build_chat_message(
+                topic, entry.get('user_level', user_level), entry.get('user_input', ''),
+                bool(previous_topic) and previous_topic != topic
+            )
+            model_message = json.dumps({
+                "correction": entry.get('correction', {}),
+                "reply": entry.get('reply', ''),
+                "vocabulary": entry.get('vocabulary', [])
+            }, ensure_ascii=False)
+            turns.append((user_message, model_message))
+            previous_topic = topic
+
+        if summary.get('text'):
+            turns.insert(0, (CHAT_SUMMARY_TEMPLATE.format(summary=summary['text']), CHAT_SUMMARY_ACK))
+
+        # Drop the oldest turns (the summary first) until the history fits
+        while len(turns) > 1 and sum(estimate_tokens(user) + estimate_tokens(model) for user, model in turns) > budget:
+            turns.pop(0)
+
+        contents = []
+        for user_message, model_message in turns:
+            contents.append({"role": "user", "parts": [user_message]})
+            contents.append({"role": "model", "parts": [model_message]})
+        return contents
+
+    def refresh_summary(self, user_id, summarize):
+        """
+        Fold exchanges that have left the history window into the user's summary
+
+        Runs once Config.CONVERSATION_SUMMARY_BATCH such exchanges have
+        accumulated, so the summary model is called every few turns rather
+        than on each one. Concurrent calls for the same user are coalesced.
+
+        Args:
+            user_id (str): Unique identifier for the user
+            summarize (callable): Takes a prompt and returns the summary text
+
+        Returns:
+            bool: Whether the summary was updated
+        """
+        if not Config.CONVERSATION_SUMMARY_ENABLED:
+            return False
+        updated, _ = self._summaries_in_flight.do(user_id, self._refresh_summary, user_id, summarize)
+        return updated
+
+    def _refresh_summary(self, user_id, summarize):
+        summary = self.conversation_store.load_summary(user_id) or {}
+        batch = Config.CONVERSATION_SUMMARY_BATCH
+
+        history = self.conversation_store.load(user_id, self.history_size + 2 * batch)
+        older = history[:-self.history_size] if len(history) > self.history_size else []
+        summarized_through = summary.get('through', '')
+        pending = [entry for entry in older if entry.get('timestamp', '') > summarized_through]
+        if len(pending) < batch:
+            return False
+
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary.get('text') or "Chưa có.",
+            exchanges=format_history(pending),
+            max_chars=Config.CONVERSATION_SUMMARY_MAX_CHARS
+        )
+        text = summarize(prompt).strip()
+        if not text:
+            return False
+
+        self.conversation_store.save_summary(user_id, {
+            "text": text[:Config.CONVERSATION_SUMMARY_MAX_CHARS],
+            "through": pending[-1].get('timestamp', ''),
+            "exchanges": summary.get('exchanges', 0) + len(pending),
+            "updated": datetime.now().isoformat()
+        })
+        return True
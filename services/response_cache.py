@@ -0,0 +1,109 @@
+import copy
+import hashlib
+import json
+import threading
+from cachetools import TTLCache
+from config import Config
+from services.audio_cache import normalize_text
+from utils.metrics import register_stats
+
+
+class ResponseCache:
+    """
+    In-memory cache of generated conversation turns
+
+    Only turns with little or no history are cached: their response depends
+    on nothing but the topic, level, the short history and the learner's
+    input, so popular openers can be answered without calling Gemini.
+    """
+
+    def __init__(self, max_entries=None, ttl=None):
+        """
+        Args:
+            max_entries (int): Maximum number of cached turns
+            ttl (int): Seconds a cached turn stays valid
+        """
+        self._entries = TTLCache(
+            maxsize=max_entries or Config.RESPONSE_CACHE_SIZE,
+            ttl=ttl or Config.RESPONSE_CACHE_TTL
+        )
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def make_key(model_name, topic, user_level, history, user_input):
+        """
+        Build the cache key for a turn
+
+        Args:
+            model_name (str): Gemini model generating the turn
+            topic (str): Conversation theme
+            user_level (str): Japanese proficiency level (N5-N1)
+            history (list): Exchanges preceding the turn
+            user_input (str): User's input in Japanese
+
+        Returns:
+            str: Hex digest identifying the turn
+        """
+        normalize = normalize_text
+        identity = [
+            model_name,
+            normalize(topic),
+            user_level,
+            [[normalize(entry.get('user_input', '')), normalize(entry.get('reply', ''))] for entry in history],
+            normalize(user_input)
+        ]
+        return hashlib.sha256(json.dumps(identity, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached turn
+
+        Returns:
+            dict: Entry with the parsed response (correction, reply, vocabulary) under "response", or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            self._stats["hits" if entry is not None else "misses"] += 1
+        # Callers add audio and grammar results to the response
+        return copy.deepcopy(entry)
+
+    def put(self, key, response_json):
+        """
+        Cache a generated turn
+
+        Args:
+            key (str): Key from make_key
+            response_json (dict): Parsed response (correction, reply, vocabulary)
+        """
+        entry = {
+            "response": {name: copy.deepcopy(response_json.get(name)) for name in ('correction', 'reply', 'vocabulary')}
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._stats["stores"] += 1
+
+    def stats(self):
+        """Hit, miss and store counters and the number of cached turns"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Get the process-wide response cache, creating it on first use"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
+
+
+register_stats(
+    'response_cache', lambda: _response_cache.stats() if _response_cache is not None else {},
+    counters=('hits', 'misses', 'stores')
+)
@@ -1,14 +1,213 @@
-import requests
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 from config import Config
+from utils.admission import (
+    TRANSIENT_STATUS_CODES, Overloaded, UpstreamHTTPError, retry_call, retry_call_async
+)
+from utils.helpers import AsyncSingleFlight, SingleFlight, get_http_session
+from utils.metrics import observe_stage, register_stats
+
 
 class SaplingService:
     """Service for integrating with Sapling API for grammar checking"""
     
+    _session = None
+    _session_lock = threading.Lock()
+    
+    # Successful results keyed on the exact text (edit offsets depend on it)
+    _cache = TTLCache(maxsize=Config.SAPLING_CACHE_SIZE, ttl=Config.SAPLING_CACHE_TTL)
+    _cache_lock = threading.Lock()
+    _in_flight = SingleFlight()
+    _async_in_flight = AsyncSingleFlight()
+    
+    _stats_lock = threading.Lock()
+    _stats = {
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "coalesced": 0,
+        "upstream_calls": 0,
+        "upstream_errors": 0,
+        "upstream_latency_total": 0.0,
+        "upstream_latency_max": 0.0
+    }
+    
+    @staticmethod
+    def _get_session():
+        """Get the shared keep-alive HTTP session"""
+        if SaplingService._session is None:
+            with SaplingService._session_lock:
+                if SaplingService._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=Config.SAPLING_POOL_SIZE
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    SaplingService._session = session
+        return SaplingService._session
+    
+    @staticmethod
+    def _count(name, value=1):
+        """Increment a stats counter"""
+        with SaplingService._stats_lock:
+            SaplingService._stats[name] += value
+    
+    @staticmethod
+    def _payload(text):
+        """Build the Sapling request body for one text"""
+        return {
+            "key": Config.SAPLING_API_KEY,
+            "session_id": "japanese_learning_app",
+            "text": text,
+            "lang": "ja"
+        }
+    
+    @staticmethod
+    def _record_upstream_call(elapsed):
+        """Record the latency of one upstream call"""
+        with SaplingService._stats_lock:
+            SaplingService._stats["upstream_calls"] += 1
+            SaplingService._stats["upstream_latency_total"] += elapsed
+            SaplingService._stats["upstream_latency_max"] = max(
+                SaplingService._stats["upstream_latency_max"], elapsed
+            )
+        observe_stage('sapling_call', elapsed)
+    
+    @staticmethod
+    def _check_upstream(text):
+        """Call the Sapling API for one text"""
+        payload = SaplingService._payload(text)
+        
+        started = time.perf_counter()
+        try:
+            response = SaplingService._get_session().post(
+                Config.SAPLING_API_URL,
+                json=payload,
+                timeout=(Config.SAPLING_CONNECT_TIMEOUT, Config.SAPLING_READ_TIMEOUT)
+            )
+        finally:
+            SaplingService._record_upstream_call(time.perf_counter() - started)
+        
+        if response.status_code == 200:
+            return SaplingService._success_result(text, response.json())
+        SaplingService._count("upstream_errors")
+        if response.status_code in TRANSIENT_STATUS_CODES:
+            raise UpstreamHTTPError(response.status_code, response.text)
+        return SaplingService._error_result(response.status_code, response.text)
+    
+    @staticmethod
+    def _check_admitted(text):
+        """Call the Sapling API under its admission limits, retrying transient failures"""
+        try:
+            return retry_call('sapling', SaplingService._check_upstream, text)
+        except UpstreamHTTPError as e:
+            return SaplingService._error_result(e.status_code, e.details)
+    
+    @staticmethod
+    async def _check_upstream_async(text):
+        """Call the Sapling API for one text without blocking the event loop"""
+        import aiohttp
+        
+        payload = SaplingService._payload(text)
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=Config.SAPLING_CONNECT_TIMEOUT,
+            sock_read=Config.SAPLING_READ_TIMEOUT
+        )
+        
+        started = time.perf_counter()
+        try:
+            async with get_http_session().post(Config.SAPLING_API_URL, json=payload, timeout=timeout) as response:
+                status_code = response.status
+                if status_code == 200:
+                    data = await response.json()
+                else:
+                    details = await response.text()
+        finally:
+            SaplingService._record_upstream_call(time.perf_counter() - started)
+        
+        if status_code == 200:
+            return SaplingService._success_result(text, data)
+        SaplingService._count("upstream_errors")
+        if status_code in TRANSIENT_STATUS_CODES:
+            raise UpstreamHTTPError(status_code, details)
+        return SaplingService._error_result(status_code, details)
+    
+    @staticmethod
+    async def _check_admitted_async(text):
+        """Async variant of _check_admitted"""
+        try:
+            return await retry_call_async('sapling', SaplingService._check_upstream_async, text)
+        except UpstreamHTTPError as e:
+            return SaplingService._error_result(e.status_code, e.details)
+    
+    @staticmethod
+    def _success_result(text, data):
+        """Build the result for a successful Sapling response"""
+        return {
+            "status": "success",
+            "original_text": text,
+            "corrections": data.get("edits", []),
+            "corrected_text": apply_corrections(text, data.get("edits", []))
+        }
+    
+    @staticmethod
+    def _error_result(status_code, details):
+        """Build the result for a failed Sapling response"""
+        return {
+            "status": "error",
+            "message": f"API error: {status_code}",
+            "details": details
+        }
+    
     @staticmethod
     def check_japanese_grammar(text):
         """
         Check Japanese text for grammar issues using Sapling API
         
+        Results are cached, and simultaneous checks of the same text share
+        one upstream call.
+        
+        Args:
+            text (str): Japanese text to check
+            
+        Returns:
+            dict: Result containing corrections and status
+        """
+        try:
+            with SaplingService._cache_lock:
+                cached = SaplingService._cache.get(text)
+            if cached is not None:
+                SaplingService._count("cache_hits")
+                return dict(cached)
+            SaplingService._count("cache_misses")
+            
+            result, shared = SaplingService._in_flight.do(text, SaplingService._check_admitted, text)
+            if shared:
+                SaplingService._count("coalesced")
+            elif result["status"] == "success":
+                with SaplingService._cache_lock:
+                    SaplingService._cache[text] = result
+            
+            return dict(result)
+                
+        except Overloaded as e:
+            return e.result()
+        except Exception as e:
+            SaplingService._count("upstream_errors")
+            return {"status": "error", "message": str(e)}
+    
+    @staticmethod
+    async def check_japanese_grammar_async(text):
+        """
+        Async variant of check_japanese_grammar for the async serving mode
+        
         Args:
             text (str): Japanese text to check
             
@@ -16,32 +215,96 @@ class SaplingService:
             dict: Result containing corrections and status
         """
         try:
-            payload = {
-                "key": Config.SAPLING_API_KEY,
-                "session_id": "japanese_learning_app",
-                "text": text,
-                "lang": "ja"
-            }
+            with SaplingService._cache_lock:
+                cached = SaplingService._cache.get(text)
+            if cached is not None:
+                SaplingService._count("cache_hits")
+                return dict(cached)
+            SaplingService._count("cache_misses")
             
-            response = requests.post(Config.SAPLING_API_URL, json=payload)
+            result, shared = await SaplingService._async_in_flight.do(
+                text, SaplingService._check_admitted_async, text
+            )
+            if shared:
+                SaplingService._count("coalesced")
+            elif result["status"] == "success":
+                with SaplingService._cache_lock:
+                    SaplingService._cache[text] = result
             
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "status": "success",
-                    "original_text": text,
-                    "corrections": data.get("edits", []),
-                    "corrected_text": apply_corrections(text, data.get("edits", []))
-                }
-            else:
-                return {
-                    "status": "error",
-                    "message": f"API error: {response.status_code}",
-                    "details": response.text
-                }
+            return dict(result)
                 
+        except Overloaded as e:
+            return e.result()
         except Exception as e:
+            SaplingService._count("upstream_errors")
             return {"status": "error", "message": str(e)}
+    
+    @staticmethod
+    def check_japanese_grammar_batch(texts):
+        """
+        Check several Japanese texts concurrently
+        
+        Identical texts are checked once. Each call runs at most
+        Config.SAPLING_BATCH_CONCURRENCY checks at a time on threads of its own,
+        so one large batch cannot hold up other requests' batches; the total
+        across requests is capped by the 'sapling' admission limits.
+        
+        Args:
+            texts (list): Japanese texts to check
+            
+        Returns:
+            list: One result per input text, in input order
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        if not unique_texts:
+            return []
+        
+        workers = min(len(unique_texts), Config.SAPLING_BATCH_CONCURRENCY)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sapling-batch') as pool:
+            results = dict(zip(unique_texts, pool.map(SaplingService.check_japanese_grammar, unique_texts)))
+        return [dict(results[text]) for text in texts]
+    
+    @staticmethod
+    async def check_japanese_grammar_batch_async(texts):
+        """
+        Async variant of check_japanese_grammar_batch
+        
+        A semaphore per call bounds the checks in flight, as in the sync variant.
+        
+        Args:
+            texts (list): Japanese texts to check
+            
+        Returns:
+            list: One result per input text, in input order
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        semaphore = asyncio.Semaphore(Config.SAPLING_BATCH_CONCURRENCY)
+        
+        async def check(text):
+            async with semaphore:
+                return await SaplingService.check_japanese_grammar_async(text)
+        
+        results = dict(zip(unique_texts, await asyncio.gather(*(check(text) for text in unique_texts))))
+        return [dict(results[text]) for text in texts]
+    
+    @staticmethod
+    def stats():
+        """
+        Get cache and upstream metrics
+        
+        Returns:
+            dict: Counters, cache hit ratio and upstream latency in seconds
+        """
+        with SaplingService._stats_lock:
+            stats = dict(SaplingService._stats)
+        with SaplingService._cache_lock:
+            stats["cache_entries"] = len(SaplingService._cache)
+        
+        lookups = stats["cache_hits"] + stats["cache_misses"]
+        stats["cache_hit_ratio"] = stats["cache_hits"] / lookups if lookups else 0.0
+        calls = stats["upstream_calls"]
+        stats["upstream_latency_mean"] = stats["upstream_latency_total"] / calls if calls else 0.0
+        return stats
 
 
 def apply_corrections(text, edits):
@@ -66,4 +329,10 @@ def apply_corrections(text, edits):
         
         text = text[:start] + replacement + text[end:]
     
-    return text
\ No newline at end of file
+    return text
+
+
+register_stats(
+    'sapling', SaplingService.stats,
+    counters=('cache_hits', 'cache_misses', 'coalesced', 'upstream_calls', 'upstream_errors')
+)
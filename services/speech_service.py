@@ -1,21 +1,331 @@
-import os
-import tempfile
-import speech_recognition as sr
-from gtts import gTTS
-from pydub import AudioSegment
+import asyncio
+import io
+import re
+import subprocess
+import threading
+import time
 import base64
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from config import Config
+from services.audio_cache import get_audio_cache
+from services.stt_backends import get_recognition_pool
+from utils.audio import (
+    AUDIO_OUTPUT_FORMATS, FFMPEG_INPUT_FORMATS, SilenceSegmenter, concat_mp3, pack_sentences, sniff_audio_format,
+    split_japanese_sentences
+)
+from utils.admission import Overloaded, retry_call, retry_call_async
+from utils.helpers import get_executor, get_http_session
+from utils.metrics import observe_stage, timed
+
+# Audio payload inside a Google Translate TTS response line
+GTTS_AUDIO_PATTERN = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+# Characters gTTS sends per request (gTTS.GOOGLE_TTS_MAX_CHARS); shorter text takes one round trip anyway
+GTTS_MAX_CHARS = 100
+
+
+class AudioLimitError(ValueError):
+    """Raised when an upload is larger or longer than the configured limits"""
 
 
 class SpeechService:
     """Service for handling speech-to-text and text-to-speech operations"""
 
+    # Sample format required by the recognizer: 16 kHz, mono, 16-bit PCM
+    RECOGNIZER_SAMPLE_RATE = 16000
+    RECOGNIZER_SAMPLE_WIDTH = 2
+
+    @staticmethod
+    def _max_pcm_bytes():
+        """Size of the longest accepted recording once decoded"""
+        return int(
+            Config.STT_MAX_DURATION_SECONDS * SpeechService.RECOGNIZER_SAMPLE_RATE * SpeechService.RECOGNIZER_SAMPLE_WIDTH
+        )
+
+    @staticmethod
+    def _frame_bytes():
+        """Size of one decoded frame"""
+        samples = SpeechService.RECOGNIZER_SAMPLE_RATE * Config.STT_FRAME_MS // 1000
+        return samples * SpeechService.RECOGNIZER_SAMPLE_WIDTH
+
+    @staticmethod
+    def _iter_pcm_frames(data, audio_format):
+        """
+        Decode audio to raw 16 kHz mono 16-bit PCM in fixed-size frames without touching disk
+        
+        WAV is parsed in memory; other containers are piped through ffmpeg,
+        which downmixes and resamples in the same pass, and its output is read
+        one frame at a time. MP4/M4A input must have its index at the start of
+        the file (fast start) to be piped. Decoding stops with AudioLimitError
+        as soon as the audio runs past Config.STT_MAX_DURATION_SECONDS.
+        
+        Args:
+            data (bytes): Encoded audio
+            audio_format (str): Container sniffed by sniff_audio_format
+            
+        Yields:
+            bytes: PCM frames of Config.STT_FRAME_MS (the last one may be shorter)
+        """
+        from pydub import AudioSegment
+        
+        frame_bytes = SpeechService._frame_bytes()
+        max_bytes = SpeechService._max_pcm_bytes()
+        
+        if audio_format == 'wav':
+            segment = AudioSegment.from_wav(io.BytesIO(data))
+            if segment.duration_seconds > Config.STT_MAX_DURATION_SECONDS:
+                raise AudioLimitError(f"Audio is longer than {Config.STT_MAX_DURATION_SECONDS:g} seconds")
+            segment = segment.set_channels(1)
+            segment = segment.set_frame_rate(SpeechService.RECOGNIZER_SAMPLE_RATE)
+            segment = segment.set_sample_width(SpeechService.RECOGNIZER_SAMPLE_WIDTH)
+            pcm = segment.raw_data
+            for offset in range(0, len(pcm), frame_bytes):
+                yield pcm[offset:offset + frame_bytes]
+            return
+        
+        command = [
+            AudioSegment.converter, '-nostdin', '-hide_banner', '-loglevel', 'error',
+            '-f', FFMPEG_INPUT_FORMATS[audio_format], '-i', 'pipe:0',
+            '-ac', '1', '-ar', str(SpeechService.RECOGNIZER_SAMPLE_RATE),
+            '-acodec', 'pcm_s16le', '-f', 's16le', 'pipe:1'
+        ]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        def feed():
+            try:
+                process.stdin.write(data)
+            except (BrokenPipeError, ValueError):
+                # ffmpeg stopped reading (error, or killed after the duration limit)
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+        
+        writer = threading.Thread(target=feed, name="stt-decode-feed", daemon=True)
+        writer.start()
+        try:
+            decoded = 0
+            while True:
+                frame = process.stdout.read(frame_bytes)
+                if not frame:
+                    break
+                decoded += len(frame)
+                if decoded > max_bytes:
+                    raise AudioLimitError(f"Audio is longer than {Config.STT_MAX_DURATION_SECONDS:g} seconds")
+                yield frame
+            
+            error = process.stderr.read()
+            if process.wait() != 0:
+                error = error.decode('utf-8', errors='replace').strip()
+                raise RuntimeError(f"Audio decoding failed: {error}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            writer.join()
+            process.stdout.close()
+            process.stderr.close()
+
+    @staticmethod
+    def _iter_frames(data):
+        """Check an upload against the limits and decode it in frames"""
+        if len(data) > Config.STT_MAX_UPLOAD_BYTES:
+            raise AudioLimitError(f"Audio is larger than {Config.STT_MAX_UPLOAD_BYTES} bytes")
+        
+        audio_format = sniff_audio_format(data)
+        if audio_format is None:
+            raise ValueError("Unsupported or unrecognized audio format")
+        
+        return SpeechService._iter_pcm_frames(data, audio_format)
+
+    @staticmethod
+    def decode_audio(data):
+        """
+        Decode uploaded audio into recognizer input
+        
+        Args:
+            data (bytes): Encoded audio in any supported container
+            
+        Returns:
+            sr.AudioData: 16 kHz mono audio ready for recognition
+        """
+        import speech_recognition as sr
+        
+        pcm = b''.join(SpeechService._iter_frames(data))
+        return sr.AudioData(pcm, SpeechService.RECOGNIZER_SAMPLE_RATE, SpeechService.RECOGNIZER_SAMPLE_WIDTH)
+
+    @staticmethod
+    def iter_segments(data):
+        """
+        Decode uploaded audio and split it at pauses
+        
+        Recordings up to Config.STT_MAX_SEGMENT_SECONDS come out whole, so one
+        answer is recognized in one request with its full context. Longer ones
+        are cut at pauses into segments of Config.STT_MIN_SEGMENT_SECONDS to
+        Config.STT_MAX_SEGMENT_SECONDS.
+        
+        Args:
+            data (bytes): Encoded audio in any supported container
+            
+        Yields:
+            sr.AudioData: 16 kHz mono segments ready for recognition, in order
+        """
+        import speech_recognition as sr
+        
+        segmenter = SilenceSegmenter(
+            SpeechService.RECOGNIZER_SAMPLE_RATE, SpeechService.RECOGNIZER_SAMPLE_WIDTH, Config.STT_FRAME_MS,
+            Config.STT_SILENCE_THRESHOLD_DBFS, Config.STT_MIN_SILENCE_MS,
+            Config.STT_MIN_SEGMENT_SECONDS, Config.STT_MAX_SEGMENT_SECONDS
+        )
+        
+        def audio_data(pcm):
+            return sr.AudioData(pcm, SpeechService.RECOGNIZER_SAMPLE_RATE, SpeechService.RECOGNIZER_SAMPLE_WIDTH)
+        
+        # Frames are held back until the recording proves longer than one segment
+        head, head_bytes = [], 0
+        
+        # Decoding is interleaved with recognition, so only the time spent decoding is added up
+        decode_seconds = 0.0
+        frames = SpeechService._iter_frames(data)
+        while True:
+            started = time.perf_counter()
+            frame = next(frames, None)
+            decode_seconds += time.perf_counter() - started
+            if frame is None:
+                break
+            if head is not None:
+                head.append(frame)
+                head_bytes += len(frame)
+                if head_bytes <= segmenter.max_segment_bytes:
+                    continue
+                pending, head = head, None
+            else:
+                pending = [frame]
+            for pending_frame in pending:
+                segment = segmenter.feed(pending_frame)
+                if segment is not None:
+                    yield audio_data(segment)
+        observe_stage('stt_decode', decode_seconds)
+        
+        if head is not None:
+            if head_bytes:
+                yield audio_data(b''.join(head))
+            return
+        
+        segment = segmenter.flush()
+        if segment is not None:
+            yield audio_data(segment)
+
+    @staticmethod
+    def _segment_text(future):
+        """Get a segment's transcript, treating unintelligible segments as empty"""
+        import speech_recognition as sr
+        
+        try:
+            return future.result()
+        except sr.UnknownValueError:
+            return ''
+
+    @staticmethod
+    def iter_transcripts(audio_bytes, language='ja-JP'):
+        """
+        Recognize the segments of a recording concurrently
+        
+        Segments are queued on the recognition pool while decoding continues,
+        with at most Config.STT_SEGMENT_CONCURRENCY of them in flight.
+        
+        Args:
+            audio_bytes (bytes): Encoded audio
+            language (str): Language code
+            
+        Yields:
+            tuple: (segment index, transcript) in completion order; the
+                transcript is empty for a segment without intelligible speech
+        """
+        pool = get_recognition_pool()
+        pool.backend.check_language(language)
+        pending = {}
+        for index, segment in enumerate(SpeechService.iter_segments(audio_bytes)):
+            pending[pool.submit(segment, language)] = index
+            if len(pending) >= Config.STT_SEGMENT_CONCURRENCY:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), SpeechService._segment_text(future)
+        
+        for future in as_completed(list(pending)):
+            yield pending.pop(future), SpeechService._segment_text(future)
+
+    @staticmethod
+    async def iter_transcripts_async(audio_bytes, language='ja-JP'):
+        """
+        Async variant of iter_transcripts
+        
+        The recording is decoded and segmented in a worker thread first (its
+        size is bounded by the upload limits); recognition is then awaited with
+        at most Config.STT_SEGMENT_CONCURRENCY segments in flight.
+        """
+        import speech_recognition as sr
+        
+        pool = get_recognition_pool()
+        pool.backend.check_language(language)
+        segments = await asyncio.to_thread(lambda: list(SpeechService.iter_segments(audio_bytes)))
+        semaphore = asyncio.Semaphore(Config.STT_SEGMENT_CONCURRENCY)
+        
+        async def recognize(index, segment):
+            async with semaphore:
+                try:
+                    return index, await pool.recognize_async(segment, language)
+                except sr.UnknownValueError:
+                    return index, ''
+        
+        tasks = [asyncio.ensure_future(recognize(index, segment)) for index, segment in enumerate(segments)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def join_transcripts(transcripts, language='ja-JP'):
+        """
+        Join segment transcripts in order
+        
+        Args:
+            transcripts (dict): Transcript by segment index
+            language (str): Language code; Japanese and Chinese are joined without spaces
+            
+        Returns:
+            str: Full transcript
+        """
+        separator = '' if language.startswith(('ja', 'zh')) else ' '
+        return separator.join(transcripts[index] for index in sorted(transcripts) if transcripts[index])
+
+    @staticmethod
+    def _transcription_result(transcripts, language):
+        """Build the speech-to-text result from segment transcripts"""
+        text = SpeechService.join_transcripts(transcripts, language)
+        if not text:
+            return {"status": "error", "message": "No speech could be recognized"}
+        return {"status": "success", "text": text, "segments": len(transcripts)}
+
+    @staticmethod
+    def _transcription_error(error):
+        """Build the speech-to-text result for a failure"""
+        result = {"status": "error", "message": str(error)}
+        if isinstance(error, AudioLimitError):
+            result["limit_exceeded"] = True
+        return result
+
     @staticmethod
     def speech_to_text(audio_data, language='ja-JP'):
         """
         Convert speech to text
         
         Args:
-            audio_data (bytes): Base64 encoded audio data (can be mp3 or wav)
+            audio_data (bytes): Base64 encoded audio data (wav, mp3, ogg, flac, webm, mp4, aac...)
             language (str): Language code (default: Japanese)
             
         Returns:
@@ -24,59 +334,410 @@ class SpeechService:
         try:
             # Decode base64 audio data
             decoded_audio = base64.b64decode(audio_data)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        
+        return SpeechService.transcribe(decoded_audio, language)
+    
+    @staticmethod
+    def transcribe(audio_bytes, language='ja-JP'):
+        """
+        Convert uploaded binary audio to text
+        
+        Args:
+            audio_bytes (bytes): Encoded audio (wav, mp3, ogg, flac, webm, mp4, aac...)
+            language (str): Language code (default: Japanese)
             
-            # Save raw audio to a temporary file (assume it's MP3 or unknown)
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_input_audio:
-                temp_input_audio.write(decoded_audio)
-                temp_input_path = temp_input_audio.name
+        Returns:
+            dict: Result containing text, number of segments and status
+                (limit_exceeded is set when the upload is too large or too long)
+        """
+        try:
+            transcripts = dict(SpeechService.iter_transcripts(audio_bytes, language))
+            return SpeechService._transcription_result(transcripts, language)
+            
+        except Exception as e:
+            return SpeechService._transcription_error(e)
+    
+    @staticmethod
+    def stream_transcription(audio_bytes, language='ja-JP'):
+        """
+        Convert uploaded binary audio to text, reporting each segment as it is recognized
+        
+        Args:
+            audio_bytes (bytes): Encoded audio
+            language (str): Language code (default: Japanese)
+            
+        Yields:
+            tuple: (event name, event data) pairs; event is one of
+                partial ({"index", "text"}), done (the transcribe result) or error
+        """
+        try:
+            transcripts = {}
+            for index, text in SpeechService.iter_transcripts(audio_bytes, language):
+                transcripts[index] = text
+                yield 'partial', {"index": index, "text": text}
+            result = SpeechService._transcription_result(transcripts, language)
+        except Exception as e:
+            result = SpeechService._transcription_error(e)
+        
+        yield ('done' if result['status'] == 'success' else 'error'), result
+    
+    @staticmethod
+    async def speech_to_text_async(audio_data, language='ja-JP'):
+        """
+        Async variant of speech_to_text for the async serving mode
+        
+        Args:
+            audio_data (bytes): Base64 encoded audio data
+            language (str): Language code (default: Japanese)
+            
+        Returns:
+            dict: Result containing text and status
+        """
+        try:
+            decoded_audio = base64.b64decode(audio_data)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        
+        return await SpeechService.transcribe_async(decoded_audio, language)
+    
+    @staticmethod
+    async def transcribe_async(audio_bytes, language='ja-JP'):
+        """Async variant of transcribe"""
+        try:
+            transcripts = {}
+            async for index, text in SpeechService.iter_transcripts_async(audio_bytes, language):
+                transcripts[index] = text
+            return SpeechService._transcription_result(transcripts, language)
+            
+        except Exception as e:
+            return SpeechService._transcription_error(e)
+    
+    @staticmethod
+    async def stream_transcription_async(audio_bytes, language='ja-JP'):
+        """Async variant of stream_transcription"""
+        try:
+            transcripts = {}
+            async for index, text in SpeechService.iter_transcripts_async(audio_bytes, language):
+                transcripts[index] = text
+                yield 'partial', {"index": index, "text": text}
+            result = SpeechService._transcription_result(transcripts, language)
+        except Exception as e:
+            result = SpeechService._transcription_error(e)
+        
+        yield ('done' if result['status'] == 'success' else 'error'), result
+    
+    @staticmethod
+    def _synthesize(text, language='ja', slow=False):
+        """
+        Synthesize speech with gTTS entirely in memory
 
-            # Convert to WAV (PCM) format using pydub
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
-                audio_segment = AudioSegment.from_file(temp_input_path)
-                audio_segment.export(temp_wav.name, format="wav")
-                temp_wav_path = temp_wav.name
+        Args:
+            text (str): Text to convert to speech
+            language (str): Language code
+            slow (bool): Whether to read the text slowly
 
-            # Speech recognition using WAV
-            recognizer = sr.Recognizer()
-            with sr.AudioFile(temp_wav_path) as source:
-                audio = recognizer.record(source)
-                text = recognizer.recognize_google(audio, language=language)
+        Returns:
+            bytes: MP3 audio
+        """
+        from gtts import gTTS
+        
+        buffer = io.BytesIO()
+        tts = gTTS(text=text, lang=language, slow=slow)
+        tts.write_to_fp(buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _synthesize_limited(text, language='ja', slow=False):
+        """_synthesize under the text-to-speech admission limits, retrying transient failures"""
+        return retry_call('tts', SpeechService._synthesize, text, language, slow)
 
-            # Clean up temp files
-            os.unlink(temp_input_path)
-            os.unlink(temp_wav_path)
+    @staticmethod
+    def _cached_synthesize(text, language, slow, synthesize):
+        """
+        Synthesize text through the audio cache
+        
+        Args:
+            text (str): Text to convert to speech
+            language (str): Language code
+            slow (bool): Whether to read the text slowly
+            synthesize (callable): Function producing MP3 bytes on a cache miss
             
-            return {"status": "success", "text": text}
+        Returns:
+            bytes: MP3 audio
+        """
+        if not Config.TTS_CACHE_ENABLED:
+            return synthesize(text, language, slow)
+        
+        cache = get_audio_cache()
+        key = cache.make_key(text, language, slow)
+        audio_bytes = cache.get(key)
+        if audio_bytes is None:
+            audio_bytes = synthesize(text, language, slow)
+            cache.put(key, audio_bytes)
+        return audio_bytes
+    
+    @staticmethod
+    def _tts_chunks(text):
+        """Split text for synthesis: whole if gTTS takes it in one request, else sentence-aligned chunks"""
+        if len(text) <= GTTS_MAX_CHARS:
+            return [text]
+        return pack_sentences(split_japanese_sentences(text), GTTS_MAX_CHARS)
+    
+    @staticmethod
+    def _synthesize_chunked(text, language='ja', slow=False):
+        """
+        Synthesize text longer than one gTTS request in parallel chunks
+        
+        Text within GTTS_MAX_CHARS is a single request. Longer text is cut at
+        sentence ends into chunks of up to GTTS_MAX_CHARS, each cached on its
+        own, and the MP3 segments are joined in memory.
+        
+        Args:
+            text (str): Text to convert to speech
+            language (str): Language code
+            slow (bool): Whether to read the text slowly
+            
+        Returns:
+            bytes: MP3 audio
+        """
+        chunks = SpeechService._tts_chunks(text)
+        if len(chunks) <= 1:
+            return SpeechService._synthesize_limited(text, language, slow)
+        
+        pool = get_executor('tts-chunks', Config.TTS_CHUNK_MAX_WORKERS)
+        futures = [
+            pool.submit(SpeechService._cached_synthesize, chunk, language, slow, SpeechService._synthesize_limited)
+            for chunk in chunks
+        ]
+        return concat_mp3([future.result() for future in futures])
+    
+    @staticmethod
+    def _transcode(audio_bytes, audio_format):
+        """
+        Re-encode gTTS MP3 audio in one ffmpeg pass, entirely in memory
+        
+        Args:
+            audio_bytes (bytes): MP3 audio
+            audio_format (str): Key of AUDIO_OUTPUT_FORMATS with ffmpeg arguments
             
+        Returns:
+            bytes: Audio in the requested encoding
+        """
+        from pydub import AudioSegment
+        
+        command = [
+            AudioSegment.converter, '-nostdin', '-hide_banner', '-loglevel', 'error',
+            '-f', 'mp3', '-i', 'pipe:0', *AUDIO_OUTPUT_FORMATS[audio_format]['ffmpeg'], 'pipe:1'
+        ]
+        process = subprocess.run(command, input=audio_bytes, capture_output=True)
+        if process.returncode != 0 or not process.stdout:
+            error = process.stderr.decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"Audio encoding failed: {error}")
+        return process.stdout
+    
+    @staticmethod
+    def _encoded_key(text, language, slow, audio_format):
+        """Audio cache key of speech in audio_format"""
+        return get_audio_cache().make_key(text, language, slow, audio_format)
+    
+    @staticmethod
+    def _cached_encoded(text, language, slow, audio_format):
+        """Speech already transcoded to audio_format by an earlier request, or None"""
+        if AUDIO_OUTPUT_FORMATS[audio_format]['ffmpeg'] is None or not Config.TTS_CACHE_ENABLED:
+            return None
+        return get_audio_cache().get(SpeechService._encoded_key(text, language, slow, audio_format))
+    
+    @staticmethod
+    def _encode(audio_bytes, text, language, slow, audio_format):
+        """
+        Transcode freshly synthesized MP3 to audio_format and cache the result
+        
+        Returns:
+            tuple: (audio bytes, encoding produced); the MP3 is returned as is
+                if transcoding fails, e.g. when ffmpeg lacks the encoder
+        """
+        if AUDIO_OUTPUT_FORMATS[audio_format]['ffmpeg'] is None:
+            return audio_bytes, audio_format
+        
+        try:
+            with timed('tts_transcode'):
+                encoded = SpeechService._transcode(audio_bytes, audio_format)
         except Exception as e:
-            return {"status": "error", "message": str(e)}
+            print(f"Falling back to MP3, transcoding to {audio_format} failed: {e}")
+            return audio_bytes, 'mp3'
+        
+        if Config.TTS_CACHE_ENABLED:
+            get_audio_cache().put(SpeechService._encoded_key(text, language, slow, audio_format), encoded)
+        return encoded, audio_format
     
     @staticmethod
-    def text_to_speech(text, language='ja'):
+    def _speech_result(audio_bytes, text, language, slow, inline, audio_format='mp3'):
+        """
+        Build a text-to-speech result
+        
+        Cached audio is addressed by audio_id and downloaded from /api/audio/<audio_id>;
+        base64 audio_data is added when inline is requested or the audio is not cached.
+        """
+        audio_id = None
+        if Config.TTS_CACHE_ENABLED:
+            audio_id = SpeechService._encoded_key(text, language, slow, audio_format)
+        audio_data = None
+        if inline or audio_id is None:
+            audio_data = base64.b64encode(audio_bytes).decode('utf-8')
+        
+        return {
+            "status": "success",
+            "audio_id": audio_id,
+            "audio_data": audio_data,
+            "audio_format": audio_format,
+            "mime_type": AUDIO_OUTPUT_FORMATS[audio_format]['mimetype']
+        }
+    
+    @staticmethod
+    def text_to_speech(text, language='ja', slow=False, inline=True, audio_format=None):
         """
         Convert text to speech
         
+        Compact encodings are transcoded from the synthesized MP3 once and
+        cached per encoding, so repeated text is served without ffmpeg.
+        
         Args:
             text (str): Text to convert to speech
             language (str): Language code (default: Japanese)
+            slow (bool): Whether to read the text slowly
+            inline (bool): Include the audio base64 encoded in the result
+            audio_format (str): Key of AUDIO_OUTPUT_FORMATS (default: Config.TTS_AUDIO_FORMAT)
             
         Returns:
-            dict: Result containing audio data and status
+            dict: Result containing the audio id, audio data, its encoding and status
         """
         try:
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_audio:
-                tts = gTTS(text=text, lang=language, slow=False)
-                tts.save(temp_audio.name)
-                temp_audio_path = temp_audio.name
+            audio_format = audio_format or Config.TTS_AUDIO_FORMAT
+            synthesize = SpeechService._synthesize_chunked if Config.TTS_CHUNKED else SpeechService._synthesize_limited
+            with timed('tts'):
+                audio_bytes = SpeechService._cached_encoded(text, language, slow, audio_format)
+                if audio_bytes is None:
+                    audio_bytes = SpeechService._cached_synthesize(text, language, slow, synthesize)
+                    audio_bytes, audio_format = SpeechService._encode(audio_bytes, text, language, slow, audio_format)
             
-            # Read the audio file and convert to base64
-            with open(temp_audio_path, "rb") as audio_file:
-                audio_data = base64.b64encode(audio_file.read()).decode('utf-8')
+            return SpeechService._speech_result(audio_bytes, text, language, slow, inline, audio_format)
             
-            # Clean up
-            os.unlink(temp_audio_path)
+        except Overloaded as e:
+            return e.result()
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+    
+    @staticmethod
+    async def _fetch_tts_part(prepared_request):
+        """Send one gTTS request through aiohttp and extract its MP3 data"""
+        async with get_http_session().post(
+            prepared_request.url, data=prepared_request.body, headers=dict(prepared_request.headers)
+        ) as response:
+            response.raise_for_status()
+            body = await response.text()
+        
+        # Same response parsing as gTTS.stream
+        for line in body.splitlines():
+            if 'jQ1olc' in line:
+                match = GTTS_AUDIO_PATTERN.search(line)
+                if match:
+                    return base64.b64decode(match.group(1).encode('ascii'))
+        raise RuntimeError("No audio stream in text-to-speech response")
+    
+    @staticmethod
+    async def _synthesize_async(text, language='ja', slow=False):
+        """
+        Synthesize speech by sending gTTS's requests through aiohttp
+        
+        The requests come from gTTS's private _prepare_requests, which is why
+        requirements.txt pins gTTS; without it synthesis falls back to
+        _synthesize on a worker thread.
+        
+        Args:
+            text (str): Text to convert to speech
+            language (str): Language code
+            slow (bool): Whether to read the text slowly
+            
+        Returns:
+            bytes: MP3 audio
+        """
+        from gtts import gTTS
+        
+        tts = gTTS(text=text, lang=language, slow=slow)
+        prepare_requests = getattr(tts, '_prepare_requests', None)
+        if prepare_requests is None:
+            return await asyncio.to_thread(SpeechService._synthesize, text, language, slow)
+        parts = await asyncio.gather(
+            *(SpeechService._fetch_tts_part(prepared) for prepared in prepare_requests())
+        )
+        return b''.join(parts)
+    
+    @staticmethod
+    async def _synthesize_limited_async(text, language='ja', slow=False):
+        """Async variant of _synthesize_limited"""
+        return await retry_call_async('tts', SpeechService._synthesize_async, text, language, slow)
+    
+    @staticmethod
+    async def _cached_synthesize_async(text, language, slow, synthesize):
+        """Async variant of _cached_synthesize"""
+        if not Config.TTS_CACHE_ENABLED:
+            return await synthesize(text, language, slow)
+        
+        # Cache reads and writes touch the disk, so they run off the event loop
+        cache = await asyncio.to_thread(get_audio_cache)
+        key = cache.make_key(text, language, slow)
+        audio_bytes = await asyncio.to_thread(cache.get, key)
+        if audio_bytes is None:
+            audio_bytes = await synthesize(text, language, slow)
+            await asyncio.to_thread(cache.put, key, audio_bytes)
+        return audio_bytes
+    
+    @staticmethod
+    async def _synthesize_chunked_async(text, language='ja', slow=False):
+        """Async variant of _synthesize_chunked"""
+        chunks = SpeechService._tts_chunks(text)
+        if len(chunks) <= 1:
+            return await SpeechService._synthesize_limited_async(text, language, slow)
+        
+        segments = await asyncio.gather(*(
+            SpeechService._cached_synthesize_async(chunk, language, slow, SpeechService._synthesize_limited_async)
+            for chunk in chunks
+        ))
+        return concat_mp3(segments)
+    
+    @staticmethod
+    async def text_to_speech_async(text, language='ja', slow=False, inline=True, audio_format=None):
+        """
+        Async variant of text_to_speech for the async serving mode
+        
+        Args:
+            text (str): Text to convert to speech
+            language (str): Language code (default: Japanese)
+            slow (bool): Whether to read the text slowly
+            inline (bool): Include the audio base64 encoded in the result
+            audio_format (str): Key of AUDIO_OUTPUT_FORMATS (default: Config.TTS_AUDIO_FORMAT)
             
-            return {"status": "success", "audio_data": audio_data}
+        Returns:
+            dict: Result containing the audio id, audio data, its encoding and status
+        """
+        try:
+            audio_format = audio_format or Config.TTS_AUDIO_FORMAT
+            synthesize = (
+                SpeechService._synthesize_chunked_async if Config.TTS_CHUNKED else SpeechService._synthesize_limited_async
+            )
+            with timed('tts'):
+                audio_bytes = await asyncio.to_thread(SpeechService._cached_encoded, text, language, slow, audio_format)
+                if audio_bytes is None:
+                    audio_bytes = await SpeechService._cached_synthesize_async(text, language, slow, synthesize)
+                    audio_bytes, audio_format = await asyncio.to_thread(
+                        SpeechService._encode, audio_bytes, text, language, slow, audio_format
+                    )
+            
+            return SpeechService._speech_result(audio_bytes, text, language, slow, inline, audio_format)
             
+        except Overloaded as e:
+            return e.result()
         except Exception as e:
-            return {"status": "error", "message": str(e)}
\ No newline at end of file
+            return {"status": "error", "message": str(e)}
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from config import Config
+from utils.helpers import get_http_session
+from utils.metrics import timed
+
+
+class RecognizerBackend:
+    """Base interface for speech recognition engines"""
+
+    name = None
+
+    # Whether recognize_async talks to the engine without a pool worker
+    supports_async = False
+
+    def default_pool_size(self):
+        """
+        Pool workers to start when STT_POOL_SIZE is not set
+
+        Local engines are CPU bound, so one worker per core.
+        """
+        return os.cpu_count() or 1
+
+    def check_language(self, language):
+        """
+        Reject a language the engine cannot recognize
+
+        Args:
+            language (str): Language code (e.g. ja-JP)
+
+        Raises:
+            ValueError: If the engine does not support language
+        """
+
+    def create_recognizer(self):
+        """
+        Create one recognizer instance for a pool worker
+
+        Returns:
+            Engine-specific recognizer object
+        """
+        raise NotImplementedError
+
+    def recognize(self, recognizer, audio, language):
+        """
+        Recognize one clip
+
+        Args:
+            recognizer: Object returned by create_recognizer
+            audio (sr.AudioData): Audio to recognize
+            language (str): Language code (e.g. ja-JP)
+
+        Returns:
+            str: Transcript
+        """
+        raise NotImplementedError
+
+    async def recognize_async(self, audio, language):
+        """
+        Recognize one clip without blocking the event loop
+
+        Only implemented by backends with supports_async set.
+        """
+        raise NotImplementedError
+
+
+class GoogleRecognizerBackend(RecognizerBackend):
+    """Google Web Speech API through speech_recognition (needs network)"""
+
+    name = 'google'
+
+    def create_recognizer(self):
+        import speech_recognition as sr
+
+        return sr.Recognizer()
+
+    supports_async = True
+
+    def default_pool_size(self):
+        # Workers mostly wait on the network, so far more of them than cores
+        return Config.STT_NETWORK_POOL_SIZE
+
+    def recognize(self, recognizer, audio, language):
+        return recognizer.recognize_google(audio, language=language)
+
+    async def recognize_async(self, audio, language):
+        import speech_recognition as sr
+        from speech_recognition.recognizers import google
+
+        # FLAC encoding runs an external encoder, so build the request off the loop
+        builder = google.create_request_builder(endpoint=google.ENDPOINT, language=language)
+        request = await asyncio.to_thread(builder.build, audio)
+
+        async with get_http_session().post(
+            request.full_url, data=request.data, headers=dict(request.header_items())
+        ) as response:
+            if response.status != 200:
+                raise sr.RequestError(f"recognition request failed: {response.reason}")
+            response_text = await response.text()
+
+        return google.OutputParser(show_all=False, with_confidence=False).parse(response_text)
+
+
+class VoskRecognizerBackend(RecognizerBackend):
+    """Offline Vosk (Kaldi) engine; the model is loaded once per worker process"""
+
+    name = 'vosk'
+
+    def __init__(self, model_path=None, model_language=None):
+        """
+        Args:
+            model_path (str): Directory of the Vosk model
+            model_language (str): Language of that model (e.g. ja); other languages are rejected
+        """
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("STT_BACKEND=vosk requires the 'vosk' package (pip3 install vosk)")
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = vosk.Model(model_path or Config.VOSK_MODEL_PATH)
+        self.model_language = (model_language or Config.VOSK_MODEL_LANGUAGE).lower()
+
+    def check_language(self, language):
+        # One model recognizes one language
+        if language.lower().split('-')[0] != self.model_language:
+            raise ValueError(
+                f"Language {language} is not supported by the loaded Vosk model ({self.model_language})"
+            )
+
+    def create_recognizer(self):
+        return self._vosk.KaldiRecognizer(self.model, 16000)
+
+    def recognize(self, recognizer, audio, language):
+        self.check_language(language)
+        try:
+            recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=16000, convert_width=2))
+            text = json.loads(recognizer.FinalResult()).get('text', '')
+        finally:
+            recognizer.Reset()
+
+        if not text:
+            import speech_recognition as sr
+
+            raise sr.UnknownValueError()
+        # Vosk separates Japanese words with spaces
+        if language.startswith('ja'):
+            text = text.replace(' ', '')
+        return text
+
+
+STT_BACKENDS = {
+    'google': GoogleRecognizerBackend,
+    'vosk': VoskRecognizerBackend,
+}
+
+
+class _RecognitionJob:
+    """One clip waiting for a pool worker"""
+
+    def __init__(self, audio, language):
+        self.audio = audio
+        self.language = language
+        self.future = Future()
+
+
+class RecognitionPool:
+    """
+    Fixed set of worker threads, each owning one preloaded recognizer
+
+    Requests queue up and are served by the next free worker, so concurrency
+    is bounded by the pool size.
+    """
+
+    def __init__(self, backend, size):
+        """
+        Start the workers and warm their recognizers
+
+        Args:
+            backend (RecognizerBackend): Engine to use
+            size (int): Number of workers
+        """
+        self.backend = backend
+        self.size = size
+        self._jobs = queue.Queue()
+        self._workers = []
+
+        for index in range(size):
+            recognizer = backend.create_recognizer()
+            worker = threading.Thread(
+                target=self._work, args=(recognizer,), name=f"stt-{backend.name}-{index}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self, recognizer):
+        """Worker loop"""
+        while True:
+            job = self._jobs.get()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                with timed('stt_recognize'):
+                    job.future.set_result(self.backend.recognize(recognizer, job.audio, job.language))
+            except Exception as e:
+                job.future.set_exception(e)
+
+    def recognize(self, audio, language):
+        """
+        Recognize a clip on the next free worker, blocking until done
+
+        Args:
+            audio (sr.AudioData): Audio to recognize
+            language (str): Language code
+
+        Returns:
+            str: Transcript
+        """
+        return self.submit(audio, language).result()
+
+    async def recognize_async(self, audio, language):
+        """
+        Recognize a clip from a coroutine
+        
+        Backends with native async I/O are awaited directly; others run on a
+        pool worker without blocking the event loop.
+
+        Args:
+            audio (sr.AudioData): Audio to recognize
+            language (str): Language code
+
+        Returns:
+            str: Transcript
+        """
+        if self.backend.supports_async:
+            with timed('stt_recognize'):
+                return await self.backend.recognize_async(audio, language)
+        return await asyncio.wrap_future(self.submit(audio, language))
+
+    def submit(self, audio, language):
+        """
+        Queue a clip for recognition
+
+        Returns:
+            Future: Resolves to the transcript
+        """
+        job = _RecognitionJob(audio, language)
+        self._jobs.put(job)
+        return job.future
+
+
+_recognition_pool = None
+_recognition_pool_lock = threading.Lock()
+
+
+def get_recognition_pool():
+    """
+    Get this process's recognition pool, creating it on first use
+
+    Created lazily so that forked worker processes each load their own model.
+    """
+    global _recognition_pool
+    if _recognition_pool is None:
+        with _recognition_pool_lock:
+            if _recognition_pool is None:
+                if Config.STT_BACKEND not in STT_BACKENDS:
+                    raise ValueError(f"Unknown speech recognition backend: {Config.STT_BACKEND}")
+                backend = STT_BACKENDS[Config.STT_BACKEND]()
+                _recognition_pool = RecognitionPool(backend, Config.STT_POOL_SIZE or backend.default_pool_size())
+    return _recognition_pool
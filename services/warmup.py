@@ -0,0 +1,144 @@
+import importlib
+import os
+import threading
+import time
+from services.audio_cache import get_audio_cache
+from services.conversation_store import get_conversation_store
+from services.gemini_service import get_gemini_service
+from services.sapling_service import SaplingService
+from services.stt_backends import get_recognition_pool
+
+# Third-party packages the services import on first use
+HEAVY_MODULES = [
+    'google.generativeai',
+    'speech_recognition',
+    'gtts',
+    'pydub',
+    'requests',
+    'aiohttp',
+]
+
+
+def _warm_gemini():
+    """Create the shared conversation model and its gRPC client"""
+    from google.generativeai import client as genai_client
+
+    get_gemini_service('conversation').model
+    genai_client.get_default_generative_client()
+
+
+WARMUP_STEPS = [
+    ('gemini', _warm_gemini),
+    ('conversation_store', get_conversation_store),
+    ('audio_cache', get_audio_cache),
+    ('sapling', SaplingService._get_session),
+    ('speech_recognition', get_recognition_pool),
+]
+
+_backend_state = {name: {"ready": False, "seconds": None, "error": None} for name, _ in WARMUP_STEPS}
+_state_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def preload_modules():
+    """
+    Import the heavy third-party packages now instead of on first use
+
+    Used by the production entry point so a pre-fork master imports them
+    once and every worker shares the loaded code.
+
+    Returns:
+        dict: Seconds spent importing each package (None if it is missing)
+    """
+    timings = {}
+    for module_name in HEAVY_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+            timings[module_name] = time.perf_counter() - started
+        except ImportError as e:
+            print(f"Error preloading {module_name}: {e}")
+            timings[module_name] = None
+    return timings
+
+
+def warm_up():
+    """
+    Create this process's shared clients before the first request
+
+    Meant to run once per worker process after fork: gRPC channels, thread
+    pools and speech models must not be created in a pre-fork master.
+    Backends that are already warm are skipped, so calling it again retries
+    only the ones that failed.
+
+    Returns:
+        dict: Seconds spent warming each backend (None if it failed)
+    """
+    timings = {}
+    for name, step in WARMUP_STEPS:
+        with _state_lock:
+            if _backend_state[name]["ready"]:
+                timings[name] = _backend_state[name]["seconds"]
+                continue
+
+        started = time.perf_counter()
+        try:
+            step()
+            seconds = time.perf_counter() - started
+            state = {"ready": True, "seconds": seconds, "error": None}
+        except Exception as e:
+            print(f"Error warming up {name}: {e}")
+            seconds = None
+            state = {"ready": False, "seconds": None, "error": str(e)}
+
+        with _state_lock:
+            _backend_state[name] = state
+        timings[name] = seconds
+    return timings
+
+
+def start_warm_up(callback=None):
+    """
+    Warm up in a background thread unless that is already under way
+
+    Args:
+        callback (callable): Called with the warm_up() timings when done
+
+    Returns:
+        bool: Whether a new warm-up was started
+    """
+    global _warm_up_thread
+    with _state_lock:
+        if _warm_up_thread is not None and _warm_up_thread.is_alive():
+            return False
+        if all(state["ready"] for state in _backend_state.values()):
+            return False
+
+        def run():
+            timings = warm_up()
+            if callback:
+                callback(timings)
+
+        _warm_up_thread = threading.Thread(target=run, name="warm-up", daemon=True)
+        _warm_up_thread.start()
+        return True
+
+
+def readiness():
+    """
+    Report which backends are warm in this process
+
+    Returns:
+        dict: Overall status ('ready' or 'warming'), per-backend state, and this
+            worker's and its gunicorn master's PIDs (graceful_reload.sh uses them
+            to tell the new generation of workers from the old one)
+    """
+    with _state_lock:
+        backends = {name: dict(state) for name, state in _backend_state.items()}
+    ready = all(state["ready"] for state in backends.values())
+    return {
+        "status": "ready" if ready else "warming",
+        "backends": backends,
+        "pid": os.getpid(),
+        "master_pid": os.getppid()
+    }
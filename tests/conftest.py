@@ -0,0 +1,17 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Config reads the environment on import, so point every on-disk store at a
+# scratch directory and switch off the calls that would leave the machine
+# before any application module is imported
+_data_dir = tempfile.mkdtemp(prefix='jfix-tests-')
+os.environ['CONVERSATIONS_DIR'] = os.path.join(_data_dir, 'conversations')
+os.environ['TTS_CACHE_DIR'] = os.path.join(_data_dir, 'audio_cache')
+os.environ['GEMINI_API_KEY'] = 'test'
+os.environ['CHAT_SESSIONS_ENABLED'] = 'false'
+os.environ['CONVERSATION_SUMMARY_ENABLED'] = 'false'
+
+# Registered first so it runs last, after the history buffer's exit flush
+atexit.register(shutil.rmtree, _data_dir, ignore_errors=True)
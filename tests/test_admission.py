@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from config import Config
+from utils import admission
+from utils.admission import Overloaded, UpstreamLimiter, retry_call, retry_call_async, worker_share
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """A one-slot limiter for the 'test' upstream, with two attempts per call"""
+    limiter = UpstreamLimiter('test', concurrency=1, queue_timeout=0.5)
+    monkeypatch.setitem(admission._limiters, 'test', limiter)
+    monkeypatch.setattr(Config, 'ADMISSION_ENABLED', True)
+    monkeypatch.setattr(Config, 'UPSTREAM_RETRY_ATTEMPTS', 2)
+    return limiter
+
+
+def flaky(failures):
+    """A call that raises a transient error the first `failures` times"""
+    attempts = []
+
+    def call():
+        attempts.append(len(attempts) + 1)
+        if len(attempts) <= failures:
+            raise ConnectionError("connection reset")
+        return 'ok'
+
+    return call, attempts
+
+
+def test_retry_call_frees_the_slot_while_backing_off(limiter, monkeypatch):
+    during_backoff = []
+
+    def backoff(attempt):
+        # Another caller gets the only slot without queueing
+        during_backoff.append((limiter.stats()['in_flight'], retry_call('test', lambda: 'other')))
+        return 0
+
+    monkeypatch.setattr(admission, '_backoff', backoff)
+    call, attempts = flaky(failures=1)
+
+    assert retry_call('test', call) == 'ok'
+    assert attempts == [1, 2]
+    assert during_backoff == [(0, 'other')]
+    assert limiter.stats()['in_flight'] == 0
+    assert limiter.stats()['retries'] == 1
+
+
+def test_retry_call_async_frees_the_slot_while_backing_off(limiter, monkeypatch):
+    in_flight = []
+    monkeypatch.setattr(admission, '_backoff', lambda attempt: in_flight.append(limiter.stats()['in_flight']) or 0)
+    call, attempts = flaky(failures=1)
+
+    async def upstream():
+        return call()
+
+    assert asyncio.run(retry_call_async('test', upstream)) == 'ok'
+    assert attempts == [1, 2]
+    assert in_flight == [0]
+
+
+def test_retry_call_raises_after_the_last_attempt(limiter, monkeypatch):
+    monkeypatch.setattr(admission, '_backoff', lambda attempt: 0)
+    call, attempts = flaky(failures=5)
+
+    with pytest.raises(ConnectionError):
+        retry_call('test', call)
+    assert attempts == [1, 2]
+    assert limiter.stats()['in_flight'] == 0
+
+
+def test_retry_call_does_not_retry_permanent_errors(limiter):
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        retry_call('test', call)
+    assert attempts == [1]
+
+
+def test_limiter_rejects_when_the_wait_runs_out(limiter):
+    limiter.queue_timeout = 0.05
+    with limiter.slot():
+        with pytest.raises(Overloaded):
+            with limiter.slot():
+                pass
+    assert limiter.stats()['timeouts'] == 1
+
+
+def test_worker_share_divides_limits_but_keeps_one_call_each():
+    limits = {"concurrency": 32, "rate": 10.0, "burst": 2}
+
+    assert worker_share(limits, workers=4) == {"concurrency": 8, "rate": 2.5, "burst": 1}
+    assert worker_share(limits, workers=64)["concurrency"] == 1
@@ -0,0 +1,114 @@
+import math
+import struct
+
+import pytest
+
+from config import Config
+from utils.audio import SilenceSegmenter, negotiate_audio_format, output_mimetype
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+FRAME_MS = 30
+SAMPLES_PER_FRAME = SAMPLE_RATE * FRAME_MS // 1000
+
+
+def speech_frame(amplitude=8000):
+    """One frame of a 440 Hz tone, well above the silence threshold"""
+    return struct.pack(
+        f'<{SAMPLES_PER_FRAME}h',
+        *(int(amplitude * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)) for i in range(SAMPLES_PER_FRAME))
+    )
+
+
+def silent_frame():
+    return bytes(SAMPLES_PER_FRAME * SAMPLE_WIDTH)
+
+
+def make_segmenter(min_segment_seconds=1, max_segment_seconds=3):
+    return SilenceSegmenter(
+        SAMPLE_RATE, SAMPLE_WIDTH, FRAME_MS, silence_threshold_dbfs=-45, min_silence_ms=300,
+        min_segment_seconds=min_segment_seconds, max_segment_seconds=max_segment_seconds
+    )
+
+
+def segment(segmenter, frames):
+    segments = [piece for piece in map(segmenter.feed, frames) if piece]
+    last = segmenter.flush()
+    if last:
+        segments.append(last)
+    return segments
+
+
+def test_segmenter_keeps_a_quiet_recording():
+    # Quieter than the threshold throughout, so it is all "pause"
+    frames = [speech_frame(amplitude=30)] * 100
+
+    segments = segment(make_segmenter(), frames)
+
+    assert segments
+    assert b''.join(segments) == b''.join(frames)
+
+
+def test_segmenter_cuts_at_a_pause_without_dropping_it():
+    frames = [speech_frame()] * 40 + [silent_frame()] * 12 + [speech_frame()] * 20
+
+    segments = segment(make_segmenter(), frames)
+
+    assert len(segments) == 2
+    # The pause ends the first segment rather than being cut out
+    assert segments[0] == b''.join(frames[:50])
+    assert b''.join(segments) == b''.join(frames)
+
+
+def test_segmenter_does_not_cut_before_the_minimum_length():
+    frames = [speech_frame()] * 10 + [silent_frame()] * 12 + [speech_frame()] * 10
+
+    segments = segment(make_segmenter(), frames)
+
+    assert segments == [b''.join(frames)]
+
+
+def test_segmenter_splits_long_speech_at_the_maximum_length():
+    frames = [speech_frame()] * 250
+
+    segments = segment(make_segmenter(), frames)
+
+    max_bytes = SAMPLE_RATE * SAMPLE_WIDTH * 3
+    assert len(segments) == 3
+    assert all(len(piece) <= max_bytes for piece in segments)
+    assert b''.join(segments) == b''.join(frames)
+
+
+def test_segmenter_flush_of_an_empty_stream_returns_nothing():
+    assert make_segmenter().flush() is None
+
+
+def test_negotiate_prefers_an_explicit_audio_format():
+    assert negotiate_audio_format('mp3-low', 'audio/ogg') == 'mp3-low'
+
+
+def test_negotiate_rejects_an_unknown_audio_format():
+    with pytest.raises(ValueError):
+        negotiate_audio_format('wav')
+
+
+@pytest.mark.parametrize('accept, expected', [
+    ('audio/ogg', 'opus'),
+    ('audio/mpeg;q=0.5, audio/ogg;q=0.9', 'opus'),
+    ('audio/ogg;q=0.2, audio/mpeg', 'mp3'),
+    ('AUDIO/OPUS ; q=0.8, audio/mp3;q=0.3', 'opus'),
+    # Unparseable q counts as 0, and q=0 means "not acceptable"
+    ('audio/ogg;q=high, audio/mpeg;q=0.1', 'mp3'),
+    ('audio/ogg;q=0', None),
+    ('text/html, */*', None),
+    ('', None),
+    (None, None),
+])
+def test_negotiate_follows_accept_quality(accept, expected):
+    assert negotiate_audio_format(None, accept) == (expected or Config.TTS_AUDIO_FORMAT)
+
+
+def test_output_mimetype():
+    assert output_mimetype('mp3') == 'audio/mpeg'
+    assert output_mimetype('mp3-low') == 'audio/mpeg'
+    assert output_mimetype('opus') == 'audio/ogg'
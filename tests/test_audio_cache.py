@@ -0,0 +1,98 @@
+import os
+import time
+
+import pytest
+
+from services.audio_cache import EVICT_LOW_WATER, AudioCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A cache of 1000 disk bytes that only evicts when a test calls evict()"""
+    monkeypatch.setattr(AudioCache, '_schedule_evict', lambda self: None)
+    return AudioCache(str(tmp_path), max_memory_bytes=10 ** 6, max_disk_bytes=1000, max_age=3600)
+
+
+@pytest.mark.parametrize('audio_format, suffix, extension', [
+    ('mp3', '', '.mp3'),
+    ('mp3-low', '-mp3-low', '.mp3'),
+    ('opus', '-opus', '.ogg'),
+])
+def test_key_round_trip(cache, audio_format, suffix, extension):
+    key = AudioCache.make_key('こんにちは', 'ja', False, audio_format)
+
+    assert key.endswith(suffix) and len(key) == 64 + len(suffix)
+    assert AudioCache.is_valid_key(key)
+    assert AudioCache.format_of(key) == audio_format
+    assert cache._path_for(key).endswith(key + extension)
+
+
+def test_keys_differ_by_format_and_options_but_not_spacing():
+    key = AudioCache.make_key('こんにちは', 'ja', False, 'mp3')
+
+    assert AudioCache.make_key(' こんにちは\n', 'ja', False, 'mp3') == key
+    assert AudioCache.make_key('こんにちは', 'ja', True, 'mp3') != key
+    assert AudioCache.make_key('こんにちは', 'en', False, 'mp3') != key
+    assert AudioCache.make_key('こんにちは', 'ja', False, 'opus') != key
+
+
+@pytest.mark.parametrize('key', [
+    None,
+    '',
+    '../' + 'a' * 61,
+    'A' * 64,
+    'a' * 63,
+    'a' * 64 + '-mp3',
+    'a' * 64 + '-wav',
+    'a' * 64 + '-opus.ogg',
+])
+def test_malformed_keys_are_rejected(key):
+    assert not AudioCache.is_valid_key(key)
+
+
+def test_put_and_get_by_format(cache, tmp_path):
+    mp3_key = AudioCache.make_key('こんにちは', audio_format='mp3')
+    opus_key = AudioCache.make_key('こんにちは', audio_format='opus')
+    cache.put(mp3_key, b'mp3 audio')
+    cache.put(opus_key, b'opus audio')
+
+    assert cache.get(mp3_key) == b'mp3 audio'
+    assert cache.get(opus_key) == b'opus audio'
+    # Read back from disk by a fresh cache, as another worker would
+    fresh = AudioCache(str(tmp_path), max_disk_bytes=1000, max_age=3600)
+    assert fresh.get(opus_key) == b'opus audio'
+    assert fresh.disk_hits == 1
+
+
+def test_evict_frees_space_down_to_the_low_water_mark(cache):
+    keys = [AudioCache.make_key(f'文{number}') for number in range(20)]
+    now = time.time()
+    for age, key in enumerate(reversed(keys)):
+        cache.put(key, bytes(100))
+        # keys[0] is the least recently used
+        os.utime(cache._path_for(key), (now - age - 1, now - age - 1))
+    assert cache._disk_bytes == 2000
+
+    cache.evict()
+
+    kept = [key for key in keys if os.path.exists(cache._path_for(key))]
+    assert cache._disk_bytes == sum(os.path.getsize(cache._path_for(key)) for key in kept)
+    assert cache._disk_bytes <= cache.max_disk_bytes * EVICT_LOW_WATER
+    # Only as much as needed goes, oldest first
+    assert cache._disk_bytes > cache.max_disk_bytes * EVICT_LOW_WATER - 100
+    assert kept == keys[-len(kept):]
+
+
+def test_evict_drops_expired_entries_under_budget(cache):
+    old = AudioCache.make_key('古い')
+    new = AudioCache.make_key('新しい')
+    cache.put(old, bytes(10))
+    cache.put(new, bytes(10))
+    expired = time.time() - cache.max_age - 1
+    os.utime(cache._path_for(old), (expired, expired))
+
+    cache.evict()
+
+    assert not os.path.exists(cache._path_for(old))
+    assert os.path.exists(cache._path_for(new))
+    assert cache._disk_bytes == 10
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from config import Config
+from services.conversation_store import WriteBehindConversationStore, create_conversation_store
+
+
+def exchange(number):
+    return {"user_input": f"入力{number}", "reply": f"返事{number}"}
+
+
+@pytest.fixture(params=['jsonl', 'sqlite'])
+def store(request, tmp_path, monkeypatch):
+    """A write-behind store whose background thread never flushes during a test"""
+    monkeypatch.setattr(Config, 'CONVERSATION_FLUSH_INTERVAL', 3600)
+    monkeypatch.setattr(Config, 'CONVERSATION_FLUSH_BATCH', 10 ** 6)
+    return WriteBehindConversationStore(create_conversation_store(request.param, str(tmp_path)))
+
+
+def test_write_behind_reads_include_buffered_exchanges(store):
+    store.append('alice', exchange(0))
+    store.append('alice', exchange(1))
+
+    assert store.store.load('alice') == []
+    assert store.load('alice') == [exchange(0), exchange(1)]
+    assert store.load('alice', 1) == [exchange(1)]
+    assert store.stats()['pending'] == 2
+
+
+def test_write_behind_flushes_in_turn_order(store):
+    store.append('alice', exchange(0))
+    store.append('bob', exchange(100))
+    store.append('alice', exchange(1))
+    store.flush()
+    store.append('alice', exchange(2))
+
+    # Stored and buffered exchanges read back as one history
+    assert store.load('alice') == [exchange(0), exchange(1), exchange(2)]
+    assert store.load('alice', 2) == [exchange(1), exchange(2)]
+
+    store.flush()
+    assert store.store.load('alice') == [exchange(0), exchange(1), exchange(2)]
+    assert store.store.load('bob') == [exchange(100)]
+    assert store.stats()['pending'] == 0
+
+
+def test_write_behind_keeps_order_while_flushing_concurrently(store):
+    def turns():
+        for number in range(200):
+            store.append('alice', exchange(number))
+
+    writer = threading.Thread(target=turns)
+    writer.start()
+    while writer.is_alive():
+        store.flush()
+    writer.join()
+    store.flush()
+
+    assert store.store.load('alice') == [exchange(number) for number in range(200)]
+
+
+def test_write_behind_retries_a_failed_flush(store, monkeypatch):
+    store.append('alice', exchange(0))
+    with monkeypatch.context() as patch:
+        patch.setattr(store.store, 'append_many', lambda entries: 1 / 0)
+        store.flush()
+    store.append('alice', exchange(1))
+
+    assert store.stats()['flush_errors'] == 1
+    assert store.load('alice') == [exchange(0), exchange(1)]
+    store.flush()
+    assert store.store.load('alice') == [exchange(0), exchange(1)]
+
+
+def test_write_behind_replace_drops_buffered_exchanges(store):
+    store.append('alice', exchange(0))
+    store.replace('alice', [exchange(5)])
+    store.flush()
+
+    assert store.load('alice') == [exchange(5)]
+    assert store.stats()['pending'] == 0
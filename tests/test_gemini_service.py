@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+import types
+
+import pytest
+
+from config import Config
+from services import gemini_service
+from services.prompt_builder import SYSTEM_INSTRUCTION
+from services.speech_service import SpeechService
+
+
+class FakeModel:
+    """Stands in for a Gemini model, numbering its replies in the order they are generated"""
+
+    def __init__(self):
+        self.prompts = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.prompts.append(prompt)
+            number = len(self.prompts)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        reply = {
+            "correction": {"hasError": False, "original": "", "suggestion": "", "explanation": ""},
+            "reply": f"返事{number}",
+            "vocabulary": []
+        }
+        return types.SimpleNamespace(text=json.dumps(reply, ensure_ascii=False), usage_metadata=None)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel()
+    for name in set(Config.GEMINI_ROUTE_MODELS.values()) | {Config.GEMINI_MODEL}:
+        for system_instruction in (None, SYSTEM_INSTRUCTION):
+            monkeypatch.setitem(gemini_service._gemini_models, (name, system_instruction), model)
+    audio = {"status": "success", "audio_id": None, "audio_data": None, "audio_format": 'mp3'}
+    monkeypatch.setattr(SpeechService, 'text_to_speech', staticmethod(lambda *args, **kwargs: dict(audio)))
+    return model
+
+
+def run_turns(turns):
+    service = gemini_service.get_gemini_service('conversation')
+    results = []
+
+    def turn(user_id, number):
+        results.append(service.generate_japanese_conversation(
+            user_id, '趣味', 'N4', [], f'入力{number}', use_cache=False, inline_audio=False
+        ))
+
+    threads = [threading.Thread(target=turn, args=args) for args in turns]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert [result['status'] for result in results] == ['success'] * len(turns), results
+    return service
+
+
+def test_turns_of_one_user_run_one_at_a_time(model):
+    service = run_turns([('serial-user', number) for number in range(4)])
+
+    assert model.max_active == 1
+    # Each turn is generated from the history holding the turn before it
+    for number in range(1, 4):
+        assert f'返事{number}' in model.prompts[number]
+    history = service.conversation_store.load('serial-user')
+    assert [entry['reply'] for entry in history] == ['返事1', '返事2', '返事3', '返事4']
+
+
+def test_turns_of_different_users_overlap(model):
+    run_turns([(f'parallel-user-{number}', number) for number in range(4)])
+
+    assert model.max_active > 1
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.helpers import AsyncSingleFlight, FileLocks
+
+
+def test_async_single_flight_shares_one_call():
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        flight = AsyncSingleFlight()
+        return await asyncio.gather(*(flight.do('key', fetch, 21) for _ in range(3)))
+
+    results = asyncio.run(main())
+
+    assert calls == [21]
+    assert sorted(results) == [(42, False), (42, True), (42, True)]
+
+
+def test_async_single_flight_passes_the_leaders_error_to_followers():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def main():
+        flight = AsyncSingleFlight()
+        return await asyncio.gather(*(flight.do('key', fail) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+def test_async_single_flight_releases_followers_when_the_leader_is_cancelled():
+    async def main():
+        flight = AsyncSingleFlight()
+        leader = asyncio.ensure_future(flight.do('key', asyncio.sleep, 10))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do('key', asyncio.sleep, 10))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(follower, 1)
+        # The key is free again for the next caller
+        return await flight.do('key', asyncio.sleep, 0, 'fresh')
+
+    assert asyncio.run(main()) == ('fresh', False)
+
+
+def test_file_locks_exclude_the_same_key_only(tmp_path):
+    locks = FileLocks(str(tmp_path))
+    held = locks.acquire('alice', 1)
+
+    assert locks.acquire('alice', 0.05) is None
+    other = locks.acquire('bob', 0.05)
+    assert other is not None
+
+    other.release()
+    held.release()
+    again = locks.acquire('alice', 0.05)
+    assert again is not None
+    again.release()
+
+
+def test_file_locks_hand_the_lock_to_a_waiter(tmp_path):
+    locks = FileLocks(str(tmp_path))
+    held = locks.acquire('alice', 1)
+    acquired = []
+
+    def wait():
+        lock = locks.acquire('alice', 2)
+        acquired.append(time.monotonic())
+        lock.release()
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.1)
+    released = time.monotonic()
+    held.release()
+    waiter.join(2)
+
+    assert len(acquired) == 1 and acquired[0] >= released
+
+
+def test_file_locks_release_a_lock_obtained_after_the_wait_was_abandoned(tmp_path):
+    locks = FileLocks(str(tmp_path))
+    held = locks.acquire('alice', 1)
+    assert locks.acquire('alice', 0.05) is None
+
+    held.release()
+    # The abandoned waiter gets the lock and lets go of it straight away
+    lock = locks.acquire('alice', 1)
+    assert lock is not None
+    lock.release()
+
+
+def test_file_locks_acquire_async(tmp_path):
+    locks = FileLocks(str(tmp_path))
+
+    async def main():
+        held = await locks.acquire_async('alice', 1)
+        assert await locks.acquire_async('alice', 0.05) is None
+        waiting = asyncio.ensure_future(locks.acquire_async('alice', 2))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        held.release()
+        lock = await waiting
+        lock.release()
+
+    asyncio.run(main())
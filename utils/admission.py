@@ -0,0 +1,552 @@
+"""
+Admission control for calls to upstream services (Gemini, gTTS, Sapling)
+
+Each upstream has an UpstreamLimiter bounding its concurrent calls and,
+optionally, their rate with a token bucket. Calls beyond the concurrency
+limit wait in a bounded queue; when the queue is full, or a call has waited
+Config.ADMISSION_QUEUE_TIMEOUT, it is rejected at once with Overloaded, which
+the APIs answer with 503 and Retry-After instead of piling up worker threads.
+A freed slot goes to the waiting user with the fewest calls in flight, and a
+user holding or waiting for Config.ADMISSION_MAX_PER_USER slots is rejected
+with 429, so one chatty user_id cannot starve the others.
+
+Limits are configured for the whole deployment and split evenly between
+Config.WEB_WORKERS processes, since each process keeps its own limiter.
+
+retry_call() and admitted_call() (plus their async variants) take a slot
+for each attempt and retry transient upstream failures with jittered
+exponential backoff, releasing the slot while they back off.
+"""
+import asyncio
+import itertools
+import math
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from config import Config
+from utils.metrics import observe_stage, register_stats
+
+# Upstream HTTP statuses worth retrying; 429 and 503 mean the upstream is over quota or busy
+TRANSIENT_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+OVERLOAD_STATUS_CODES = frozenset({429, 503})
+
+# Connection-level failures of requests, aiohttp and google-api-core, matched by name
+# so none of them has to be imported here
+TRANSIENT_ERROR_NAMES = frozenset({
+    'ConnectionError', 'ConnectTimeout', 'ReadTimeout', 'Timeout', 'ChunkedEncodingError',
+    'ClientConnectionError', 'ClientConnectorError', 'ClientOSError', 'ServerDisconnectedError',
+    'ServerTimeoutError', 'DeadlineExceeded', 'ServiceUnavailable', 'InternalServerError',
+    'ResourceExhausted', 'TooManyRequests'
+})
+
+
+class Overloaded(Exception):
+    """A call was not admitted, or the upstream stayed over its quota after retries"""
+
+    def __init__(self, upstream, retry_after, user_limited=False):
+        """
+        Args:
+            upstream (str): Upstream name, e.g. 'gemini'
+            retry_after (float): Seconds after which a retry may succeed
+            user_limited (bool): The caller's user_id holds too many slots (429 rather than 503)
+        """
+        self.upstream = upstream
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.user_limited = user_limited
+        if user_limited:
+            message = f"Too many {upstream} requests for this user"
+        else:
+            message = f"The {upstream} service is busy"
+        super().__init__(f"{message}, retry in {self.retry_after}s")
+
+    def result(self):
+        """Error result in the shape services return"""
+        result = {"status": "error", "message": str(self), "retry_after": self.retry_after}
+        result["rate_limited" if self.user_limited else "overloaded"] = True
+        return result
+
+
+class UpstreamHTTPError(Exception):
+    """Upstream answered with an HTTP error status"""
+
+    def __init__(self, status_code, details=None):
+        self.status_code = status_code
+        self.details = details
+        super().__init__(f"API error: {status_code}")
+
+
+def error_status(result, default=500):
+    """
+    HTTP status and headers for a failed service result
+
+    Results built by Overloaded.result() map to 429 or 503 with Retry-After.
+
+    Returns:
+        tuple: (status, headers)
+    """
+    if 'retry_after' not in result:
+        return default, {}
+    return (429 if result.get('rate_limited') else 503), {'Retry-After': str(result['retry_after'])}
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second up to burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        Take a token, possibly ahead of time
+
+        Args:
+            max_wait (float): Longest acceptable wait in seconds
+
+        Returns:
+            float: Seconds to wait before the token may be used; if this is
+                more than max_wait, no token was taken
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait <= max_wait:
+                self._tokens -= 1
+            return wait
+
+
+class _Waiter:
+    """A call queued for a slot"""
+
+    __slots__ = ('user_id', 'ticket', 'wake', 'granted')
+
+    def __init__(self, user_id, ticket, wake):
+        self.user_id = user_id
+        self.ticket = ticket
+        self.wake = wake
+        self.granted = False
+
+
+def _resolve(future):
+    """Complete a waiter's future unless it was cancelled"""
+    if not future.done():
+        future.set_result(None)
+
+
+class UpstreamLimiter:
+    """
+    Concurrency and rate limit for one upstream with a bounded, per-user fair wait queue
+
+    Slots are handed directly to the chosen waiter, so sync callers (threads)
+    and async callers (event loop) can share one limiter.
+    """
+
+    def __init__(self, name, concurrency, rate=0, burst=1, queue_size=None, queue_timeout=None,
+                 max_per_user=None):
+        """
+        Args:
+            name (str): Upstream name for errors and metrics
+            concurrency (int): Maximum calls in flight
+            rate (float): Maximum calls started per second (0 for no limit)
+            burst (int): Calls that may start at once when under the rate
+            queue_size (int): Calls that may wait for a slot (defaults to Config.ADMISSION_QUEUE_SIZE)
+            queue_timeout (float): Seconds a call may wait (defaults to Config.ADMISSION_QUEUE_TIMEOUT)
+            max_per_user (int): Slots held or awaited per user_id (defaults to Config.ADMISSION_MAX_PER_USER)
+        """
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_size = Config.ADMISSION_QUEUE_SIZE if queue_size is None else queue_size
+        self.queue_timeout = Config.ADMISSION_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.max_per_user = Config.ADMISSION_MAX_PER_USER if max_per_user is None else max_per_user
+        self._bucket = TokenBucket(rate, burst) if rate > 0 else None
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._user_in_flight = {}
+        # Slots held plus places in the queue, per user
+        self._user_pending = {}
+        # Grant sequence number of each user's latest slot, to serve users round-robin
+        self._user_served = {}
+        self._grants = itertools.count()
+        self._waiters = []
+        self._tickets = itertools.count()
+        # Smoothed time a slot is held, for Retry-After estimates
+        self._hold_seconds = 1.0
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "timeouts": 0, "retries": 0}
+
+    def _retry_after(self):
+        """Estimated seconds until the queue has drained"""
+        return self._hold_seconds * (len(self._waiters) + 1) / self.concurrency
+
+    def _take(self, user_id):
+        """Occupy a slot (lock held)"""
+        self._in_flight += 1
+        if user_id is not None:
+            self._user_in_flight[user_id] = self._user_in_flight.get(user_id, 0) + 1
+            self._user_served[user_id] = next(self._grants)
+        self._stats["admitted"] += 1
+
+    def _add_pending(self, user_id, delta):
+        """Adjust a user's held and queued count (lock held)"""
+        if user_id is None:
+            return
+        pending = self._user_pending.get(user_id, 0) + delta
+        if pending > 0:
+            self._user_pending[user_id] = pending
+        else:
+            self._user_pending.pop(user_id, None)
+            self._user_served.pop(user_id, None)
+
+    def _admit(self, user_id, wake):
+        """
+        Take a slot or a place in the queue (lock held)
+
+        Returns:
+            _Waiter: The queued call, or None if a slot was taken right away
+
+        Raises:
+            Overloaded: The user is over their share or the queue is full
+        """
+        if user_id is not None and self.max_per_user and self._user_pending.get(user_id, 0) >= self.max_per_user:
+            self._stats["rejected"] += 1
+            raise Overloaded(self.name, self._hold_seconds, user_limited=True)
+
+        if self._in_flight < self.concurrency and not self._waiters:
+            self._take(user_id)
+            self._add_pending(user_id, 1)
+            return None
+
+        if len(self._waiters) >= self.queue_size:
+            self._stats["rejected"] += 1
+            raise Overloaded(self.name, self._retry_after())
+
+        waiter = _Waiter(user_id, next(self._tickets), wake)
+        self._waiters.append(waiter)
+        self._add_pending(user_id, 1)
+        self._stats["queued"] += 1
+        return waiter
+
+    def _fairness_key(self, waiter):
+        """Waiters of users with fewer calls in flight, then of users served longest ago, go first"""
+        if waiter.user_id is None:
+            return 0, -1, waiter.ticket
+        return (
+            self._user_in_flight.get(waiter.user_id, 0),
+            self._user_served.get(waiter.user_id, -1),
+            waiter.ticket
+        )
+
+    def _grant_waiters(self):
+        """Hand free slots to waiters in fairness order (lock held)"""
+        while self._waiters and self._in_flight < self.concurrency:
+            waiter = min(self._waiters, key=self._fairness_key)
+            self._waiters.remove(waiter)
+            self._take(waiter.user_id)
+            waiter.granted = True
+            waiter.wake()
+
+    def _release(self, user_id, held_seconds=None):
+        """Free a slot and pass it on"""
+        with self._lock:
+            self._in_flight -= 1
+            if user_id is not None:
+                remaining = self._user_in_flight.get(user_id, 1) - 1
+                if remaining > 0:
+                    self._user_in_flight[user_id] = remaining
+                else:
+                    self._user_in_flight.pop(user_id, None)
+            self._add_pending(user_id, -1)
+            if held_seconds is not None:
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+            self._grant_waiters()
+
+    def _settle(self, waiter):
+        """
+        Resolve a waiter whose wait ended (lock taken here)
+
+        Returns:
+            bool: True if it was granted a slot, False if it left the queue
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._add_pending(waiter.user_id, -1)
+            self._stats["timeouts"] += 1
+            return False
+
+    def _rate_delay(self, deadline):
+        """Seconds to wait for the rate limit; raises Overloaded if that would pass the deadline"""
+        if self._bucket is None:
+            return 0.0
+        remaining = max(0.0, deadline - time.monotonic())
+        wait = self._bucket.reserve(remaining)
+        if wait > remaining:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise Overloaded(self.name, wait)
+        return wait
+
+    @contextmanager
+    def slot(self, user_id=None):
+        """
+        Hold a slot for one upstream call
+
+        Args:
+            user_id (str): Caller to share slots fairly between, if known
+
+        Raises:
+            Overloaded: The call was not admitted in time
+        """
+        if not Config.ADMISSION_ENABLED:
+            yield
+            return
+
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        wake = threading.Event()
+        with self._lock:
+            waiter = self._admit(user_id, wake.set)
+        if waiter is not None:
+            wake.wait(self.queue_timeout)
+            if not self._settle(waiter):
+                raise Overloaded(self.name, self._retry_after())
+            observe_stage('admission_wait', time.monotonic() - started)
+
+        acquired = time.monotonic()
+        try:
+            delay = self._rate_delay(deadline)
+            if delay:
+                time.sleep(delay)
+            yield
+        finally:
+            self._release(user_id, time.monotonic() - acquired)
+
+    @asynccontextmanager
+    async def slot_async(self, user_id=None):
+        """Async variant of slot"""
+        if not Config.ADMISSION_ENABLED:
+            yield
+            return
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        future = loop.create_future()
+        with self._lock:
+            waiter = self._admit(user_id, lambda: loop.call_soon_threadsafe(_resolve, future))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(future, self.queue_timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                if self._settle(waiter):
+                    self._release(user_id)
+                raise
+            if not self._settle(waiter):
+                raise Overloaded(self.name, self._retry_after())
+            observe_stage('admission_wait', time.monotonic() - started)
+
+        acquired = time.monotonic()
+        try:
+            delay = self._rate_delay(deadline)
+            if delay:
+                await asyncio.sleep(delay)
+            yield
+        finally:
+            self._release(user_id, time.monotonic() - acquired)
+
+    def count(self, name):
+        """Increment a stats counter"""
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Admission counters, slots in use and queue length"""
+        with self._lock:
+            return dict(self._stats, in_flight=self._in_flight, waiting=len(self._waiters))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def worker_share(limits, workers=None):
+    """
+    This process's share of deployment-wide upstream limits
+
+    Args:
+        limits (dict): concurrency, rate and burst for all workers together
+        workers (int): Worker processes (defaults to Config.WEB_WORKERS)
+
+    Returns:
+        dict: The limits divided between the workers, at least one call each
+    """
+    workers = max(1, Config.WEB_WORKERS if workers is None else workers)
+    return {
+        "concurrency": max(1, limits["concurrency"] // workers),
+        "rate": limits["rate"] / workers,
+        "burst": max(1, limits["burst"] // workers),
+    }
+
+
+def get_limiter(name):
+    """
+    Get the process-wide limiter of an upstream, creating it on first use
+
+    Args:
+        name (str): Upstream name, a key of Config.UPSTREAM_LIMITS
+
+    Returns:
+        UpstreamLimiter: Shared limiter enforcing this worker's share of the limits
+    """
+    limiter = _limiters.get(name)
+    if limiter is not None:
+        return limiter
+
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = UpstreamLimiter(name, **worker_share(Config.UPSTREAM_LIMITS[name]))
+        return _limiters[name]
+
+
+def _status_code(error):
+    """HTTP status carried by an upstream exception, if any"""
+    for code in (
+        getattr(error, 'status_code', None),  # UpstreamHTTPError
+        getattr(error, 'code', None),  # google-api-core
+        getattr(error, 'status', None),  # aiohttp.ClientResponseError
+        getattr(getattr(error, 'response', None), 'status_code', None),  # requests.HTTPError
+        getattr(getattr(error, 'rsp', None), 'status_code', None)  # gTTSError
+    ):
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def is_transient(error):
+    """Whether an upstream failure may succeed when retried"""
+    if isinstance(error, Overloaded):
+        return False
+    if _status_code(error) in TRANSIENT_STATUS_CODES:
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff before retry number attempt"""
+    ceiling = min(Config.UPSTREAM_RETRY_MAX_DELAY, Config.UPSTREAM_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+def _give_up(upstream, error):
+    """The exception to raise once retries are exhausted"""
+    if _status_code(error) in OVERLOAD_STATUS_CODES or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return Overloaded(upstream, Config.UPSTREAM_RETRY_MAX_DELAY)
+    return error
+
+
+def _retry_delay(upstream, error, attempt, attempts):
+    """
+    Backoff before the next attempt after a failed one
+
+    Raises:
+        Exception: The failure (or Overloaded) if it is not worth retrying
+    """
+    if not is_transient(error):
+        raise error
+    if attempt == attempts:
+        failure = _give_up(upstream, error)
+        if failure is error:
+            raise error
+        raise failure from error
+    get_limiter(upstream).count("retries")
+    return _backoff(attempt)
+
+
+@contextmanager
+def admitted_call(upstream, func, *args, user_id=None, **kwargs):
+    """
+    Call func under the upstream's admission limits, retrying transient failures
+
+    Each attempt takes its own slot, and the slot is free while backing off.
+    The slot of the successful attempt is held until the with block ends, so
+    a streamed response is read within the limits.
+
+    Args:
+        upstream (str): Upstream name, a key of Config.UPSTREAM_LIMITS
+        func (callable): The upstream call
+        user_id (str): Caller to share slots fairly between, if known
+
+    Yields:
+        The result of func
+
+    Raises:
+        Overloaded: The call was not admitted, or the upstream stayed over its quota
+    """
+    limiter = get_limiter(upstream)
+    attempts = max(1, Config.UPSTREAM_RETRY_ATTEMPTS)
+    for attempt in range(1, attempts + 1):
+        with limiter.slot(user_id):
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            else:
+                yield result
+                return
+        time.sleep(_retry_delay(upstream, error, attempt, attempts))
+
+
+def retry_call(upstream, func, *args, user_id=None, **kwargs):
+    """
+    admitted_call for calls whose result is complete when func returns
+
+    Returns:
+        The result of func
+    """
+    with admitted_call(upstream, func, *args, user_id=user_id, **kwargs) as result:
+        return result
+
+
+@asynccontextmanager
+async def admitted_call_async(upstream, func, *args, user_id=None, **kwargs):
+    """Async variant of admitted_call for coroutine functions"""
+    limiter = get_limiter(upstream)
+    attempts = max(1, Config.UPSTREAM_RETRY_ATTEMPTS)
+    for attempt in range(1, attempts + 1):
+        async with limiter.slot_async(user_id):
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            else:
+                yield result
+                return
+        await asyncio.sleep(_retry_delay(upstream, error, attempt, attempts))
+
+
+async def retry_call_async(upstream, func, *args, user_id=None, **kwargs):
+    """Async variant of retry_call for coroutine functions"""
+    async with admitted_call_async(upstream, func, *args, user_id=user_id, **kwargs) as result:
+        return result
+
+
+def _limiter_stats():
+    """Stats of every limiter created so far, by upstream"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+register_stats(
+    'admission', _limiter_stats,
+    counters=('admitted', 'queued', 'rejected', 'timeouts', 'retries'), label='upstream'
+)
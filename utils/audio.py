@@ -0,0 +1,311 @@
+import math
+import re
+from config import Config
+
+# A sentence runs up to and including its terminal punctuation (plus any closing
+# brackets), or up to a line break
+SENTENCE_PATTERN = re.compile(r'[^。！？!?\n]*[。！？!?]+[」』）)]*|[^。！？!?\n]+')
+
+
+# ffmpeg demuxer names for the containers sniff_audio_format recognizes
+FFMPEG_INPUT_FORMATS = {
+    'wav': 'wav',
+    'mp3': 'mp3',
+    'aac': 'aac',
+    'ogg': 'ogg',
+    'flac': 'flac',
+    'webm': 'matroska',
+    'mp4': 'mp4',
+    'amr': 'amr',
+    'aiff': 'aiff',
+}
+
+
+# Encodings synthesized speech is returned in: MIME type, audio cache file suffix,
+# and the ffmpeg output arguments producing it from gTTS's 32 kbps MP3 (None for
+# that MP3 itself)
+AUDIO_OUTPUT_FORMATS = {
+    'mp3': {
+        'mimetype': 'audio/mpeg',
+        'extension': 'mp3',
+        'ffmpeg': None,
+    },
+    'mp3-low': {
+        'mimetype': 'audio/mpeg',
+        'extension': 'mp3',
+        'ffmpeg': ['-ac', '1', '-ar', '16000', '-c:a', 'libmp3lame', '-b:a', Config.TTS_MP3_LOW_BITRATE,
+                   '-map_metadata', '-1', '-f', 'mp3'],
+    },
+    'opus': {
+        'mimetype': 'audio/ogg',
+        'extension': 'ogg',
+        'ffmpeg': ['-ac', '1', '-c:a', 'libopus', '-b:a', Config.TTS_OPUS_BITRATE, '-application', 'voip',
+                   '-map_metadata', '-1', '-f', 'ogg'],
+    },
+}
+
+# Accept header media types and the output encoding each selects
+ACCEPT_AUDIO_FORMATS = {
+    'audio/mpeg': 'mp3',
+    'audio/mp3': 'mp3',
+    'audio/ogg': 'opus',
+    'audio/opus': 'opus',
+}
+
+
+def negotiate_audio_format(requested=None, accept=None):
+    """
+    Choose the encoding of synthesized speech for a request
+
+    An explicit audio_format wins; otherwise the audio type the Accept header
+    prefers (highest q) among ACCEPT_AUDIO_FORMATS, then Config.TTS_AUDIO_FORMAT.
+
+    Args:
+        requested (str): audio_format field of the request, if any
+        accept (str): Accept header of the request, if any
+
+    Returns:
+        str: Key of AUDIO_OUTPUT_FORMATS
+
+    Raises:
+        ValueError: If requested names an unknown encoding
+    """
+    if requested:
+        if requested not in AUDIO_OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported audio_format (expected one of {', '.join(AUDIO_OUTPUT_FORMATS)})")
+        return requested
+
+    best, best_quality = None, 0.0
+    for media_range in (accept or '').split(','):
+        media_type, _, parameters = media_range.partition(';')
+        audio_format = ACCEPT_AUDIO_FORMATS.get(media_type.strip().lower())
+        if audio_format is None:
+            continue
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            name, _, value = parameter.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            best, best_quality = audio_format, quality
+    return best or Config.TTS_AUDIO_FORMAT
+
+
+def output_mimetype(audio_format):
+    """MIME type of speech encoded as audio_format (a key of AUDIO_OUTPUT_FORMATS)"""
+    return AUDIO_OUTPUT_FORMATS[audio_format]['mimetype']
+
+
+def is_binary_audio(mimetype):
+    """Check whether a request body is raw audio rather than JSON or a form"""
+    return mimetype.startswith('audio/') or mimetype == 'application/octet-stream'
+
+
+def max_upload_body_bytes(mimetype):
+    """
+    Largest speech-to-text request body accepted for a content type
+
+    Args:
+        mimetype (str): Request content type without parameters
+
+    Returns:
+        int: Size limit in bytes
+    """
+    limit = Config.STT_MAX_UPLOAD_BYTES
+    if is_binary_audio(mimetype):
+        return limit
+    # Leave room for the other form or JSON fields
+    if mimetype == 'multipart/form-data':
+        return limit + 64 * 1024
+    # base64 inflates the audio by a third
+    return limit * 4 // 3 + 64 * 1024
+
+
+def sniff_audio_format(data):
+    """
+    Detect an audio container from its leading bytes
+
+    Args:
+        data (bytes): Encoded audio
+
+    Returns:
+        str: Format name (a key of FFMPEG_INPUT_FORMATS), or None if unknown
+    """
+    if len(data) < 12:
+        return None
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        return 'wav'
+    if data[:4] == b'OggS':
+        return 'ogg'
+    if data[:4] == b'fLaC':
+        return 'flac'
+    if data[:4] == b'\x1a\x45\xdf\xa3':
+        return 'webm'
+    if data[4:8] == b'ftyp':
+        return 'mp4'
+    if data[:5] == b'#!AMR':
+        return 'amr'
+    if data[:4] == b'FORM' and data[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if data[:3] == b'ID3':
+        return 'mp3'
+    if data[0] == 0xFF and data[1] & 0xF6 == 0xF0:
+        # ADTS frame sync with layer bits 00
+        return 'aac'
+    if data[0] == 0xFF and data[1] & 0xE0 == 0xE0:
+        # MPEG audio frame sync
+        return 'mp3'
+    return None
+
+
+def split_japanese_sentences(text):
+    """
+    Split Japanese text into sentences on 。！？ and line breaks
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        list: Non-empty sentences with their punctuation kept
+    """
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.findall(text or '') if sentence.strip()]
+
+
+def pack_sentences(sentences, max_chars):
+    """
+    Group consecutive sentences into chunks of at most max_chars characters
+
+    A sentence longer than max_chars forms a chunk of its own.
+
+    Args:
+        sentences (list): Sentences in reading order
+        max_chars (int): Largest chunk to build
+
+    Returns:
+        list: Chunks of joined sentences, in reading order
+    """
+    chunks = []
+    current = ''
+    for sentence in sentences:
+        if current and len(current) + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ''
+        current += sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def strip_id3v2(data):
+    """
+    Remove a leading ID3v2 tag from MP3 data
+
+    Args:
+        data (bytes): MP3 data
+
+    Returns:
+        bytes: MP3 data starting at the first audio frame
+    """
+    if len(data) < 10 or data[:3] != b'ID3':
+        return data
+
+    # Tag size is a 28-bit "syncsafe" integer, 7 bits per byte
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return data[10 + size + footer:]
+
+
+def concat_mp3(segments):
+    """
+    Concatenate MP3 segments at frame level
+
+    MP3 is a sequence of self-contained frames, so segments can be joined by
+    appending their frames. Only the first segment keeps its ID3 tag.
+
+    Args:
+        segments (list): MP3 data for each segment, in playback order
+
+    Returns:
+        bytes: Joined MP3 data
+    """
+    if not segments:
+        return b''
+    return segments[0] + b''.join(strip_id3v2(segment) for segment in segments[1:])
+
+
+class SilenceSegmenter:
+    """
+    Split a stream of PCM frames into segments at pauses
+
+    A segment ends at the first pause of at least min_silence_ms once it is
+    min_segment_seconds long, and is cut regardless at max_segment_seconds.
+    The silence threshold only places the cuts; no audio is dropped, so a
+    quiet recording is still recognized in full.
+    """
+
+    def __init__(self, sample_rate, sample_width, frame_ms, silence_threshold_dbfs,
+                 min_silence_ms, min_segment_seconds, max_segment_seconds):
+        """
+        Args:
+            sample_rate (int): Samples per second
+            sample_width (int): Bytes per sample (mono)
+            frame_ms (int): Duration of each frame passed to feed
+            silence_threshold_dbfs (float): Frames quieter than this count as silence
+            min_silence_ms (int): Pause length that may end a segment
+            min_segment_seconds (float): Shortest segment ended at a pause
+            max_segment_seconds (float): Longest segment
+        """
+        from pydub.utils import audioop
+
+        self._audioop = audioop
+        self.sample_width = sample_width
+        self.frame_ms = frame_ms
+        self.min_silence_ms = min_silence_ms
+        self.bytes_per_second = sample_rate * sample_width
+        self.silence_rms = (2 ** (8 * sample_width - 1)) * math.pow(10, silence_threshold_dbfs / 20)
+        self.min_segment_bytes = int(self.bytes_per_second * min_segment_seconds)
+        self.max_segment_bytes = int(self.bytes_per_second * max_segment_seconds)
+
+        self._buffer = bytearray()
+        self._silence_ms = 0
+
+    def _take(self):
+        """Return the buffered segment (or None if it is empty) and start a new one"""
+        segment = bytes(self._buffer) if self._buffer else None
+        self._buffer.clear()
+        self._silence_ms = 0
+        return segment
+
+    def feed(self, frame):
+        """
+        Add one frame
+
+        Args:
+            frame (bytes): PCM samples
+
+        Returns:
+            bytes: A completed segment, or None
+        """
+        self._buffer += frame
+        if self._audioop.rms(frame, self.sample_width) < self.silence_rms:
+            self._silence_ms += self.frame_ms
+        else:
+            self._silence_ms = 0
+
+        at_pause = self._silence_ms >= self.min_silence_ms
+        if (at_pause and len(self._buffer) >= self.min_segment_bytes) or len(self._buffer) >= self.max_segment_bytes:
+            return self._take()
+        return None
+
+    def flush(self):
+        """
+        End the stream
+
+        Returns:
+            bytes: The last segment, or None
+        """
+        return self._take()
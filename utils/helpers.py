@@ -0,0 +1,328 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from config import Config
+
+
+def format_sse(event, data):
+    """
+    Format one Server-Sent Events message
+
+    Args:
+        event (str): Event name
+        data: JSON-serializable event payload
+
+    Returns:
+        str: SSE wire format for the event
+    """
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def iter_file_chunks(file, chunk_size=None):
+    """
+    Read a binary file in fixed-size chunks and close it afterwards
+
+    Args:
+        file: Binary file object
+        chunk_size (int): Bytes per chunk (defaults to Config.AUDIO_STREAM_CHUNK_BYTES)
+
+    Yields:
+        bytes: Consecutive chunks of the file
+    """
+    chunk_size = chunk_size or Config.AUDIO_STREAM_CHUNK_BYTES
+    try:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, max_workers):
+    """
+    Get a named process-wide thread pool, creating it on first use
+
+    Separate names keep stages that wait on each other from sharing workers.
+
+    Args:
+        name (str): Pool name, also used as the worker thread name prefix
+        max_workers (int): Maximum number of worker threads
+
+    Returns:
+        ThreadPoolExecutor: Shared executor
+    """
+    executor = _executors.get(name)
+    if executor is not None:
+        return executor
+
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run func once for all callers currently asking for key
+
+        Args:
+            key: Hashable identity of the call
+            func (callable): Function to run if no identical call is in flight
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller's
+                execution was reused
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """Coalesce concurrent coroutine calls that share a key (one event loop only)"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Await func once for all callers currently asking for key
+
+        Args:
+            key: Hashable identity of the call
+            func (callable): Coroutine function to run if no identical call is in flight
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller's
+                execution was reused
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func(*args, **kwargs)
+            future.set_result(result)
+            return result, False
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            # The leader was cancelled (CancelledError is not an Exception); cancel
+            # its followers too rather than leave them waiting forever
+            if not future.done():
+                future.cancel()
+            del self._calls[key]
+
+
+class ShardedLocks:
+    """
+    Fixed set of locks shared out by key hash
+
+    Work on one key is serialized while different keys rarely contend,
+    without keeping a lock per key.
+    """
+
+    def __init__(self, shards):
+        """
+        Args:
+            shards (int): Number of locks
+        """
+        self._locks = [threading.Lock() for _ in range(max(1, shards))]
+
+    def _index(self, key):
+        """Shard of a key"""
+        return hash(key) % len(self._locks)
+
+    def lock_for(self, key):
+        """Get the lock guarding key"""
+        return self._locks[self._index(key)]
+
+    def locks_for(self, keys):
+        """
+        Get the distinct locks guarding several keys
+
+        Returns:
+            list: Locks in a fixed order, so acquiring them in turn cannot deadlock
+        """
+        return [self._locks[index] for index in sorted({self._index(key) for key in keys})]
+
+    @contextmanager
+    def hold(self, key):
+        """Hold the lock guarding key"""
+        with self.lock_for(key):
+            yield
+
+
+class FileLocks:
+    """
+    Exclusive locks per key, shared by every process on the host
+
+    Each key maps to a lock file under one directory, held with flock(2). The
+    lock belongs to the open file, so two threads of one process exclude each
+    other just like two workers do, and a crashed holder releases it on exit.
+    A held lock is waited for with a blocking flock on a thread of the
+    'file-locks' pool; when the caller gives up, that thread releases the lock
+    as soon as it gets it. Lock files are left in place: removing one could let
+    a waiter lock a file that a later caller no longer opens.
+    """
+
+    def __init__(self, directory, max_waiters=64):
+        """
+        Args:
+            directory (str): Directory holding the lock files
+            max_waiters (int): Threads blocking on held locks, per process
+        """
+        self.directory = directory
+        self.max_waiters = max_waiters
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        """Lock file of a key"""
+        digest = hashlib.sha256(str(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.lock")
+
+    def _lock(self, key, blocking=False):
+        """Open and lock the key's file; without blocking, return None if someone else holds it"""
+        lock_file = open(self._path(key), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        except BaseException:
+            lock_file.close()
+            raise
+        return _FileLock(lock_file)
+
+    def _wait(self, key):
+        """Start a blocking wait for the lock of key on the waiter pool"""
+        return get_executor('file-locks', self.max_waiters).submit(self._lock, key, True)
+
+    @staticmethod
+    def _abandon(future):
+        """Give up a wait, releasing the lock if the waiter gets it anyway"""
+        if future.cancel():
+            return
+
+        def release(done):
+            if done.exception() is None:
+                done.result().release()
+
+        future.add_done_callback(release)
+
+    def acquire(self, key, timeout):
+        """
+        Wait for the lock of key
+
+        Args:
+            key: Lock key
+            timeout (float): Longest wait in seconds
+
+        Returns:
+            A held lock (call release() on it), or None if the wait timed out
+        """
+        lock = self._lock(key)
+        if lock is not None:
+            return lock
+
+        future = self._wait(key)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            self._abandon(future)
+            return None
+
+    async def acquire_async(self, key, timeout):
+        """Async variant of acquire"""
+        lock = self._lock(key)
+        if lock is not None:
+            return lock
+
+        future = self._wait(key)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            self._abandon(future)
+            return None
+        except asyncio.CancelledError:
+            self._abandon(future)
+            raise
+
+
+class _FileLock:
+    """A lock held by FileLocks"""
+
+    def __init__(self, lock_file):
+        self._file = lock_file
+
+    def release(self):
+        """Release the lock (closing the file drops the flock)"""
+        self._file.close()
+
+
+_http_session = None
+
+
+def get_http_session():
+    """
+    Get the shared aiohttp session for the running event loop
+
+    Must be called from a coroutine; the session is created on first use.
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        import aiohttp
+
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=Config.ASYNC_HTTP_POOL_SIZE)
+        )
+    return _http_session
+
+
+async def close_http_session():
+    """Close the shared aiohttp session"""
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
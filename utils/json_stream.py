@@ -0,0 +1,213 @@
+import json
+import re
+
+# A comma directly before a closing bracket, outside strings
+TRAILING_COMMA_PATTERN = re.compile(r',(\s*[}\]])')
+
+
+class StreamingJsonObjectParser:
+    """
+    Incremental parser for a JSON object arriving in arbitrary text chunks
+
+    Only the top level of the object is tracked. Each call to feed() returns
+    events for whatever became available in that chunk:
+
+    - ('chunk', key, text): newly decoded characters of a top-level string value
+    - ('value', key, value): a top-level value that has been fully received
+
+    Text before the opening brace (such as a ```json fence) and after the
+    closing brace is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+        # expect: key, key_string, colon, value, in_value or comma
+        self.expect = 'key'
+        self.current_key = None
+        self.key_start = None
+        self.value_start = None
+        self.value_kind = None
+        self.string_emitted = None
+
+    def feed(self, text):
+        """
+        Consume the next chunk of text
+
+        Args:
+            text (str): Next chunk of the JSON document
+
+        Returns:
+            list: Events made available by this chunk
+        """
+        self.buffer += text
+        events = []
+
+        while self.position < len(self.buffer) and not self.finished:
+            index = self.position
+            char = self.buffer[index]
+            self.position += 1
+
+            if not self.started:
+                if char == '{':
+                    self.started = True
+                    self.depth = 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.expect == 'key_string':
+                        self.current_key = json.loads(self.buffer[self.key_start:index + 1])
+                        self.expect = 'colon'
+                    elif self.depth == 1 and self.value_kind == 'string':
+                        events.extend(self._flush_string(index, final=True))
+                        events.append(self._complete_value(index + 1))
+                continue
+
+            if char == '"':
+                self.in_string = True
+                if self.depth == 1 and self.expect == 'key':
+                    self.key_start = index
+                    self.expect = 'key_string'
+                elif self.depth == 1 and self.expect == 'value':
+                    self._start_value(index, 'string')
+                    self.string_emitted = index + 1
+            elif char in '{[':
+                if self.depth == 1 and self.expect == 'value':
+                    self._start_value(index, 'container')
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    if self.expect == 'in_value' and self.value_kind == 'scalar':
+                        events.append(self._complete_value(index))
+                    self.finished = True
+                elif self.depth == 1 and self.expect == 'in_value' and self.value_kind == 'container':
+                    events.append(self._complete_value(index + 1))
+            elif self.depth == 1:
+                if char == ':' and self.expect == 'colon':
+                    self.expect = 'value'
+                elif char == ',':
+                    if self.expect == 'in_value' and self.value_kind == 'scalar':
+                        events.append(self._complete_value(index))
+                    self.expect = 'key'
+                elif not char.isspace() and self.expect == 'value':
+                    # Numbers, true, false and null
+                    self._start_value(index, 'scalar')
+
+        if self.in_string and self.depth == 1 and self.value_kind == 'string' and self.expect == 'in_value':
+            events.extend(self._flush_string(len(self.buffer), final=False))
+
+        return events
+
+    def _start_value(self, index, kind):
+        """Remember where the current top-level value begins"""
+        self.value_start = index
+        self.value_kind = kind
+        self.expect = 'in_value'
+
+    def _complete_value(self, end):
+        """Decode the current top-level value ending at buffer index end"""
+        value = json.loads(self.buffer[self.value_start:end])
+        self.expect = 'comma'
+        self.value_kind = None
+        return ('value', self.current_key, value)
+
+    def _flush_string(self, end, final):
+        """Emit the decodable part of a string value received so far"""
+        raw = self.buffer[self.string_emitted:end]
+
+        # Stop before an escape sequence that has not fully arrived yet
+        safe = 0
+        index = 0
+        while index < len(raw):
+            if raw[index] == '\\':
+                length = 6 if index + 1 < len(raw) and raw[index + 1] == 'u' else 2
+                if index + length > len(raw):
+                    break
+                index += length
+            else:
+                index += 1
+            safe = index
+
+        # Keep a high surrogate back until its pair arrives
+        if not final and safe >= 6 and raw[safe - 6:safe - 2].lower() in ('\\ud8', '\\ud9', '\\uda', '\\udb'):
+            safe -= 6
+
+        if safe == 0:
+            return []
+
+        text = json.loads('"' + raw[:safe] + '"')
+        self.string_emitted += safe
+        return [('chunk', self.current_key, text)]
+
+
+def _strip_trailing_commas(text):
+    """Remove trailing commas before } or ] while leaving string contents alone"""
+    pieces = []
+    start = 0
+    in_string = False
+    escape = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+                pieces.append(text[start:index + 1])
+                start = index + 1
+        elif char == '"':
+            pieces.append(TRAILING_COMMA_PATTERN.sub(r'\1', text[start:index]))
+            start = index
+            in_string = True
+    pieces.append(text[start:] if in_string else TRAILING_COMMA_PATTERN.sub(r'\1', text[start:]))
+    return "".join(pieces)
+
+
+def loads_tolerant(text):
+    """
+    Parse the first JSON object in model output, repairing common defects
+
+    Handles a surrounding markdown fence or prose, text after the object and
+    trailing commas.
+
+    Args:
+        text (str): Model output expected to contain one JSON object
+
+    Returns:
+        tuple: (parsed object, whether any repair was needed)
+
+    Raises:
+        ValueError: If no JSON object can be recovered
+    """
+    stripped = text.strip()
+    try:
+        return json.loads(stripped), False
+    except ValueError:
+        pass
+
+    start = stripped.find('{')
+    if start < 0:
+        raise ValueError("No JSON object in response")
+
+    decoder = json.JSONDecoder()
+    for candidate in (stripped, _strip_trailing_commas(stripped)):
+        try:
+            value, _ = decoder.raw_decode(candidate, candidate.find('{'))
+            return value, True
+        except ValueError as e:
+            error = e
+    raise error
@@ -0,0 +1,278 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format
+
+Hot paths record how long each stage takes (prompt build, model call, TTS,
+history I/O, speech recognition, Sapling...) with timed() or observe_stage().
+Services also register their existing stats() counters with register_stats(),
+so GET /metrics exposes both without an external client library. When
+Config.METRICS_ENABLED is off, recording is a single flag check.
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Stage timings of the request being served, for the Server-Timing header
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _format_labels(names, values, extra=None):
+    """Render a label set, e.g. {stage="tts"}"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    rendered = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + rendered + '}'
+
+
+def _format_value(value):
+    """Render a sample value"""
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, value=1):
+        """Add value to the series for label_values"""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def samples(self):
+        """Yield (name, labels, value) for every series"""
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+
+class Histogram:
+    """Histogram with fixed buckets and optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Record one observation"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        """Yield (name, labels, value) for every bucket, sum and count"""
+        with self._lock:
+            snapshot = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+
+        for label_values, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = ('le', '+Inf' if math.isinf(bound) else repr(float(bound)))
+                yield f"{self.name}_bucket", _format_labels(self.label_names, label_values, le), cumulative
+            labels = _format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+_metrics = []
+_stats_sources = []
+_registry_lock = threading.Lock()
+
+
+def counter(name, help_text, label_names=()):
+    """Create and register a Counter"""
+    metric = Counter(name, help_text, label_names)
+    with _registry_lock:
+        _metrics.append(metric)
+    return metric
+
+
+def histogram(name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+    """Create and register a Histogram"""
+    metric = Histogram(name, help_text, label_names, buckets)
+    with _registry_lock:
+        _metrics.append(metric)
+    return metric
+
+
+def register_stats(prefix, stats, counters=(), label=None):
+    """
+    Expose a service's stats() dict at /metrics
+
+    Every numeric entry becomes jfix_<prefix>_<key>: a counter (with a _total
+    suffix) if the key is listed in counters, a gauge otherwise.
+
+    Args:
+        prefix (str): Metric name prefix, e.g. 'audio_cache'
+        stats (callable): Returns the stats dict; called on every scrape
+        counters (tuple): Keys that only ever increase
+        label (str): If set, stats returns {label value: stats dict} and the
+            outer keys become this label
+    """
+    with _registry_lock:
+        _stats_sources.append((prefix, stats, frozenset(counters), label))
+
+
+def _render_stats(prefix, stats, counters, label):
+    """Render one registered stats source"""
+    try:
+        data = stats()
+    except Exception as e:
+        print(f"Error collecting {prefix} metrics: {e}")
+        return []
+
+    series = data.items() if label else [(None, data)]
+    families = {}
+    for label_value, values in series:
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            labels = _format_labels((label,), (label_value,)) if label else ''
+            families.setdefault(key, []).append((labels, value))
+
+    lines = []
+    for key, samples in sorted(families.items()):
+        is_counter = key in counters
+        name = f"jfix_{prefix}_{key}" + ('_total' if is_counter else '')
+        lines.append(f"# TYPE {name} {'counter' if is_counter else 'gauge'}")
+        lines.extend(f"{name}{labels} {_format_value(value)}" for labels, value in samples)
+    return lines
+
+
+def render():
+    """
+    Render every registered metric
+
+    Returns:
+        str: Prometheus text exposition format (version 0.0.4)
+    """
+    with _registry_lock:
+        metrics = list(_metrics)
+        sources = list(_stats_sources)
+
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+    for source in sources:
+        lines.extend(_render_stats(*source))
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = histogram(
+    'jfix_stage_duration_seconds', 'Time spent in each processing stage', ('stage',)
+)
+HTTP_REQUESTS = counter(
+    'jfix_http_requests_total', 'HTTP requests served', ('method', 'route', 'status')
+)
+HTTP_REQUEST_SECONDS = histogram(
+    'jfix_http_request_duration_seconds', 'Time until the response headers are ready', ('method', 'route')
+)
+
+
+def observe_stage(stage, seconds):
+    """
+    Record the duration of one stage
+
+    Args:
+        stage (str): Stage name, e.g. 'tts'
+        seconds (float): Time spent
+    """
+    if not Config.METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as one stage (failures are timed too)"""
+    if not Config.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def observe_request(method, route, status, seconds):
+    """Record one served HTTP request"""
+    if not Config.METRICS_ENABLED:
+        return
+    HTTP_REQUESTS.inc(method, route, str(status))
+    HTTP_REQUEST_SECONDS.observe(seconds, method, route)
+
+
+def start_request_timing():
+    """Start collecting stage timings for the request served in the current context"""
+    _request_timings.set([])
+
+
+def end_request_timing():
+    """Stop collecting stage timings in the current context"""
+    _request_timings.set(None)
+
+
+def server_timing_header(total_seconds=None):
+    """
+    Format the current request's stage timings as a Server-Timing header
+
+    Repeated stages are summed and listed in the order they first finished.
+
+    Args:
+        total_seconds (float): Whole request duration, added as "total"
+
+    Returns:
+        str: Header value, or None if nothing was timed
+    """
+    timings = _request_timings.get()
+    totals = {}
+    for stage, seconds in timings or ():
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    if total_seconds is not None:
+        totals['total'] = total_seconds
+    if not totals:
+        return None
+    return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
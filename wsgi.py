@@ -0,0 +1,13 @@
+"""
+WSGI entry point for production serving
+
+    gunicorn -c gunicorn.conf.py
+
+With preload_app enabled, gunicorn imports this module once in the master
+process. The services import their heavy dependencies on first use; the
+on_starting hook in gunicorn.conf.py imports them in the master as well so
+forked workers share them.
+"""
+from app import create_app
+
+app = create_app()